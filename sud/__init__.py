@@ -1,16 +1,22 @@
 import os
-from importlib.metadata import PackageNotFoundError, version
-from subprocess import check_output
+from functools import cache
 
-try:
-    VERSION = version("sud")
-except PackageNotFoundError:
-    VERSION = "unknown"
+
+@cache
+def get_package_version():
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("sud")
+    except PackageNotFoundError:
+        return "unknown"
 
 
 def _get_git_revision(path):
     if not os.path.exists(os.path.join(path, ".git")):
         return None
+    from subprocess import check_output
+
     try:
         revision = check_output(
             ["git", "rev-parse", "HEAD"],
@@ -22,7 +28,10 @@ def _get_git_revision(path):
     return revision.strip().decode("utf-8")
 
 
+@cache
 def get_revision():
+    # Resolved on first use rather than at import time: spawning git costs
+    # more than the rest of the startup of short-lived runs.
     package_dir = os.path.dirname(__file__)
     checkout_dir = os.path.normpath(os.path.join(package_dir, os.pardir, os.pardir))
     path = os.path.join(checkout_dir)
@@ -32,14 +41,19 @@ def get_revision():
 
 
 def get_version():
-    if __build__:
-        return f"{__version__}.{__build__}"
-    return __version__
-
-
-__version__ = VERSION
-__build__ = get_revision()
-
-__semantic_version__ = (
-    __version__ if __build__ is None else f"{__version__}+{__build__}"
-)
+    build = get_revision()
+    if build:
+        return f"{get_package_version()}.{build}"
+    return get_package_version()
+
+
+def __getattr__(name):
+    if name == "__version__":
+        return get_package_version()
+    if name == "__build__":
+        return get_revision()
+    if name == "__semantic_version__":
+        build = get_revision()
+        version = get_package_version()
+        return version if build is None else f"{version}+{build}"
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,254 @@
+import asyncio
+import base64
+import ipaddress
+import resource
+import time
+from dataclasses import dataclass
+
+from sud.config import Config
+from sud.fake import FakeScalewayAPI
+from sud.gateway import UPDATE_PATH, UpdateGateway
+from sud.tracing import percentile
+from sud.updater import Updater
+
+DEFAULT_HOSTS = (1, 100, 10000)
+HOSTS_PER_ZONE = 100
+BENCH_SECRET = "bench-secret"
+BENCH_USER = ("bench", "bench-password")
+DEFAULT_CLIENTS = 1000
+
+
+@dataclass
+class BenchResult:
+    hosts: int
+    zones: int
+    cycles: int
+    cycles_per_second: float
+    p50_cycle_seconds: float
+    p99_cycle_seconds: float
+    requests_per_cycle: float
+    cpu_seconds_per_host: float
+    rss_bytes_per_host: float
+    failed: int
+
+
+@dataclass
+class GatewayBenchResult:
+    clients: int
+    zones: int
+    rounds: int
+    requests_per_second: float
+    p50_request_seconds: float
+    p99_request_seconds: float
+    patches_per_round: float
+    failed: int
+
+
+def get_hostnames(hosts: int, zones: int) -> list[str]:
+    return [f"host{i}.zone{i % zones}.test" for i in range(hosts)]
+
+
+def get_max_rss() -> int:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def run_benchmark(
+    hosts: int,
+    zones: int | None = None,
+    cycles: int = 5,
+    latency: float = 0.0,
+    change: bool = True,
+) -> BenchResult:
+    """
+    Run `cycles` update cycles of `hosts` hostnames spread across `zones`
+    zones against a local fake of the Scaleway API.
+
+    A first, unmeasured cycle creates the records. Then, if `change` is
+    set, the public address changes before each cycle so that every
+    record is written. CPU and RSS include the in-process fake API, and
+    the RSS is the growth of the peak RSS of the process.
+    """
+    rss = get_max_rss()
+    zones = zones or max(1, hosts // HOSTS_PER_ZONE)
+    hostnames = get_hostnames(hosts, zones)
+    addresses = ipaddress.ip_network("198.18.0.0/15").hosts()
+    with FakeScalewayAPI(
+        address=str(next(addresses)),
+        api_secret=BENCH_SECRET,
+        latency=latency,
+    ) as api:
+        for zone in range(zones):
+            api.add_zone(f"zone{zone}.test")
+        config = Config(
+            None,
+            {
+                "hostnames": hostnames,
+                "api_secret": BENCH_SECRET,
+                "api_url": api.api_url,
+                "discovery": {"providers": [api.checkip_url]},
+            },
+        )
+        updater = Updater(config)
+        try:
+            await updater.update()
+            api.reset_stats()
+            cpu = time.process_time()
+            durations = []
+            failed = 0
+            start = time.perf_counter()
+            for _ in range(cycles):
+                if change:
+                    api.address = str(next(addresses))
+                cycle_start = time.perf_counter()
+                result = await updater.update()
+                durations.append(time.perf_counter() - cycle_start)
+                failed += len(result.failed)
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - cpu
+            rss = get_max_rss() - rss
+            requests = sum(api.requests.values())
+        finally:
+            updater.close()
+
+    durations.sort()
+    return BenchResult(
+        hosts=hosts,
+        zones=zones,
+        cycles=cycles,
+        cycles_per_second=cycles / elapsed,
+        p50_cycle_seconds=percentile(durations, 50),
+        p99_cycle_seconds=percentile(durations, 99),
+        requests_per_cycle=requests / cycles,
+        cpu_seconds_per_host=cpu / (hosts * cycles),
+        rss_bytes_per_host=rss / hosts,
+        failed=failed,
+    )
+
+
+def run_benchmarks(
+    hosts: list[int],
+    cycles: int = 5,
+    latency: float = 0.0,
+    change: bool = True,
+) -> list[BenchResult]:
+    return [
+        asyncio.run(run_benchmark(count, cycles=cycles, latency=latency, change=change))
+        # The peak RSS never decreases: run the smaller benchmarks first.
+        for count in sorted(hosts)
+    ]
+
+
+async def send_update(
+    host: str,
+    port: int,
+    hostname: str,
+    address: str,
+    authorization: str,
+) -> str:
+    """
+    Send a dyndns2 update like a router would and return the answer.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            (
+                f"GET {UPDATE_PATH}?hostname={hostname}&myip={address} HTTP/1.1\r\n"
+                f"Host: {host}:{port}\r\n"
+                f"Authorization: {authorization}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode(),
+        )
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return response.decode().partition("\r\n\r\n")[2].strip()
+
+
+async def run_gateway_benchmark(
+    clients: int,
+    zones: int | None = None,
+    rounds: int = 3,
+    concurrency: int = 256,
+    latency: float = 0.0,
+) -> GatewayBenchResult:
+    """
+    Load test the update gateway against a local fake of the Scaleway API:
+    in each round, every one of `clients` hostnames spread across `zones`
+    zones reports a new address, `concurrency` clients at a time.
+
+    A first, unmeasured round creates the records. An update that is not
+    answered with `good` counts as failed.
+    """
+    zones = zones or max(1, clients // HOSTS_PER_ZONE)
+    hostnames = get_hostnames(clients, zones)
+    addresses = ipaddress.ip_network("198.18.0.0/15").hosts()
+    authorization = "Basic " + base64.b64encode(":".join(BENCH_USER).encode()).decode()
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: list[float] = []
+
+    with FakeScalewayAPI(api_secret=BENCH_SECRET, latency=latency) as api:
+        for zone in range(zones):
+            api.add_zone(f"zone{zone}.test")
+        config = Config(
+            None,
+            {
+                "hostnames": hostnames,
+                "api_secret": BENCH_SECRET,
+                "api_url": api.api_url,
+                "serve": {
+                    "host": "127.0.0.1",
+                    "port": 0,
+                    "users": {BENCH_USER[0]: {"password": BENCH_USER[1]}},
+                },
+            },
+        )
+        updater = Updater(config)
+        gateway = UpdateGateway(updater, config)
+        await gateway.start()
+
+        async def update(hostname: str, address: str) -> bool:
+            async with semaphore:
+                start = time.perf_counter()
+                answer = await send_update(
+                    gateway.host,
+                    gateway.port,
+                    hostname,
+                    address,
+                    authorization,
+                )
+                durations.append(time.perf_counter() - start)
+            return answer == f"good {address}"
+
+        async def run_round() -> int:
+            answers = await asyncio.gather(
+                *(update(hostname, str(next(addresses))) for hostname in hostnames),
+            )
+            return answers.count(False)
+
+        try:
+            await run_round()
+            durations.clear()
+            api.reset_stats()
+            failed = 0
+            start = time.perf_counter()
+            for _ in range(rounds):
+                failed += await run_round()
+            elapsed = time.perf_counter() - start
+            patches = api.requests["PATCH"]
+        finally:
+            await gateway.stop()
+            updater.close()
+
+    durations.sort()
+    return GatewayBenchResult(
+        clients=clients,
+        zones=zones,
+        rounds=rounds,
+        requests_per_second=clients * rounds / elapsed,
+        p50_request_seconds=percentile(durations, 50),
+        p99_request_seconds=percentile(durations, 99),
+        patches_per_round=patches / rounds,
+        failed=failed,
+    )
@@ -1,21 +1,38 @@
+import json
 import logging
+from dataclasses import asdict
 from datetime import timedelta
 from pathlib import Path
-from typing import Annotated, Optional, Tuple
+from typing import Annotated, List, Optional, Tuple
 
 import typer
 from rich import print
+from rich.console import Console
 from rich.logging import RichHandler
+from rich.table import Table
 
 from sud import get_version
 from sud.config import Config, TelegramConfig
+from sud.exceptions import SudException
 from sud.prompt import APISecretPrompt, HostnamePrompt
-from sud.updater import Updater
+from sud.tracing import summarize
 
 app = typer.Typer(
     add_completion=False,
     rich_markup_mode="rich",
 )
+trace_app = typer.Typer(help="Inspect trace files.")
+app.add_typer(trace_app, name="trace")
+
+# Heavy modules (sud.updater pulls in requests and python-telegram-bot) are
+# imported by the commands that need them to keep the startup fast.
+
+# Exit codes of the sync command by result, 2 is used by click for usage
+# errors and 1 for any other error.
+SYNC_EXIT_CODES = {"unchanged": 0, "failed": 1, "updated": 3, "partial": 4}
+
+# Commands that don't need an existing configuration file.
+NO_CONFIG_COMMANDS = ("init", "trace", "bench", "bench-gateway")
 
 
 def version_callback(value: bool):
@@ -33,13 +50,13 @@ def validate_frequency_callback(value: int):
 @app.command()
 def init(
     ctx: typer.Context,
-    hostname: Annotated[
-        Optional[str],
+    hostnames: Annotated[
+        Optional[List[str]],
         typer.Option(
             "--hostname",
             "-H",
             show_default=False,
-            help="Hostname that must be created/updated.",
+            help="Hostname that must be created/updated (can be repeated).",
         ),
     ] = None,
     api_secret: Annotated[
@@ -71,10 +88,12 @@ def init(
     ] = (None, None),
 ):
     """Generate a SUD configuration file."""
-    if not hostname:
-        hostname = HostnamePrompt.ask(
-            "Enter the hostname that must be created or update",
-        )
+    if not hostnames:
+        hostnames = [
+            HostnamePrompt.ask(
+                "Enter the hostname that must be created or update",
+            ),
+        ]
 
     if not api_secret:
         api_secret = APISecretPrompt.ask(
@@ -83,7 +102,10 @@ def init(
         )
 
     config: Config = ctx.obj
-    config.hostname = hostname
+    if len(hostnames) == 1:
+        config.hostname = hostnames[0]
+    else:
+        config.hostnames = hostnames
     config.api_secret = api_secret
     config.frequency = timedelta(seconds=frequency)
     if telegram != (None, None):
@@ -104,10 +126,185 @@ DNS Updater."""
         datefmt="[%X]",
         handlers=[RichHandler()],
     )
+    from sud.updater import Updater
+
     updater = Updater(ctx.obj)
     updater.run()
 
 
+@app.command()
+def sync(
+    ctx: typer.Context,
+    reconcile: Annotated[
+        bool,
+        typer.Option(
+            "--reconcile",
+            help="Read the records from the API even if known from the state.",
+        ),
+    ] = False,
+):
+    """Check and update all the hostnames once, then exit.
+
+    A JSON summary is printed to the standard output. The exit code is 0
+    if nothing changed, 3 if records were updated, 4 if some hostnames
+    failed and 1 if all of them failed."""
+    from sud.updater import Updater
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        datefmt="[%X]",
+        handlers=[RichHandler(console=Console(stderr=True))],
+    )
+    result = Updater(ctx.obj).sync(reconcile=reconcile)
+    typer.echo(json.dumps(result.to_dict()))
+    raise typer.Exit(SYNC_EXIT_CODES[result.status])
+
+
+@app.command()
+def serve(ctx: typer.Context):
+    """Serve a dyndns2 compatible gateway (`/nic/update`) that updates the \
+records of the configured users."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        datefmt="[%X]",
+        handlers=[RichHandler()],
+    )
+    from sud.gateway import serve
+
+    serve(ctx.obj)
+
+
+@trace_app.command("summarize")
+def summarize_trace(
+    trace_file: Annotated[
+        Path,
+        typer.Argument(help="Trace file written with `tracing.path`."),
+    ],
+):
+    """Summarize the spans of a trace file by phase."""
+    try:
+        with open(trace_file) as f:
+            stats = summarize(f)
+    except OSError as e:
+        raise SudException(f"Cannot read the trace file: {e}") from e
+
+    table = Table("Phase", "Count", "p50", "p95", "p99", "Max", "Errors")
+    for name, item in stats.items():
+        table.add_row(
+            name,
+            str(item.count),
+            *(
+                f"{value * 1000:.1f} ms"
+                for value in (item.p50, item.p95, item.p99, item.max)
+            ),
+            str(item.errors),
+        )
+    print(table)
+
+
+@app.command()
+def bench(
+    hosts: Annotated[
+        Optional[List[int]],
+        typer.Option(
+            "--hosts",
+            "-n",
+            show_default=False,
+            help="Number of hostnames (can be repeated, default: 1, 100, 10000).",
+        ),
+    ] = None,
+    cycles: Annotated[
+        int,
+        typer.Option("--cycles", min=1, help="Measured cycles per benchmark."),
+    ] = 5,
+    latency: Annotated[
+        float,
+        typer.Option("--latency", min=0, help="Latency of the fake API (seconds)."),
+    ] = 0.0,
+    change: Annotated[
+        bool,
+        typer.Option(
+            "--change/--no-change",
+            help="Change the public address before each cycle.",
+        ),
+    ] = True,
+    output: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--output",
+            "-o",
+            help="Write the results to a file instead of the standard output.",
+        ),
+    ] = None,
+):
+    """Benchmark update cycles against a local fake of the Scaleway API."""
+    from sud.bench import DEFAULT_HOSTS, run_benchmarks
+
+    results = run_benchmarks(
+        hosts or list(DEFAULT_HOSTS),
+        cycles=cycles,
+        latency=latency,
+        change=change,
+    )
+    write_report(results, output)
+
+
+@app.command("bench-gateway")
+def bench_gateway(
+    clients: Annotated[
+        int,
+        typer.Option("--clients", "-n", min=1, help="Number of dyndns2 clients."),
+    ] = 1000,
+    rounds: Annotated[
+        int,
+        typer.Option("--rounds", min=1, help="Measured rounds of updates."),
+    ] = 3,
+    concurrency: Annotated[
+        int,
+        typer.Option("--concurrency", min=1, help="Clients updating at a time."),
+    ] = 256,
+    latency: Annotated[
+        float,
+        typer.Option("--latency", min=0, help="Latency of the fake API (seconds)."),
+    ] = 0.0,
+    output: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--output",
+            "-o",
+            help="Write the results to a file instead of the standard output.",
+        ),
+    ] = None,
+):
+    """Load test the dyndns2 gateway against a local fake of the Scaleway API."""
+    import asyncio
+
+    from sud.bench import run_gateway_benchmark
+
+    result = asyncio.run(
+        run_gateway_benchmark(
+            clients,
+            rounds=rounds,
+            concurrency=concurrency,
+            latency=latency,
+        ),
+    )
+    write_report([result], output)
+
+
+def write_report(results: list, output: Optional[Path]) -> None:
+    report = json.dumps([asdict(result) for result in results], indent=2)
+    if output is None:
+        typer.echo(report)
+        return
+    try:
+        output.write_text(report + "\n")
+    except OSError as e:
+        raise SudException(f"Cannot write the benchmark results: {e}") from e
+
+
 @app.callback()
 def main(
     ctx: typer.Context,
@@ -129,10 +326,10 @@ def main(
     Scaleway DNS service.
     It periodically (default: 300 seconds) check for the IP public IP
     address from through the utility goes to internet
-    and create or update a [cyan]Host (A)[/] record in the DNS zone of the
-    specified domain name.
+    and create or update the [cyan]Host (A)[/] records of the configured
+    hostnames, sending a single batch of changes for each DNS zone.
     """
     config = Config(config_file)
     ctx.obj = config
-    if ctx.invoked_subcommand != "init":
+    if ctx.invoked_subcommand not in NO_CONFIG_COMMANDS:
         config.load()
@@ -1,10 +1,17 @@
+import ipaddress
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from datetime import timedelta
 
 import yaml
 
+from sud.constants import (
+    CHECK_IP_ADDRESS,
+    CHECK_IPV6_ADDRESS,
+    SCALEWAY_API_BASE_URL,
+)
 from sud.exceptions import SudException
+from sud.prefix import parse_suffix
 
 
 @dataclass
@@ -13,12 +20,83 @@ class TelegramConfig:
     token: str
 
 
+@dataclass
+class DiscoveryConfig:
+    strategy: str = "first"
+    quorum: int = 2
+    providers: list[dict] = field(
+        default_factory=lambda: [{"type": "http", "url": CHECK_IP_ADDRESS}],
+    )
+
+
+@dataclass
+class WatchConfig:
+    enabled: bool = False
+    debounce: float = 2.0
+
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9877
+
+
+@dataclass
+class TracingConfig:
+    enabled: bool = False
+    path: str | None = None
+    exporter: str | None = None
+
+
+@dataclass
+class GatewayUser:
+    password: str
+    hostnames: list[str] | None = None
+
+
+@dataclass
+class ServeConfig:
+    host: str = "0.0.0.0"
+    port: int = 8245
+    users: dict[str, GatewayUser] = field(default_factory=dict)
+
+
+@dataclass
+class ScheduleConfig:
+    jitter: float = 0.1
+    max_backoff: timedelta = timedelta(hours=1)
+    boost_frequency: timedelta = timedelta(minutes=1)
+    boost_duration: timedelta = timedelta(minutes=30)
+
+
+@dataclass
+class TimeoutConfig:
+    cycle: float = 120.0
+    discovery: float = 20.0
+    lookup: float = 30.0
+    write: float = 30.0
+    notify: float = 10.0
+    connect: float = 5.0
+    read: float = 30.0
+
+
 class Config:
     DEFAULT_FREQUENCY = 300
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_RETRIES = 3
+    DEFAULT_RECONCILE_FREQUENCY = 3600
+    DEFAULT_ZONES_TTL = 3600
+    DEFAULT_CONCURRENCY = 10
+    DEFAULT_WRITE_CONCURRENCY = 4
+    DEFAULT_NOTIFICATION_WINDOW = 5.0
+    NOTIFIER_TYPES = ("telegram", "webhook", "smtp", "file", "syslog")
+    RECORD_TYPES = ("A", "AAAA")
+    DEFAULT_IPV6_PREFIX_LENGTH = 64
 
-    def __init__(self, config_file):
+    def __init__(self, config_file, data: dict | None = None):
         self._config_file = config_file
-        self._config = {}
+        self._config = data or {}
 
     @property
     def hostname(self) -> str:
@@ -28,6 +106,17 @@ class Config:
     def hostname(self, value: str) -> None:
         self._config["hostname"] = value
 
+    @property
+    def hostnames(self) -> list[str]:
+        return [
+            hostname["name"] if isinstance(hostname, dict) else hostname
+            for hostname in self._get_hostname_entries()
+        ]
+
+    @hostnames.setter
+    def hostnames(self, value: list[str]) -> None:
+        self._config["hostnames"] = list(value)
+
     @property
     def frequency(self) -> timedelta:
         return timedelta(
@@ -38,6 +127,255 @@ class Config:
     def frequency(self, value: timedelta) -> None:
         self._config["frequency"] = value.seconds
 
+    @property
+    def host_frequencies(self) -> dict[str, timedelta]:
+        """
+        Check frequency of each hostname, entries of `hostnames` can
+        override the global frequency.
+        """
+        frequencies = {}
+        for hostname in self._get_hostname_entries():
+            if isinstance(hostname, dict):
+                frequencies[hostname["name"]] = timedelta(
+                    seconds=int(hostname.get("frequency", self.frequency.seconds)),
+                )
+            else:
+                frequencies[hostname] = self.frequency
+        return frequencies
+
+    @property
+    def record_types(self) -> list[str]:
+        return self._get_record_types(self._config.get("record_types", ["A"]))
+
+    @property
+    def host_record_types(self) -> dict[str, list[str]]:
+        """
+        Record types kept up to date for each hostname: A for IPv4, AAAA
+        for IPv6 or both. Entries of `hostnames` can override the global
+        `record_types`.
+        """
+        record_types = {}
+        for hostname in self._get_hostname_entries():
+            if isinstance(hostname, dict):
+                record_types[hostname["name"]] = self._get_record_types(
+                    hostname.get("record_types", self.record_types),
+                )
+            else:
+                record_types[hostname] = self.record_types
+        return record_types
+
+    def _get_hostname_entries(self) -> list[str | dict]:
+        # A gateway-only configuration may list the hostnames of its users
+        # only.
+        if self._config.get("hostnames"):
+            return self._config["hostnames"]
+        if self._config.get("hostname"):
+            return [self._config["hostname"]]
+        return []
+
+    @classmethod
+    def _get_record_types(cls, value: str | list[str]) -> list[str]:
+        record_types = [value] if isinstance(value, str) else list(value)
+        for record_type in record_types:
+            if record_type not in cls.RECORD_TYPES:
+                raise SudException(f"Invalid record type: {record_type}")
+        if not record_types:
+            raise SudException("At least one record type is required")
+        return record_types
+
+    @property
+    def ipv6_prefix_length(self) -> int:
+        value = int(
+            self._config.get("ipv6_prefix_length", Config.DEFAULT_IPV6_PREFIX_LENGTH),
+        )
+        if not 0 < value < 128:
+            raise SudException(f"Invalid IPv6 prefix length: {value}")
+        return value
+
+    @property
+    def host_ipv6_suffixes(self) -> dict[str, ipaddress.IPv6Address]:
+        """
+        Interface identifiers of the hostnames whose AAAA record is the
+        delegated prefix followed by their `ipv6_suffix`.
+        """
+        prefix_length = self.ipv6_prefix_length
+        return {
+            hostname["name"]: parse_suffix(hostname["ipv6_suffix"], prefix_length)
+            for hostname in self._config.get("hostnames") or []
+            if isinstance(hostname, dict) and hostname.get("ipv6_suffix")
+        }
+
+    @property
+    def schedule(self) -> ScheduleConfig:
+        schedule = self._config.get("schedule", {})
+        default = ScheduleConfig()
+        return ScheduleConfig(
+            jitter=float(schedule.get("jitter", default.jitter)),
+            max_backoff=timedelta(
+                seconds=int(
+                    schedule.get(
+                        "max_backoff",
+                        default.max_backoff.total_seconds(),
+                    ),
+                ),
+            ),
+            boost_frequency=timedelta(
+                seconds=int(
+                    schedule.get(
+                        "boost_frequency",
+                        default.boost_frequency.total_seconds(),
+                    ),
+                ),
+            ),
+            boost_duration=timedelta(
+                seconds=int(
+                    schedule.get(
+                        "boost_duration",
+                        default.boost_duration.total_seconds(),
+                    ),
+                ),
+            ),
+        )
+
+    @property
+    def reconcile_frequency(self) -> timedelta:
+        return timedelta(
+            seconds=int(
+                self._config.get(
+                    "reconcile_frequency",
+                    Config.DEFAULT_RECONCILE_FREQUENCY,
+                ),
+            ),
+        )
+
+    @property
+    def zones_ttl(self) -> timedelta:
+        return timedelta(
+            seconds=int(self._config.get("zones_ttl", Config.DEFAULT_ZONES_TTL)),
+        )
+
+    @property
+    def state_file(self) -> str | None:
+        return self._config.get("state_file")
+
+    @property
+    def discovery(self) -> DiscoveryConfig:
+        return self._get_discovery("discovery", DiscoveryConfig())
+
+    @property
+    def discovery6(self) -> DiscoveryConfig:
+        """
+        Discovery of the public IPv6 address, for the AAAA records.
+        """
+        return self._get_discovery(
+            "discovery6",
+            DiscoveryConfig(providers=[{"type": "http", "url": CHECK_IPV6_ADDRESS}]),
+        )
+
+    def _get_discovery(self, key: str, config: DiscoveryConfig) -> DiscoveryConfig:
+        discovery = self._config.get(key)
+        if not discovery:
+            return config
+        config.strategy = discovery.get("strategy", "first")
+        config.quorum = int(discovery.get("quorum", 2))
+        if discovery.get("providers"):
+            config.providers = [
+                {"type": "http", "url": provider}
+                if isinstance(provider, str)
+                else provider
+                for provider in discovery["providers"]
+            ]
+        return config
+
+    @property
+    def watch(self) -> WatchConfig:
+        watch = self._config.get("watch", {})
+        return WatchConfig(
+            enabled=bool(watch.get("enabled", False)),
+            debounce=float(watch.get("debounce", 2.0)),
+        )
+
+    @property
+    def timeouts(self) -> TimeoutConfig:
+        timeouts = self._config.get("timeouts", {})
+        default = TimeoutConfig()
+        return TimeoutConfig(
+            **{
+                f.name: float(timeouts.get(f.name, getattr(default, f.name)))
+                for f in fields(TimeoutConfig)
+            },
+        )
+
+    @property
+    def metrics(self) -> MetricsConfig:
+        metrics = self._config.get("metrics", {})
+        default = MetricsConfig()
+        return MetricsConfig(
+            enabled=bool(metrics.get("enabled", default.enabled)),
+            host=metrics.get("host", default.host),
+            port=int(metrics.get("port", default.port)),
+        )
+
+    @property
+    def tracing(self) -> TracingConfig:
+        tracing = self._config.get("tracing", {})
+        return TracingConfig(
+            enabled=bool(tracing.get("enabled", False)),
+            path=tracing.get("path"),
+            exporter=tracing.get("exporter"),
+        )
+
+    @property
+    def serve(self) -> ServeConfig:
+        """
+        The dyndns2 update gateway: the users allowed to update records,
+        each limited to its `hostnames` or, by default, to the configured
+        hostnames.
+        """
+        serve = self._config.get("serve", {})
+        default = ServeConfig()
+        users = {}
+        for username, user in (serve.get("users") or {}).items():
+            if not user or not user.get("password"):
+                raise SudException(f"Gateway user {username} has no password")
+            hostnames = user.get("hostnames")
+            users[str(username)] = GatewayUser(
+                password=str(user["password"]),
+                hostnames=[hostnames] if isinstance(hostnames, str) else hostnames,
+            )
+        return ServeConfig(
+            host=serve.get("host", default.host),
+            port=int(serve.get("port", default.port)),
+            users=users,
+        )
+
+    @property
+    def concurrency(self) -> int:
+        return int(self._config.get("concurrency", Config.DEFAULT_CONCURRENCY))
+
+    @property
+    def write_concurrency(self) -> int:
+        value = int(
+            self._config.get("write_concurrency", Config.DEFAULT_WRITE_CONCURRENCY),
+        )
+        if value < 1:
+            raise SudException(f"Invalid write concurrency: {value}")
+        return value
+
+    @property
+    def pool_size(self) -> int:
+        return int(
+            self._config.get("http", {}).get("pool_size", Config.DEFAULT_POOL_SIZE)
+        )
+
+    @property
+    def retries(self) -> int:
+        return int(self._config.get("http", {}).get("retries", Config.DEFAULT_RETRIES))
+
+    @property
+    def api_url(self) -> str:
+        return self._config.get("api_url", SCALEWAY_API_BASE_URL)
+
     @property
     def api_secret(self) -> str:
         return self._config["api_secret"]
@@ -64,6 +402,28 @@ class Config:
             },
         }
 
+    @property
+    def notifiers(self) -> list[dict]:
+        """
+        Notification sinks, one for each of `telegram`, `webhook`, `smtp`,
+        `file` and `syslog` found in the `notifications` section.
+        """
+        notifications = self._config.get("notifications", {})
+        return [
+            {"type": notifier_type, **notifications[notifier_type]}
+            for notifier_type in Config.NOTIFIER_TYPES
+            if notifications.get(notifier_type)
+        ]
+
+    @property
+    def notification_window(self) -> float:
+        return float(
+            self._config.get("notifications", {}).get(
+                "window",
+                Config.DEFAULT_NOTIFICATION_WINDOW,
+            ),
+        )
+
     def load(self):
         try:
             with open(self._config_file) as f:
@@ -1,13 +1,33 @@
 CHECK_IP_ADDRESS = "https://checkip.amazonaws.com/"
+CHECK_IPV6_ADDRESS = "https://api6.ipify.org/"
+DNS_WHOAMI_SERVER = "208.67.222.222"
+DNS_WHOAMI_SERVER6 = "2620:119:35::35"
+DNS_WHOAMI_NAME = "myip.opendns.com"
 SCALEWAY_API_BASE_URL = "https://api.scaleway.com/domain/v2beta1/"
 TG_CREATED_MSG = """
-The DNS record (A) for <b><u>{name}</u></b> has been created:
+The DNS record ({type}) for <b><u>{name}</u></b> has been created:
 
 <span class="tg-spoiler"><b>{address}</b></span>
 """
 TG_UPDATED_MSG = """
-The DNS record (A) for <b><u>{name}</u></b> has been updated:
+The DNS record ({type}) for <b><u>{name}</u></b> has been updated:
 
 previous: <s>{previous}</s>
 current: <span class="tg-spoiler"><b>{address}</b></span>
 """
+TG_DIGEST_MSG = """
+{count} DNS records ({types}) have changed:
+
+{entries}
+"""
+TG_DIGEST_CREATED = (
+    '<b><u>{name}</u></b>: created <span class="tg-spoiler"><b>{address}</b></span>'
+)
+TG_DIGEST_UPDATED = (
+    "<b><u>{name}</u></b>: <s>{previous}</s> -> "
+    '<span class="tg-spoiler"><b>{address}</b></span>'
+)
+TG_DIGEST_FLAPPED = (
+    "<b><u>{name}</u></b>: changed {changes} times, back to "
+    '<span class="tg-spoiler"><b>{address}</b></span>'
+)
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TypeVar
+
+from sud.exceptions import DeadlineExceeded
+
+T = TypeVar("T")
+
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+def get_remaining() -> float | None:
+    """
+    Return the seconds left before the current deadline, None if there
+    is no deadline.
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[float]:
+    """
+    Set a deadline `seconds` from now for the enclosed code (and the tasks
+    it starts). A nested deadline never extends the enclosing one.
+    """
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _deadline.set(expires_at)
+    try:
+        yield expires_at
+    finally:
+        _deadline.reset(token)
+
+
+def get_timeout(connect: float, read: float) -> tuple[float, float]:
+    """
+    Return the (connect, read) timeouts of a request, shortened to fit
+    the current deadline.
+    """
+    remaining = get_remaining()
+    if remaining is None:
+        return connect, read
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded before sending the request")
+    return min(connect, remaining), min(read, remaining)
+
+
+async def run_phase(name: str, seconds: float, aw: Awaitable[T]) -> T:
+    """
+    Run `aw` within `seconds` and the current deadline, cancel it and raise
+    DeadlineExceeded if it takes longer.
+    """
+    with deadline(seconds) as expires_at:
+        try:
+            return await asyncio.wait_for(
+                aw,
+                max(0.0, expires_at - time.monotonic()),
+            )
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded(
+                f"The {name} phase exceeded its budget of {seconds:g}s",
+            ) from e
@@ -0,0 +1,365 @@
+import asyncio
+import ipaddress
+import logging
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import NoReturn
+
+import requests
+
+from sud import dns, natpmp
+from sud.config import DiscoveryConfig
+from sud.constants import DNS_WHOAMI_NAME, DNS_WHOAMI_SERVER, DNS_WHOAMI_SERVER6
+from sud.exceptions import SudException
+
+logger = logging.getLogger(__name__)
+
+RequestFunc = Callable[..., Awaitable[requests.Response]]
+
+ADDRESS_CLASSES = {4: ipaddress.IPv4Address, 6: ipaddress.IPv6Address}
+
+
+@dataclass
+class ProviderStats:
+    ALPHA = 0.3
+
+    requests: int = 0
+    errors: int = 0
+    latency: float | None = None
+    error_score: float = 0.0
+    last_query: float | None = None
+
+    def record(self, elapsed: float, error: bool = False) -> None:
+        self.last_query = time.monotonic()
+        self.requests += 1
+        self.errors += error
+        self.latency = (
+            elapsed
+            if self.latency is None
+            else self.ALPHA * elapsed + (1 - self.ALPHA) * self.latency
+        )
+        self.error_score = self.ALPHA * error + (1 - self.ALPHA) * self.error_score
+
+
+class DiscoveryProvider:
+    """
+    A source of the public address of IP `version` 4 or 6.
+    """
+
+    def __init__(self, name: str, version: int = 4):
+        self.name = name
+        self.version = version
+        self.stats = ProviderStats()
+
+    async def discover(self) -> str:
+        raise NotImplementedError
+
+    async def query(self) -> str:
+        start = time.monotonic()
+        try:
+            # IPv6 addresses are normalized to compare them with the records.
+            address = str(ADDRESS_CLASSES[self.version](await self.discover()))
+        except (ValueError, SudException) as e:
+            self.stats.record(time.monotonic() - start, error=True)
+            raise SudException(f"{self.name}: {e}") from e
+        self.stats.record(time.monotonic() - start)
+        return address
+
+
+class HTTPProvider(DiscoveryProvider):
+    def __init__(
+        self,
+        url: str,
+        request: RequestFunc,
+        name: str | None = None,
+        version: int = 4,
+    ):
+        super().__init__(name or url, version)
+        self.url = url
+        self._request = request
+
+    async def discover(self) -> str:
+        try:
+            resp = await self._request("GET", self.url)
+            resp.raise_for_status()
+            return resp.text.strip()
+        except requests.RequestException as e:
+            raise SudException(str(e)) from e
+
+
+class DNSProvider(DiscoveryProvider):
+    """
+    Discover the public ip address through a "whoami" DNS query to a
+    resolver that answers with the address of the client.
+    """
+
+    QTYPES = ("A", "AAAA", "TXT")
+
+    def __init__(
+        self,
+        server: str = DNS_WHOAMI_SERVER,
+        qname: str = DNS_WHOAMI_NAME,
+        qtype: str = "A",
+        port: int = 53,
+        timeout: float = 2.0,
+        retries: int = 2,
+        name: str | None = None,
+        version: int = 4,
+    ):
+        host = f"[{server}]" if ":" in server else server
+        super().__init__(name or f"dns://{host}:{port}/{qname}", version)
+        if qtype not in self.QTYPES:
+            raise SudException(f"Invalid DNS query type: {qtype}")
+        self.server = server
+        self.qname = qname
+        self.qtype = qtype
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+
+    async def discover(self) -> str:
+        answers = await dns.query(
+            self.server,
+            self.qname,
+            self.qtype,
+            port=self.port,
+            timeout=self.timeout,
+            retries=self.retries,
+        )
+        if not answers:
+            raise SudException(f"No {self.qtype} answer for {self.qname}")
+        return answers[0].strip()
+
+
+class NATPMPProvider(DiscoveryProvider):
+    """
+    Ask the gateway for its external address via NAT-PMP.
+    """
+
+    def __init__(
+        self,
+        gateway: str | None = None,
+        port: int = natpmp.NATPMP_PORT,
+        timeout: float = 0.25,
+        retries: int = 3,
+        name: str | None = None,
+    ):
+        super().__init__(name or f"natpmp://{gateway or 'default-gateway'}")
+        self.gateway = gateway
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+
+    async def discover(self) -> str:
+        gateway = self.gateway or natpmp.get_default_gateway()
+        if not gateway:
+            raise SudException("Cannot find the default gateway")
+        address = await natpmp.external_address(
+            gateway,
+            port=self.port,
+            timeout=self.timeout,
+            retries=self.retries,
+        )
+        # Behind another NAT (CGNAT) the gateway only knows a private address.
+        if not ipaddress.IPv4Address(address).is_global:
+            raise SudException(f"Gateway external address {address} is not public")
+        return address
+
+
+class AddressDiscoverer:
+    """
+    Query a set of providers concurrently for the public ip address.
+
+    With the `first` strategy the first valid answer wins, with the `quorum`
+    one an address must be returned by `quorum` providers. The `fallback`
+    strategy queries providers one at a time, in order, until one answers.
+    Slow or failing providers are demoted: they are queried only if the
+    others can't provide an answer, and probed in background every
+    `PROBE_INTERVAL` seconds so they can be promoted again.
+
+    Providers that lose a race are not cancelled: they complete in
+    background so that their real latency is measured.
+    """
+
+    STRATEGIES = ("first", "quorum", "fallback")
+    SLOW_FACTOR = 3
+    MAX_ERROR_SCORE = 0.5
+    PROBE_INTERVAL = 600
+
+    def __init__(
+        self,
+        providers: list[DiscoveryProvider],
+        strategy: str = "first",
+        quorum: int = 2,
+        version: int = 4,
+    ):
+        if not providers:
+            raise SudException("At least one discovery provider is required.")
+        if strategy not in self.STRATEGIES:
+            raise SudException(f"Invalid discovery strategy: {strategy}")
+        if strategy == "quorum" and not 0 < quorum <= len(providers):
+            raise SudException(
+                f"Invalid discovery quorum {quorum} "
+                f"for {len(providers)} provider(s).",
+            )
+        self.providers = providers
+        self.strategy = strategy
+        self.quorum = quorum
+        self.version = version
+        self._background: set[asyncio.Task] = set()
+
+    def is_demoted(self, provider: DiscoveryProvider) -> bool:
+        if provider.stats.error_score > self.MAX_ERROR_SCORE:
+            return True
+        # Failing providers often answer fastest, they don't set the pace.
+        latencies = [
+            p.stats.latency
+            for p in self.providers
+            if p.stats.latency is not None
+            and p.stats.error_score <= self.MAX_ERROR_SCORE
+        ]
+        if provider.stats.latency is None or not latencies:
+            return False
+        return provider.stats.latency > self.SLOW_FACTOR * min(latencies)
+
+    def rank(self) -> tuple[list[DiscoveryProvider], list[DiscoveryProvider]]:
+        preferred = [p for p in self.providers if not self.is_demoted(p)]
+        demoted = [p for p in self.providers if self.is_demoted(p)]
+        if not preferred:
+            return demoted, []
+        return preferred, demoted
+
+    def _run_in_background(self, tasks) -> None:
+        for task in tasks:
+            self._background.add(task)
+            task.add_done_callback(self._on_background_done)
+
+    def _on_background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.debug(f"Background discovery failed: {task.exception()}")
+
+    def _probe(self, demoted: list[DiscoveryProvider]) -> None:
+        now = time.monotonic()
+        self._run_in_background(
+            asyncio.create_task(p.query())
+            for p in demoted
+            if p.stats.last_query is None
+            or now - p.stats.last_query >= self.PROBE_INTERVAL
+        )
+
+    def close(self) -> None:
+        for task in self._background:
+            task.cancel()
+
+    async def discover(self) -> str:
+        preferred, demoted = self.rank()
+        self._probe(demoted)
+        if self.strategy == "fallback":
+            return await self._discover_sequential(preferred + demoted)
+
+        needed = 1 if self.strategy == "first" else self.quorum
+        votes: Counter[str] = Counter()
+        errors: dict[DiscoveryProvider, str] = {}
+        providers = {asyncio.create_task(p.query()): p for p in preferred}
+        pending = set(providers)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    exc = task.exception()
+                    if isinstance(exc, SudException):
+                        errors[providers[task]] = str(exc)
+                        continue
+                    if exc:
+                        raise exc
+                    address = task.result()
+                    votes[address] += 1
+                    if votes[address] >= needed:
+                        return address
+                if not pending and demoted:
+                    logger.info("Querying demoted discovery providers")
+                    tasks = {asyncio.create_task(p.query()): p for p in demoted}
+                    providers.update(tasks)
+                    pending = set(tasks)
+                    demoted = []
+        finally:
+            self._run_in_background(pending)
+
+        # Reported in the order of the providers, not of their answers.
+        messages = [errors[p] for p in providers.values() if p in errors]
+        self._raise_errors(messages or [f"no quorum reached: {dict(votes)}"])
+
+    async def _discover_sequential(self, providers: list[DiscoveryProvider]) -> str:
+        errors = []
+        for provider in providers:
+            try:
+                return await provider.query()
+            except SudException as e:
+                errors.append(str(e))
+        self._raise_errors(errors)
+
+    def _raise_errors(self, errors: list[str]) -> NoReturn:
+        family = "ip" if self.version == 4 else "IPv6"
+        raise SudException(
+            f"Cannot determine current public {family} address: "
+            f"{'; '.join(errors)}.",
+        )
+
+
+def create_provider(
+    spec: dict,
+    request: RequestFunc,
+    version: int = 4,
+) -> DiscoveryProvider:
+    provider_type = spec.get("type", "http")
+    if provider_type == "http":
+        return HTTPProvider(
+            spec["url"],
+            request,
+            name=spec.get("name"),
+            version=version,
+        )
+    if provider_type == "dns":
+        return DNSProvider(
+            server=spec.get(
+                "server",
+                DNS_WHOAMI_SERVER if version == 4 else DNS_WHOAMI_SERVER6,
+            ),
+            qname=spec.get("qname", DNS_WHOAMI_NAME),
+            qtype=spec.get("qtype", "A" if version == 4 else "AAAA"),
+            port=int(spec.get("port", 53)),
+            timeout=float(spec.get("timeout", 2.0)),
+            retries=int(spec.get("retries", 2)),
+            name=spec.get("name"),
+            version=version,
+        )
+    if provider_type == "natpmp":
+        if version != 4:
+            raise SudException("NAT-PMP can only discover IPv4 addresses")
+        return NATPMPProvider(
+            gateway=spec.get("gateway"),
+            port=int(spec.get("port", natpmp.NATPMP_PORT)),
+            timeout=float(spec.get("timeout", 0.25)),
+            retries=int(spec.get("retries", 3)),
+            name=spec.get("name"),
+        )
+    raise SudException(f"Invalid discovery provider type: {provider_type}")
+
+
+def create_discoverer(
+    config: DiscoveryConfig,
+    request: RequestFunc,
+    version: int = 4,
+) -> AddressDiscoverer:
+    return AddressDiscoverer(
+        [create_provider(spec, request, version) for spec in config.providers],
+        strategy=config.strategy,
+        quorum=config.quorum,
+        version=version,
+    )
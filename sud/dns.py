@@ -0,0 +1,121 @@
+import ipaddress
+import random
+import struct
+
+from sud import udp
+from sud.exceptions import SudException
+
+QTYPES = {
+    "A": 1,
+    "TXT": 16,
+    "AAAA": 28,
+}
+QCLASS_IN = 1
+HEADER = struct.Struct("!HHHHHH")
+RR = struct.Struct("!HHIH")
+FLAG_QR = 0x8000
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+
+def encode_name(name: str) -> bytes:
+    data = b""
+    for label in name.rstrip(".").split("."):
+        encoded = label.encode("idna")
+        if not 0 < len(encoded) < 64:
+            raise SudException(f"Invalid DNS name: {name}")
+        data += bytes([len(encoded)]) + encoded
+    return data + b"\x00"
+
+
+def build_query(qid: int, qname: str, qtype: str) -> bytes:
+    return (
+        HEADER.pack(qid, FLAG_RD, 1, 0, 0, 0)
+        + encode_name(qname)
+        + struct.pack("!HH", QTYPES[qtype], QCLASS_IN)
+    )
+
+
+def skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+
+def parse_rdata(rtype: int, rdata: bytes) -> str:
+    if rtype == QTYPES["A"]:
+        return str(ipaddress.IPv4Address(rdata))
+    if rtype == QTYPES["AAAA"]:
+        return str(ipaddress.IPv6Address(rdata))
+    strings = []
+    offset = 0
+    while offset < len(rdata):
+        length = rdata[offset]
+        strings.append(rdata[offset + 1 : offset + 1 + length].decode())
+        offset += length + 1
+    return "".join(strings)
+
+
+def parse_response(data: bytes, qid: int, qtype: str) -> list[str]:
+    """
+    Return the answers of type `qtype` of a DNS response.
+    """
+    try:
+        rid, flags, qdcount, ancount, _, _ = HEADER.unpack_from(data)
+        if rid != qid or not flags & FLAG_QR:
+            raise SudException("Unexpected DNS response")
+        if flags & FLAG_TC:
+            raise SudException("Truncated DNS response")
+        rcode = flags & 0x000F
+        if rcode:
+            raise SudException(f"DNS query failed with rcode {rcode}")
+
+        offset = HEADER.size
+        for _ in range(qdcount):
+            offset = skip_name(data, offset) + 4
+
+        answers = []
+        for _ in range(ancount):
+            offset = skip_name(data, offset)
+            rtype, _, _, rdlength = RR.unpack_from(data, offset)
+            offset += RR.size
+            rdata = data[offset : offset + rdlength]
+            offset += rdlength
+            if rtype == QTYPES[qtype]:
+                answers.append(parse_rdata(rtype, rdata))
+        return answers
+    except (IndexError, struct.error, ValueError) as e:
+        raise SudException(f"Malformed DNS response: {e}") from e
+
+
+async def query(
+    server: str,
+    qname: str,
+    qtype: str = "A",
+    port: int = 53,
+    timeout: float = 2.0,
+    retries: int = 2,
+) -> list[str]:
+    """
+    Send a DNS query over UDP and return the answers of type `qtype`.
+    """
+    qid = random.randint(0, 0xFFFF)
+    try:
+        data = await udp.request(
+            server,
+            port,
+            build_query(qid, qname, qtype),
+            lambda data: data[:2] == qid.to_bytes(2, "big"),
+            timeout,
+            retries,
+        )
+    except TimeoutError as e:
+        raise SudException(f"DNS query for {qname} to {server} timed out") from e
+    except OSError as e:
+        raise SudException(f"DNS query to {server} failed: {e}") from e
+    return parse_response(data, qid, qtype)
@@ -3,3 +3,24 @@ from click import ClickException
 
 class SudException(ClickException):
     pass
+
+
+class APIException(SudException):
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+class RetryLaterException(APIException):
+    def __init__(
+        self,
+        message: str,
+        retry_after: float | None = None,
+        status: int | None = None,
+    ):
+        super().__init__(message, status)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(SudException):
+    pass
@@ -0,0 +1,320 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ZONES_PATH = "/domain/v2beta1/dns-zones"
+API_PREFIX = f"{ZONES_PATH}/"
+CHECKIP_PATH = "/checkip"
+CHECKIP6_PATH = "/checkip6"
+
+
+class FakeScalewayAPI:
+    """
+    A local stand-in for the zones and records endpoints of the Scaleway
+    DNS API (`domain/v2beta1`) and for checkip services answering `address`
+    and `address6`, served from a thread.
+
+    The zones are listed as subdomains of the zones they are nested in.
+    GET of records supports the `name`, `type`, `page` and `page_size`
+    filters. PATCH supports `add`, `set` and `delete` changes and rejects
+    the whole batch with a 400 if an A or AAAA record is written where a
+    CNAME record exists. Every request waits `latency` seconds, fails with
+    a 500 with probability `error_rate`, and is rejected with a 429 over
+    `rate_limit` requests per second. Errors for the next requests can be
+    injected with `inject()`.
+    """
+
+    DEFAULT_PAGE_SIZE = 20
+
+    def __init__(
+        self,
+        address: str = "203.0.113.1",
+        address6: str = "2001:db8::1",
+        api_secret: str | None = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: int | None = None,
+        seed: int | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.address = address
+        self.address6 = address6
+        self.api_secret = api_secret
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.requests: Counter[str] = Counter()
+        self._zones: dict[str, list[dict]] = {}
+        self._injected: list[tuple[int, float | None]] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = (0, 0)
+        self._next_id = 1
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}domain/v2beta1/"
+
+    @property
+    def checkip_url(self) -> str:
+        return f"{self.url}{CHECKIP_PATH[1:]}"
+
+    @property
+    def checkip6_url(self) -> str:
+        return f"{self.url}{CHECKIP6_PATH[1:]}"
+
+    def start(self) -> "FakeScalewayAPI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeScalewayAPI":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def add_zone(self, zone: str, records: list[dict] | None = None) -> None:
+        with self._lock:
+            self._zones[zone] = []
+            for record in records or []:
+                self._add_record(zone, record)
+
+    def get_records(self, zone: str) -> list[dict]:
+        with self._lock:
+            return [dict(record) for record in self._zones[zone]]
+
+    def inject(
+        self,
+        status: int,
+        count: int = 1,
+        retry_after: float | None = None,
+    ) -> None:
+        """
+        Answer the next `count` API requests with `status`.
+        """
+        with self._lock:
+            self._injected.extend([(status, retry_after)] * count)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def _add_record(self, zone: str, record: dict) -> dict:
+        record = {
+            "id": str(self._next_id),
+            "name": self._relative_name(zone, record["name"]),
+            "type": record["type"],
+            "ttl": int(record.get("ttl", 300)),
+            "data": record["data"],
+        }
+        self._next_id += 1
+        self._zones[zone].append(record)
+        return record
+
+    @staticmethod
+    def _relative_name(zone: str, name: str) -> str:
+        if not name.endswith("."):
+            return name
+        name = name[:-1]
+        if name == zone:
+            return ""
+        return name.removesuffix(f".{zone}")
+
+    def _check_limits(self) -> tuple[int, float | None] | None:
+        with self._lock:
+            if self._injected:
+                return self._injected.pop(0)
+            if self.rate_limit is not None:
+                second = int(time.monotonic())
+                start, count = self._window
+                if start != second:
+                    start, count = second, 0
+                self._window = (start, count + 1)
+                if count >= self.rate_limit:
+                    return 429, 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 500, None
+        return None
+
+    def _list_zones(self, query: dict) -> tuple[int, dict]:
+        page = int(query.get("page", [1])[0])
+        page_size = int(query.get("page_size", [self.DEFAULT_PAGE_SIZE])[0])
+        with self._lock:
+            names = sorted(self._zones)
+        zones = []
+        for name in names:
+            parents = [zone for zone in names if name.endswith(f".{zone}")]
+            domain = max(parents, key=len, default=name)
+            subdomain = name.removesuffix(f".{domain}") if parents else ""
+            zones.append({"domain": domain, "subdomain": subdomain})
+        start = (page - 1) * page_size
+        return 200, {
+            "dns_zones": zones[start : start + page_size],
+            "total_count": len(zones),
+        }
+
+    def _list_records(self, zone: str, query: dict) -> tuple[int, dict]:
+        name = query.get("name", [None])[0]
+        record_type = query.get("type", [None])[0]
+        page = int(query.get("page", [1])[0])
+        page_size = int(query.get("page_size", [self.DEFAULT_PAGE_SIZE])[0])
+        with self._lock:
+            records = [
+                dict(record)
+                for record in self._zones[zone]
+                if (name is None or record["name"] == name)
+                and (record_type is None or record["type"] == record_type)
+            ]
+        start = (page - 1) * page_size
+        return 200, {
+            "records": records[start : start + page_size],
+            "total_count": len(records),
+        }
+
+    def _patch_records(self, zone: str, body: dict) -> tuple[int, dict]:
+        changed = []
+        with self._lock:
+            records = self._zones[zone]
+            aliases = {r["name"] for r in records if r["type"] == "CNAME"}
+            for change in body.get("changes", []):
+                for record in (change.get("add") or change.get("set") or {}).get(
+                    "records",
+                    [],
+                ):
+                    name = self._relative_name(zone, record["name"])
+                    if record["type"] in ("A", "AAAA") and name in aliases:
+                        return 400, {
+                            "message": f"record {name} conflicts with a CNAME",
+                        }
+            for change in body.get("changes", []):
+                if "add" in change:
+                    for record in change["add"]["records"]:
+                        changed.append(self._add_record(zone, record))
+                    continue
+                action = "set" if "set" in change else "delete"
+                id_fields = change[action]["id_fields"]
+                name = self._relative_name(zone, id_fields["name"])
+                records[:] = [
+                    record
+                    for record in records
+                    if record["name"] != name or record["type"] != id_fields["type"]
+                ]
+                if action == "set":
+                    for record in change["set"]["records"]:
+                        changed.append(self._add_record(zone, record))
+            if body.get("return_all_records"):
+                changed = records
+            return 200, {"records": [dict(record) for record in changed]}
+
+    def _create_handler(self) -> type[BaseHTTPRequestHandler]:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def send_json(
+                self,
+                status: int,
+                data: dict,
+                headers: dict | None = None,
+            ) -> None:
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def handle_request(self, method: str) -> None:
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with api._lock:
+                    api.requests[method] += 1
+                if api.latency:
+                    time.sleep(api.latency)
+
+                if method == "GET" and parts.path in (CHECKIP_PATH, CHECKIP6_PATH):
+                    address = api.address
+                    if parts.path == CHECKIP6_PATH:
+                        address = api.address6
+                    payload = f"{address}\n".encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                zone, _, resource = parts.path.removeprefix(API_PREFIX).partition("/")
+                listing = method == "GET" and parts.path == ZONES_PATH
+                if not listing and (
+                    not parts.path.startswith(API_PREFIX) or resource != "records"
+                ):
+                    self.send_json(404, {"message": "resource is not found"})
+                    return
+                if api.api_secret and self.headers.get("X-Auth-Token") != (
+                    api.api_secret
+                ):
+                    self.send_json(401, {"message": "authentication is denied"})
+                    return
+                error = api._check_limits()
+                if error:
+                    status, retry_after = error
+                    headers = {}
+                    if retry_after is not None:
+                        headers["Retry-After"] = f"{retry_after:g}"
+                    self.send_json(status, {"message": "injected error"}, headers)
+                    return
+                if listing:
+                    self.send_json(*api._list_zones(parse_qs(parts.query)))
+                    return
+                with api._lock:
+                    known = zone in api._zones
+                if not known:
+                    self.send_json(404, {"message": "zone is not found"})
+                    return
+                if method == "GET":
+                    self.send_json(*api._list_records(zone, parse_qs(parts.query)))
+                    return
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    self.send_json(400, {"message": "invalid JSON body"})
+                    return
+                self.send_json(*api._patch_records(zone, data))
+
+            def do_GET(self) -> None:
+                self.handle_request("GET")
+
+            def do_PATCH(self) -> None:
+                self.handle_request("PATCH")
+
+        return Handler
@@ -0,0 +1,298 @@
+import asyncio
+import base64
+import binascii
+import hmac
+import ipaddress
+import logging
+import math
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from sud.config import Config
+from sud.deadline import run_phase
+from sud.exceptions import SudException
+from sud.records import ARecordInfo
+from sud.updater import Updater
+from sud.writer import retrieve_exception
+
+logger = logging.getLogger(__name__)
+
+UPDATE_PATH = "/nic/update"
+RECORD_TYPES = {4: "A", 6: "AAAA"}
+
+
+def normalize_hostname(hostname: str) -> str:
+    return hostname.strip().rstrip(".").lower()
+
+
+def get_addresses(myip: str, peer: str | None = None) -> dict[str, str]:
+    """
+    Return the addresses to set by record type from the comma-separated
+    `myip` parameter. Like dyndns2 servers do, a missing or malformed
+    `myip` falls back to the address of the client.
+    """
+    addresses = {}
+    for value in myip.split(","):
+        try:
+            address = ipaddress.ip_address(value.strip())
+        except ValueError:
+            continue
+        addresses[RECORD_TYPES[address.version]] = str(address)
+    if not addresses and peer:
+        address = ipaddress.ip_address(peer)
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        addresses[RECORD_TYPES[address.version]] = str(address)
+    return addresses
+
+
+class UpdateGateway:
+    """
+    A dyndns2 compatible server: `GET /nic/update?hostname=...&myip=...`
+    with basic authentication sets the A or AAAA records of the hostnames
+    through the updater.
+
+    The records are compared with an in-memory index of their zone, loaded
+    on first use and once per `reconcile_frequency`, so that unchanged
+    addresses don't call the Scaleway API. Updates go through the write
+    queues of the updater, so concurrent updates of a zone are sent in a
+    single PATCH.
+    """
+
+    TIMEOUT = 10.0
+    MAX_HEADERS = 100
+    MAX_HOSTNAMES = 20
+    REALM = "sud"
+
+    def __init__(self, updater: Updater, config: Config):
+        self._updater = updater
+        self._config = config
+        serve = config.serve
+        self.host = serve.host
+        self.port = serve.port
+        hostnames = {normalize_hostname(hostname) for hostname in config.hostnames}
+        self._users = {
+            username: (
+                user.password.encode(),
+                hostnames
+                if user.hostnames is None
+                else {normalize_hostname(hostname) for hostname in user.hostnames},
+            )
+            for username, user in serve.users.items()
+        }
+        self._zones_lock = asyncio.Lock()
+        self._loaded: dict[str, float] = {}
+        self._loading: dict[str, asyncio.Task] = {}
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving dyndns2 updates on http://{self.host}:{self.port}/")
+
+    async def serve_forever(self) -> None:
+        await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def authenticate(self, authorization: str | None) -> set[str] | None:
+        """
+        Return the hostnames the user of a basic `authorization` header
+        can update, or None if the credentials are wrong.
+        """
+        scheme, _, credentials = (authorization or "").partition(" ")
+        if scheme.lower() != "basic":
+            return None
+        try:
+            decoded = base64.b64decode(credentials.strip(), validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        username, _, password = decoded.partition(":")
+        user = self._users.get(username)
+        if user is None or not hmac.compare_digest(password.encode(), user[0]):
+            return None
+        return user[1]
+
+    async def respond(
+        self,
+        method: str,
+        target: str,
+        headers: dict[str, str],
+        peer: str | None = None,
+    ) -> tuple[str, str]:
+        """
+        Return the HTTP status and the dyndns2 answer to a request, one
+        line per hostname.
+        """
+        parts = urlsplit(target)
+        if parts.path != UPDATE_PATH:
+            return "404 Not Found", "Not Found"
+        if method != "GET":
+            return "405 Method Not Allowed", "Method Not Allowed"
+        allowed = self.authenticate(headers.get("authorization"))
+        if allowed is None:
+            return "401 Unauthorized", "badauth"
+
+        query = parse_qs(parts.query)
+        hostnames = [
+            normalize_hostname(hostname)
+            for value in query.get("hostname", [])
+            for hostname in value.split(",")
+            if hostname.strip()
+        ]
+        if not hostnames:
+            return "200 OK", "notfqdn"
+        if len(hostnames) > self.MAX_HOSTNAMES:
+            return "200 OK", "numhost"
+        addresses = get_addresses(",".join(query.get("myip", [])), peer)
+        codes = await asyncio.gather(
+            *(self.update_host(allowed, hostname, addresses) for hostname in hostnames),
+        )
+        return "200 OK", "\n".join(codes)
+
+    async def update_host(
+        self,
+        allowed: set[str],
+        hostname: str,
+        addresses: dict[str, str],
+    ) -> str:
+        if "." not in hostname:
+            return "notfqdn"
+        if hostname not in allowed:
+            return "nohost"
+        if not addresses:
+            return "911"
+        try:
+            async with self._zones_lock:
+                await self._updater.resolve_zones()
+            infos = [
+                self._updater.get_record_info(hostname, record_type)
+                for record_type in addresses
+            ]
+        except SudException as e:
+            logger.warning(f"Cannot update {hostname}: {e}")
+            return "nohost"
+        try:
+            changed = await asyncio.gather(
+                *(
+                    self.set_address(info, addresses[info.record_type])
+                    for info in infos
+                ),
+            )
+        except SudException as e:
+            logger.error(f"Cannot update {hostname}: {e}")
+            return "911"
+        code = "good" if any(changed) else "nochg"
+        return f"{code} {','.join(addresses.values())}"
+
+    async def set_address(self, info: ARecordInfo, address: str) -> bool:
+        await self.load_zone(info.domain)
+        record = await self._updater.get_record(info)
+        previous = record.address if record else None
+        if previous == address:
+            return False
+        (error,) = await self._updater.write(info.domain, [(info, address, previous)])
+        if error:
+            raise error
+        return True
+
+    async def load_zone(self, domain: str) -> None:
+        """
+        Load the records of a zone once for all the concurrent requests,
+        on first use and once per `reconcile_frequency`.
+        """
+        interval = self._config.reconcile_frequency.total_seconds()
+        if time.monotonic() - self._loaded.get(domain, -math.inf) < interval:
+            return
+        task = self._loading.get(domain)
+        if task is None:
+            task = asyncio.create_task(self._load_zone(domain))
+            task.add_done_callback(retrieve_exception)
+            self._loading[domain] = task
+        await asyncio.shield(task)
+
+    async def _load_zone(self, domain: str) -> None:
+        try:
+            await run_phase(
+                "lookup",
+                self._config.timeouts.lookup,
+                self._updater.fetch_records(domain),
+            )
+            self._loaded[domain] = time.monotonic()
+        finally:
+            del self._loading[domain]
+
+    async def _read_headers(self, reader: asyncio.StreamReader) -> dict[str, str]:
+        headers = {}
+        for _ in range(self.MAX_HEADERS):
+            line = await asyncio.wait_for(reader.readline(), self.TIMEOUT)
+            if not line.strip():
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise ValueError("Too many headers")
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.TIMEOUT)
+            headers = await self._read_headers(reader)
+            method, target, *_ = request_line.decode("latin-1").split() + ["", ""]
+            peer = writer.get_extra_info("peername")
+            status, body = await self.respond(
+                method,
+                target,
+                headers,
+                peer[0] if peer else None,
+            )
+            payload = f"{body}\n".encode()
+            authenticate = ""
+            if status.startswith("401"):
+                authenticate = f'WWW-Authenticate: Basic realm="{self.REALM}"\r\n'
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: text/plain; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"{authenticate}"
+                    "Connection: close\r\n\r\n"
+                ).encode()
+                + payload,
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_gateway(updater: Updater, config: Config) -> None:
+    gateway = UpdateGateway(updater, config)
+    async with updater.running():
+        metrics_server = await updater.start_metrics_server()
+        await gateway.start()
+        try:
+            await gateway.serve_forever()
+        finally:
+            await gateway.stop()
+            if metrics_server:
+                await metrics_server.stop()
+
+
+def serve(config: Config) -> None:
+    if not config.serve.users:
+        raise SudException("No users are configured for the update gateway")
+    updater = Updater(config)
+    try:
+        asyncio.run(run_gateway(updater, config))
+    except KeyboardInterrupt:
+        logger.info("Exiting...")
+    finally:
+        updater.close()
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    math.inf,
+)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape(str(value))}"' for name, value in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple, float] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{format_labels(dict(key))} {format_value(value)}"
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+            *self.samples(),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def get(self, **labels) -> float:
+        """
+        Return the number of observations.
+        """
+        counts = self._counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in sorted(self._counts.items()):
+            labels = dict(key)
+            for bound, count in zip(self.buckets, counts, strict=True):
+                bucket = format_labels({**labels, "le": format_value(bound)})
+                yield f"{self.name}_bucket{bucket} {count}"
+            yield f"{self.name}_sum{format_labels(labels)} {self._sums[key]!r}"
+            yield f"{self.name}_count{format_labels(labels)} {counts[-1]}"
+
+
+class Metrics:
+    """
+    The metrics of the updater, in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.phase_seconds = Histogram(
+            "sud_phase_duration_seconds",
+            "Duration of each phase of a check.",
+        )
+        self.cycles = Counter(
+            "sud_cycles_total",
+            "Check cycles, by result.",
+        )
+        self.changes = Counter(
+            "sud_record_changes_total",
+            "DNS records created or updated, by hostname.",
+        )
+        self.errors = Counter(
+            "sud_errors_total",
+            "Errors, by type and HTTP status.",
+        )
+        self.last_success = Gauge(
+            "sud_last_success_timestamp_seconds",
+            "Time of the last successful check, by hostname.",
+        )
+        self.failures = Gauge(
+            "sud_consecutive_failures",
+            "Consecutive failed checks (backoff level), by hostname.",
+        )
+        self.next_check = Gauge(
+            "sud_next_check_delay_seconds",
+            "Delay before the next check, by hostname.",
+        )
+
+    def all(self) -> list[Metric]:
+        return [
+            self.phase_seconds,
+            self.cycles,
+            self.changes,
+            self.errors,
+            self.last_success,
+            self.failures,
+            self.next_check,
+        ]
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self.all())
+
+    @contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phase_seconds.observe(time.monotonic() - start, phase=phase)
+
+
+class MetricsServer:
+    """
+    A minimal HTTP server that exposes the metrics on `GET /metrics`.
+    """
+
+    TIMEOUT = 5.0
+
+    def __init__(self, metrics: Metrics, host: str, port: int):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.TIMEOUT)
+            # The headers are not needed, skip them.
+            while (await asyncio.wait_for(reader.readline(), self.TIMEOUT)).strip():
+                pass
+            method, path, *_ = request_line.decode("latin-1").split() + ["", ""]
+            if method != "GET":
+                status, body = "405 Method Not Allowed", "Method Not Allowed\n"
+            elif path.split("?")[0] != "/metrics":
+                status, body = "404 Not Found", "Not Found\n"
+            else:
+                status, body = "200 OK", self.metrics.render()
+            payload = body.encode()
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {CONTENT_TYPE}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode()
+                + payload,
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
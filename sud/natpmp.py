@@ -0,0 +1,76 @@
+import ipaddress
+import socket
+import struct
+
+from sud import udp
+from sud.exceptions import SudException
+
+NATPMP_PORT = 5351
+OP_EXTERNAL_ADDRESS = 0
+RESPONSE = struct.Struct("!BBHI4s")
+RESULT_CODES = {
+    1: "unsupported version",
+    2: "not authorized/refused",
+    3: "network failure",
+    4: "out of resources",
+    5: "unsupported opcode",
+}
+RTF_GATEWAY = 0x2
+
+
+def get_default_gateway(route_file: str = "/proc/net/route") -> str | None:
+    """
+    Return the IPv4 default gateway reading the Linux routing table.
+    """
+    try:
+        with open(route_file) as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return None
+
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4 or fields[1] != "00000000":
+            continue
+        if not int(fields[3], 16) & RTF_GATEWAY:
+            continue
+        return socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
+
+
+def parse_response(data: bytes) -> str:
+    try:
+        version, opcode, result, _, address = RESPONSE.unpack_from(data)
+    except struct.error as e:
+        raise SudException(f"Malformed NAT-PMP response: {e}") from e
+    if version != 0 or opcode != 128 + OP_EXTERNAL_ADDRESS:
+        raise SudException("Unexpected NAT-PMP response")
+    if result:
+        reason = RESULT_CODES.get(result, f"result code {result}")
+        raise SudException(f"NAT-PMP request failed: {reason}")
+    return str(ipaddress.IPv4Address(address))
+
+
+async def external_address(
+    gateway: str,
+    port: int = NATPMP_PORT,
+    timeout: float = 0.25,
+    retries: int = 3,
+) -> str:
+    """
+    Ask the gateway for its external address using NAT-PMP (RFC 6886).
+    """
+    try:
+        data = await udp.request(
+            gateway,
+            port,
+            struct.pack("!BB", 0, OP_EXTERNAL_ADDRESS),
+            lambda data: data[:2] == bytes([0, 128 + OP_EXTERNAL_ADDRESS]),
+            timeout,
+            retries,
+            backoff=2.0,
+        )
+    except TimeoutError as e:
+        raise SudException(f"No NAT-PMP answer from gateway {gateway}") from e
+    except OSError as e:
+        raise SudException(f"NAT-PMP request to {gateway} failed: {e}") from e
+    return parse_response(data)
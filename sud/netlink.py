@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import socket
+import struct
+from collections.abc import Callable
+
+from sud.exceptions import SudException
+
+logger = logging.getLogger(__name__)
+
+NETLINK_ROUTE = 0
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+GROUPS = RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE
+
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+ADDR_EVENTS = (RTM_NEWADDR, RTM_DELADDR)
+ROUTE_EVENTS = (RTM_NEWROUTE, RTM_DELROUTE)
+
+NLMSGHDR = struct.Struct("=IHHII")
+RTMSG = struct.Struct("=BBBBBBBBI")
+
+
+def is_relevant(data: bytes) -> bool:
+    """
+    Return True if a netlink datagram notifies an interface address
+    change or a default route change.
+    """
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        if msg_type in ADDR_EVENTS:
+            return True
+        if msg_type in ROUTE_EVENTS:
+            payload = offset + NLMSGHDR.size
+            if payload + RTMSG.size <= len(data):
+                dst_len = RTMSG.unpack_from(data, payload)[1]
+                if dst_len == 0:
+                    return True
+        # Messages are aligned to 4 bytes.
+        offset += (length + 3) & ~3
+    return False
+
+
+class NetlinkMonitor:
+    """
+    Watch rtnetlink address and route notifications and invoke `callback`
+    once the changes settle for `debounce` seconds.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[], None],
+        debounce: float = 2.0,
+        sock: socket.socket | None = None,
+    ):
+        self._callback = callback
+        self._debounce = debounce
+        self._sock = sock
+        self._timer: asyncio.TimerHandle | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self) -> None:
+        if self._sock is None:
+            if not hasattr(socket, "AF_NETLINK"):
+                raise SudException("Netlink is not supported on this platform")
+            try:
+                self._sock = socket.socket(
+                    socket.AF_NETLINK,
+                    socket.SOCK_RAW,
+                    NETLINK_ROUTE,
+                )
+                self._sock.bind((0, GROUPS))
+            except OSError as e:
+                raise SudException(f"Cannot subscribe to netlink: {e}") from e
+        self._sock.setblocking(False)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def stop(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._loop and self._sock:
+            self._loop.remove_reader(self._sock.fileno())
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def _on_readable(self) -> None:
+        try:
+            data = self._sock.recv(65536)
+        except OSError as e:
+            # e.g. ENOBUFS when notifications overflow: assume a change.
+            logger.warning(f"Error reading netlink notifications: {e}")
+            data = None
+        if data is not None and not is_relevant(data):
+            return
+        if self._timer:
+            self._timer.cancel()
+        self._timer = self._loop.call_later(self._debounce, self._fire)
+
+    def _fire(self) -> None:
+        self._timer = None
+        self._callback()
@@ -0,0 +1,582 @@
+import asyncio
+import json
+import logging
+import logging.handlers
+import smtplib
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+import requests
+
+from sud.config import Config, TelegramConfig, TimeoutConfig
+from sud.constants import (
+    TG_CREATED_MSG,
+    TG_DIGEST_CREATED,
+    TG_DIGEST_FLAPPED,
+    TG_DIGEST_MSG,
+    TG_DIGEST_UPDATED,
+    TG_UPDATED_MSG,
+)
+from sud.deadline import get_timeout, run_phase
+from sud.discovery import RequestFunc
+from sud.exceptions import RetryLaterException, SudException
+from sud.metrics import Metrics
+from sud.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Notification:
+    hostname: str
+    address: str
+    previous: str | None = None
+    changes: int = 1
+    record_type: str = "A"
+
+    @property
+    def flapped(self) -> bool:
+        return self.changes > 1 and self.previous == self.address
+
+    @property
+    def label(self) -> str:
+        # A records are the common case, only other types are spelled out.
+        if self.record_type == "A":
+            return self.hostname
+        return f"{self.hostname} ({self.record_type})"
+
+    def __str__(self) -> str:
+        if self.flapped:
+            return f"{self.label}: changed {self.changes} times, back to {self.address}"
+        if not self.previous:
+            return f"{self.label}: created {self.address}"
+        return f"{self.label}: {self.previous} -> {self.address}"
+
+
+def coalesce(notifications: list[Notification]) -> list[Notification]:
+    """
+    Merge the notifications of each record into one, from the first
+    previous address to the last address.
+    """
+    merged: dict[tuple[str, str], Notification] = {}
+    for notification in notifications:
+        key = (notification.hostname, notification.record_type)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = Notification(
+                notification.hostname,
+                notification.address,
+                notification.previous,
+                notification.changes,
+                notification.record_type,
+            )
+            continue
+        current.address = notification.address
+        current.changes += notification.changes
+    return list(merged.values())
+
+
+def get_record_types(notifications: list[Notification]) -> str:
+    return ", ".join(sorted({n.record_type for n in notifications}))
+
+
+def get_subject(notifications: list[Notification]) -> str:
+    if len(notifications) == 1:
+        notification = notifications[0]
+        return (
+            f"SUD: DNS record ({notification.record_type}) "
+            f"of {notification.hostname} changed"
+        )
+    return (
+        f"SUD: {len(notifications)} DNS records "
+        f"({get_record_types(notifications)}) changed"
+    )
+
+
+class Notifier:
+    """
+    A notification sink. `timeout` overrides the notify budget of each
+    delivery attempt.
+    """
+
+    def __init__(self, name: str, timeout: float | None = None):
+        self.name = name
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        return self.name
+
+    async def send(self, notifications: list[Notification]) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class TelegramNotifier(Notifier):
+    """
+    Send notifications to a Telegram chat through a single long-lived bot
+    client, respecting the Telegram flood limits.
+    """
+
+    # Telegram allows about one message per second to a chat and twenty
+    # messages per minute to a group.
+    MIN_INTERVAL = 1.0
+    GROUP_MIN_INTERVAL = 3.0
+
+    def __init__(
+        self,
+        config: TelegramConfig,
+        timeouts: TimeoutConfig,
+        timeout: float | None = None,
+    ):
+        # python-telegram-bot pulls in httpx, only load it when needed.
+        import telegram
+
+        super().__init__("telegram", timeout)
+        self._config = config
+        self._timeouts = timeouts
+        self._bot = telegram.Bot(config.token)
+        self._min_interval = (
+            self.GROUP_MIN_INTERVAL if config.chat_id < 0 else self.MIN_INTERVAL
+        )
+        self._last_sent: float | None = None
+
+    @staticmethod
+    def format(notifications: list[Notification]) -> str:
+        if len(notifications) == 1 and not notifications[0].flapped:
+            notification = notifications[0]
+            if not notification.previous:
+                return TG_CREATED_MSG.format(
+                    name=notification.hostname,
+                    address=notification.address,
+                    type=notification.record_type,
+                )
+            return TG_UPDATED_MSG.format(
+                name=notification.hostname,
+                address=notification.address,
+                previous=notification.previous,
+                type=notification.record_type,
+            )
+
+        entries = []
+        for notification in notifications:
+            template = TG_DIGEST_UPDATED
+            if notification.flapped:
+                template = TG_DIGEST_FLAPPED
+            elif not notification.previous:
+                template = TG_DIGEST_CREATED
+            entries.append(
+                template.format(
+                    name=notification.label,
+                    address=notification.address,
+                    previous=notification.previous,
+                    changes=notification.changes,
+                ),
+            )
+        return TG_DIGEST_MSG.format(
+            count=len(notifications),
+            types=get_record_types(notifications),
+            entries="\n".join(entries),
+        )
+
+    async def close(self) -> None:
+        await self._bot.shutdown()
+
+    async def send(self, notifications: list[Notification]) -> None:
+        import telegram
+
+        try:
+            await self._send(notifications)
+        except telegram.error.RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            raise RetryLaterException(str(e), retry_after) from e
+        except telegram.error.TelegramError as e:
+            raise SudException(str(e)) from e
+
+    async def _send(self, notifications: list[Notification]) -> None:
+        import telegram
+
+        # Initializing the bot checks the token, it is done on the first
+        # delivery so that Telegram being down doesn't delay the startup.
+        await self._bot.initialize()
+        if self._last_sent is not None:
+            wait = self._last_sent + self._min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        connect_timeout, read_timeout = get_timeout(
+            self._timeouts.connect,
+            self._timeouts.read,
+        )
+        try:
+            await self._bot.send_message(
+                self._config.chat_id,
+                self.format(notifications),
+                parse_mode=telegram.constants.ParseMode.HTML,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                write_timeout=read_timeout,
+                pool_timeout=connect_timeout,
+            )
+        finally:
+            self._last_sent = time.monotonic()
+
+
+class WebhookNotifier(Notifier):
+    """
+    POST the changes as JSON to an HTTP endpoint.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        request: RequestFunc,
+        headers: dict | None = None,
+        timeout: float | None = None,
+    ):
+        super().__init__(f"webhook {url}", timeout)
+        self.url = url
+        self.headers = headers or {}
+        self._request = request
+
+    async def send(self, notifications: list[Notification]) -> None:
+        try:
+            resp = await self._request(
+                "POST",
+                self.url,
+                headers=self.headers,
+                json={"changes": [asdict(n) for n in notifications]},
+            )
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            raise SudException(str(e)) from e
+
+
+class SMTPNotifier(Notifier):
+    """
+    Send the changes by email.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        sender: str,
+        recipients: list[str],
+        timeouts: TimeoutConfig,
+        port: int = 25,
+        starttls: bool = False,
+        username: str | None = None,
+        password: str | None = None,
+        timeout: float | None = None,
+    ):
+        super().__init__(f"smtp {host}:{port}", timeout)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self._timeouts = timeouts
+
+    def create_message(self, notifications: list[Notification]) -> EmailMessage:
+        message = EmailMessage()
+        message["Subject"] = get_subject(notifications)
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content("\n".join(str(n) for n in notifications))
+        return message
+
+    def _send(self, message: EmailMessage, timeout: float) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+    async def send(self, notifications: list[Notification]) -> None:
+        _, timeout = get_timeout(self._timeouts.connect, self._timeouts.read)
+        try:
+            await asyncio.to_thread(
+                self._send,
+                self.create_message(notifications),
+                timeout,
+            )
+        except (smtplib.SMTPException, OSError) as e:
+            raise SudException(str(e)) from e
+
+
+class FileNotifier(Notifier):
+    """
+    Append the changes to a file, one JSON object per line.
+    """
+
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__(f"file {path}", timeout)
+        self.path = path
+
+    def _write(self, lines: list[str]) -> None:
+        with open(self.path, "a") as f:
+            f.writelines(lines)
+
+    async def send(self, notifications: list[Notification]) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        lines = [
+            json.dumps({"time": now, **asdict(notification)}) + "\n"
+            for notification in notifications
+        ]
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            raise SudException(str(e)) from e
+
+
+class SyslogNotifier(Notifier):
+    """
+    Log the changes to syslog, one message per hostname.
+    """
+
+    def __init__(
+        self,
+        address: str | tuple[str, int] = "/dev/log",
+        facility: str = "user",
+        timeout: float | None = None,
+    ):
+        super().__init__("syslog", timeout)
+        self.address = address
+        self.facility = facility
+        self._handler: logging.handlers.SysLogHandler | None = None
+
+    def _emit(self, messages: list[str]) -> None:
+        if self._handler is None:
+            self._handler = logging.handlers.SysLogHandler(
+                address=self.address,
+                facility=self.facility,
+            )
+            self._handler.ident = "sud: "
+        for message in messages:
+            record = logging.LogRecord(
+                "sud",
+                logging.INFO,
+                __file__,
+                0,
+                message,
+                None,
+                None,
+            )
+            self._handler.emit(record)
+
+    async def send(self, notifications: list[Notification]) -> None:
+        try:
+            await asyncio.to_thread(self._emit, [str(n) for n in notifications])
+        except OSError as e:
+            raise SudException(str(e)) from e
+
+    async def close(self) -> None:
+        if self._handler is not None:
+            self._handler.close()
+
+
+class NotificationQueue:
+    """
+    Deliver notifications in the background, so that a slow notification
+    service never delays the DNS updates.
+
+    The changes notified within `window` seconds from the first one are
+    coalesced and sent as a single digest, a hostname that flaps between
+    addresses appears only once. The queue is bounded: when it is full
+    the oldest notification is dropped. Failed deliveries are retried with
+    backoff, or after the delay asked by Telegram when flood control kicks
+    in.
+    """
+
+    MAX_SIZE = 1000
+    RETRIES = 3
+    BACKOFF = 1.0
+
+    def __init__(
+        self,
+        notifier: Notifier,
+        timeouts: TimeoutConfig,
+        window: float = 0.0,
+        metrics: Metrics | None = None,
+    ):
+        self._notifier = notifier
+        self._timeouts = timeouts
+        self._metrics = metrics or Metrics()
+        self._window = window
+        self._queue: asyncio.Queue[Notification] = asyncio.Queue(self.MAX_SIZE)
+        self._task: asyncio.Task | None = None
+        self._flushing = asyncio.Event()
+        self._batch: list[Notification] = []
+
+    def put(self, notification: Notification) -> None:
+        if self._queue.full():
+            dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            logger.warning(
+                f"Notification queue full, dropping notification for "
+                f"{dropped.hostname}",
+            )
+        self._queue.put_nowait(notification)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout: float | None = None) -> None:
+        """
+        Flush the pending notifications for at most `timeout` seconds,
+        then stop the delivery task.
+        """
+        if self._task is None:
+            return
+        self._flushing.set()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pending = self._queue.qsize() + len(self._batch)
+            logger.warning(f"{pending} notification(s) not sent before exiting")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._notifier.close()
+
+    async def _run(self) -> None:
+        while True:
+            self._batch = [await self._queue.get()]
+            if self._window and not self._flushing.is_set():
+                try:
+                    await asyncio.wait_for(self._flushing.wait(), self._window)
+                except asyncio.TimeoutError:
+                    pass
+            while not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+            try:
+                await self.deliver(coalesce(self._batch))
+            except Exception:
+                logger.exception("Unexpected error while sending a notification")
+            finally:
+                for _ in self._batch:
+                    self._queue.task_done()
+                self._batch = []
+
+    async def deliver(self, notifications: list[Notification]) -> bool:
+        for attempt in range(self.RETRIES + 1):
+            try:
+                with self._metrics.time("notify"), span(
+                    "notify",
+                    sink=str(self._notifier),
+                ):
+                    await run_phase(
+                        "notify",
+                        self._notifier.timeout or self._timeouts.notify,
+                        self._notifier.send(notifications),
+                    )
+                return True
+            except SudException as e:
+                error = e
+                delay = self.BACKOFF * 2**attempt
+                if isinstance(e, RetryLaterException) and e.retry_after is not None:
+                    delay = e.retry_after
+            if attempt < self.RETRIES:
+                await asyncio.sleep(delay)
+        hostnames = ", ".join(n.hostname for n in notifications)
+        logger.warning(
+            f"Cannot notify the change of {hostnames} via {self._notifier}: {error}",
+        )
+        return False
+
+
+class NotificationDispatcher:
+    """
+    Fan out each notification to the queue of every sink: sinks deliver
+    concurrently and a slow or broken sink never holds back the others.
+    """
+
+    def __init__(self, queues: list[NotificationQueue]):
+        self._queues = queues
+
+    def put(self, notification: Notification) -> None:
+        for queue in self._queues:
+            queue.put(notification)
+
+    async def start(self) -> None:
+        for queue in self._queues:
+            await queue.start()
+
+    async def close(self, timeout: float | None = None) -> None:
+        await asyncio.gather(*(queue.close(timeout) for queue in self._queues))
+
+
+def create_notifier(
+    spec: dict,
+    request: RequestFunc,
+    timeouts: TimeoutConfig,
+) -> Notifier:
+    notifier_type = spec.get("type")
+    timeout = float(spec["timeout"]) if "timeout" in spec else None
+    if notifier_type == "telegram":
+        return TelegramNotifier(
+            TelegramConfig(spec["chat_id"], spec["token"]),
+            timeouts,
+            timeout=timeout,
+        )
+    if notifier_type == "webhook":
+        return WebhookNotifier(
+            spec["url"],
+            request,
+            headers=spec.get("headers"),
+            timeout=timeout,
+        )
+    if notifier_type == "smtp":
+        recipients = spec["to"]
+        return SMTPNotifier(
+            spec["host"],
+            spec["from"],
+            [recipients] if isinstance(recipients, str) else list(recipients),
+            timeouts,
+            port=int(spec.get("port", 25)),
+            starttls=bool(spec.get("starttls", False)),
+            username=spec.get("username"),
+            password=spec.get("password"),
+            timeout=timeout,
+        )
+    if notifier_type == "file":
+        return FileNotifier(spec["path"], timeout=timeout)
+    if notifier_type == "syslog":
+        address = spec.get("address", "/dev/log")
+        if isinstance(address, list):
+            address = (address[0], int(address[1]))
+        return SyslogNotifier(
+            address,
+            facility=spec.get("facility", "user"),
+            timeout=timeout,
+        )
+    raise SudException(f"Invalid notification sink type: {notifier_type}")
+
+
+def create_dispatcher(
+    config: Config,
+    request: RequestFunc,
+    metrics: Metrics | None = None,
+) -> NotificationDispatcher | None:
+    queues = [
+        NotificationQueue(
+            create_notifier(spec, request, config.timeouts),
+            config.timeouts,
+            window=config.notification_window,
+            metrics=metrics,
+        )
+        for spec in config.notifiers
+    ]
+    if not queues:
+        return None
+    return NotificationDispatcher(queues)
@@ -0,0 +1,31 @@
+import ipaddress
+
+from sud.exceptions import SudException
+
+
+def parse_suffix(suffix: str, prefix_length: int) -> ipaddress.IPv6Address:
+    """
+    Parse the interface identifier of a host, written as an IPv6 address
+    (e.g. "::11:22ff:fe33:4455"), that must fit in the bits that follow a
+    prefix of `prefix_length` bits.
+    """
+    try:
+        address = ipaddress.IPv6Address(suffix)
+    except ValueError as e:
+        raise SudException(f"Invalid IPv6 suffix {suffix}: {e}") from e
+    if int(address) >> (128 - prefix_length):
+        raise SudException(
+            f"IPv6 suffix {suffix} overlaps the /{prefix_length} prefix",
+        )
+    return address
+
+
+def get_prefix(address: str, prefix_length: int) -> ipaddress.IPv6Network:
+    return ipaddress.IPv6Network(f"{address}/{prefix_length}", strict=False)
+
+
+def compose_address(
+    prefix: ipaddress.IPv6Network,
+    suffix: ipaddress.IPv6Address,
+) -> str:
+    return str(ipaddress.IPv6Address(int(prefix.network_address) | int(suffix)))
@@ -0,0 +1,147 @@
+import ipaddress
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import Optional
+
+from sud.exceptions import SudException
+
+
+@dataclass
+class ARecordInfo:
+    """
+    An address record: A (IPv4) by default, or AAAA (IPv6).
+    """
+
+    name: str
+    domain: str
+    ttl: Optional[int] = 300
+    address: Optional[str] = None
+    record_type: str = "A"
+
+    @classmethod
+    def from_hostname(
+        cls,
+        hostname,
+        record_type: str = "A",
+        zone: str | None = None,
+    ) -> "ARecordInfo":
+        """
+        Split a hostname into a record name and its `zone`, or the last two
+        labels when the zone is not known.
+        """
+        if not hostname:
+            raise SudException("Hostname is required")
+
+        parts = hostname.split(".")
+
+        if len(parts) < 2:
+            raise SudException(f"Invalid hostname: {hostname}")
+
+        size = len(zone.split(".")) if zone else 2
+        if zone and ".".join(parts[-size:]).lower() != zone.lower():
+            raise SudException(f"Hostname {hostname} is not in zone {zone}")
+
+        domain = zone or ".".join(parts[-2:])
+        name = ".".join(parts[:-size])
+
+        return cls(name, domain, record_type=record_type)
+
+    def get_dns_name(self):
+        return f"{self.name}.{self.domain}." if self.name else f"{self.domain}."
+
+    def get_hostname(self):
+        return self.get_dns_name()[:-1]
+
+
+def normalize_address(address: str) -> str:
+    """
+    Return the canonical form of an IP address, so that IPv6 addresses
+    written differently compare equal.
+    """
+    try:
+        return str(ipaddress.ip_address(address))
+    except ValueError:
+        return address
+
+
+class ZoneSuffixTrie:
+    """
+    The DNS zones of an account in a trie of their labels, from the TLD
+    down, so that the zone of a hostname is its longest matching suffix.
+    """
+
+    def __init__(self, zones: Iterable[str] = ()):
+        self._root: dict = {}
+        self._size = 0
+        for zone in zones:
+            self.add(zone)
+
+    def add(self, zone: str) -> None:
+        node = self._root
+        for label in reversed(zone.lower().split(".")):
+            node = node.setdefault(label, {})
+        if None not in node:
+            self._size += 1
+        # No label can collide with the None key that marks a zone.
+        node[None] = zone
+
+    def lookup(self, hostname: str) -> str | None:
+        node = self._root
+        zone = None
+        for label in reversed(hostname.lower().split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            zone = node.get(None, zone)
+        return zone
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self) -> Iterator[str]:
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            for label, child in node.items():
+                if label is None:
+                    yield child
+                else:
+                    nodes.append(child)
+
+
+class ZoneRecordIndex:
+    """
+    In-memory index of the records of a DNS zone keyed by (name, type).
+    """
+
+    RECORD_TYPES = ("A", "AAAA")
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self._records: dict[tuple[str, str], ARecordInfo] = {}
+
+    def load(self, records: Iterable[dict]) -> None:
+        self._records = {}
+        self.update(records)
+
+    def update(self, records: Iterable[dict]) -> list[ARecordInfo]:
+        updated = []
+        for record in records:
+            if record["type"] not in self.RECORD_TYPES:
+                continue
+            info = ARecordInfo(
+                record["name"],
+                self.domain,
+                ttl=record["ttl"],
+                address=normalize_address(record["data"]),
+                record_type=record["type"],
+            )
+            self._records[(record["name"], record["type"])] = info
+            updated.append(info)
+        return updated
+
+    def get(self, name: str, record_type: str = "A") -> ARecordInfo | None:
+        return self._records.get((name, record_type))
+
+    def __len__(self):
+        return len(self._records)
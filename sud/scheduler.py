@@ -0,0 +1,115 @@
+import hashlib
+import heapq
+from dataclasses import dataclass
+
+
+@dataclass
+class HostSchedule:
+    hostname: str
+    interval: float
+    jitter: float
+    failures: int = 0
+    boost_until: float = 0.0
+    next_run: float = 0.0
+
+
+def get_jitter(hostname: str) -> float:
+    """
+    Return a deterministic value in [-1, 1) for the given hostname.
+    """
+    digest = hashlib.sha256(hostname.encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**63 - 1
+
+
+class Scheduler:
+    """
+    Keep the next check time of each host in a priority queue.
+
+    After a success a host is checked again after its interval, shortened
+    to `boost_interval` for `boost_duration` seconds after an IP change.
+    Errors back off exponentially up to `max_backoff` seconds, or for as
+    long as the API asked with `Retry-After`. Every delay is spread by a
+    deterministic per-host jitter of +/- `jitter` times the delay.
+    """
+
+    def __init__(
+        self,
+        intervals: dict[str, float],
+        jitter: float = 0.1,
+        max_backoff: float = 3600,
+        boost_interval: float = 60,
+        boost_duration: float = 1800,
+        now: float = 0.0,
+    ):
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.boost_interval = boost_interval
+        self.boost_duration = boost_duration
+        self._hosts = {
+            hostname: HostSchedule(
+                hostname,
+                interval,
+                get_jitter(hostname),
+                next_run=now,
+            )
+            for hostname, interval in intervals.items()
+        }
+        self._queue = [(now, hostname) for hostname in self._hosts]
+        heapq.heapify(self._queue)
+        # Hosts due within this window are checked together, so that
+        # they can share a single discovery and one write per zone. It
+        # spans the whole +/- jitter spread of the shortest interval.
+        self.window = 2 * jitter * min(intervals.values(), default=0)
+
+    def __getitem__(self, hostname: str) -> HostSchedule:
+        return self._hosts[hostname]
+
+    def next_run(self) -> float | None:
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now: float) -> list[str]:
+        due = []
+        while self._queue and self._queue[0][0] <= now + self.window:
+            _, hostname = heapq.heappop(self._queue)
+            due.append(hostname)
+        return due
+
+    def run_now(self, now: float) -> None:
+        self._queue = [(now, hostname) for hostname in self._hosts]
+        for host in self._hosts.values():
+            host.next_run = now
+
+    def get_delay(
+        self,
+        host: HostSchedule,
+        now: float,
+        success: bool,
+        retry_after: float | None = None,
+    ) -> float:
+        interval = host.interval
+        if now < host.boost_until:
+            interval = min(interval, self.boost_interval)
+        if success:
+            delay = interval
+        else:
+            delay = min(self.max_backoff, interval * 2 ** (host.failures - 1))
+        delay *= 1 + self.jitter * host.jitter
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def reschedule(
+        self,
+        hostname: str,
+        now: float,
+        success: bool = True,
+        changed: bool = False,
+        retry_after: float | None = None,
+    ) -> float:
+        host = self._hosts[hostname]
+        host.failures = 0 if success else host.failures + 1
+        if changed:
+            host.boost_until = now + self.boost_duration
+        host.next_run = now + self.get_delay(host, now, success, retry_after)
+        heapq.heappush(self._queue, (host.next_run, hostname))
+        return host.next_run
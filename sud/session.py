@@ -0,0 +1,127 @@
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from sud.constants import (
+    CHECK_IP_ADDRESS,
+    CHECK_IPV6_ADDRESS,
+    SCALEWAY_API_BASE_URL,
+)
+from sud.tracing import record_span, span
+
+# 429 and 503 are not retried by the adapter: they are handed over to
+# the scheduler that honours their Retry-After header.
+RETRY_STATUSES = (500, 502, 504)
+RETRY_LATER_STATUSES = (429, 503)
+
+
+def get_base_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+class TracedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        # urllib3 resolves the hostname while connecting, the span covers
+        # both the name resolution and the TCP connection.
+        with span("connect", host=self.host, port=self.port):
+            return super()._new_conn()
+
+
+class TracedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        with span("connect", host=self.host, port=self.port):
+            sock = super()._new_conn()
+        self._connected_at = time.perf_counter()
+        return sock
+
+    def connect(self) -> None:
+        super().connect()
+        duration = time.perf_counter() - self._connected_at
+        record_span("tls", time.time() - duration, duration, host=self.host)
+
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class TracedHTTPAdapter(HTTPAdapter):
+    """
+    An adapter whose connections report connect and TLS handshake spans.
+    """
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TracedHTTPConnectionPool,
+            "https": TracedHTTPSConnectionPool,
+        }
+
+
+def create_adapter(pool_size: int, retries: int) -> HTTPAdapter:
+    # GETs are retried on connection/read errors and retryable statuses.
+    # A PATCH is retried only when the connection cannot be established,
+    # since the request has not been sent yet.
+    retry = Retry(
+        total=retries,
+        read=retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    return TracedHTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+
+
+def create_session(
+    pool_size: int,
+    retries: int,
+    api_url: str = SCALEWAY_API_BASE_URL,
+) -> requests.Session:
+    """
+    Create a long-lived session with keep-alive connection pools
+    for the public ip checkers and the Scaleway API.
+    """
+    session = requests.Session()
+    for url in (CHECK_IP_ADDRESS, CHECK_IPV6_ADDRESS):
+        session.mount(get_base_url(url), create_adapter(1, retries))
+    session.mount(
+        get_base_url(api_url),
+        create_adapter(pool_size, retries),
+    )
+    return session
+
+
+def get_retry_after(response: requests.Response | None) -> float | None:
+    """
+    Return the seconds to wait before retrying a request rejected with
+    429 or 503, if the server says so.
+    """
+    if response is None or response.status_code not in RETRY_LATER_STATUSES:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+
+from sud.exceptions import SudException
+
+logger = logging.getLogger(__name__)
+
+
+class State:
+    """
+    Last known addresses of the managed records.
+
+    The state is kept in memory and, if a state file is configured,
+    persisted across restarts.
+    """
+
+    VERSION = 2
+
+    def __init__(self, state_file=None):
+        self._state_file = state_file
+        self._records: dict[str, dict[str, str]] = {}
+        self._reconciled: dict[str, float] = {}
+        self._zones: list[str] | None = None
+        self._zones_listed_at: float | None = None
+
+    def get_reconciled_at(self, hostname: str) -> float | None:
+        return self._reconciled.get(hostname)
+
+    def needs_reconciliation(self, hostname: str, interval: timedelta) -> bool:
+        reconciled_at = self._reconciled.get(hostname)
+        if reconciled_at is None:
+            return True
+        return time.time() - reconciled_at >= interval.total_seconds()
+
+    def mark_reconciled(self, hostname: str) -> None:
+        self._reconciled[hostname] = time.time()
+
+    @property
+    def zones(self) -> list[str] | None:
+        return self._zones
+
+    def get_zones_age(self) -> float | None:
+        if self._zones_listed_at is None:
+            return None
+        return time.time() - self._zones_listed_at
+
+    def set_zones(self, zones: list[str]) -> None:
+        self._zones = zones
+        self._zones_listed_at = time.time()
+
+    def get_address(self, hostname: str, record_type: str = "A") -> str | None:
+        return self._records.get(hostname, {}).get(record_type)
+
+    def set_address(self, hostname: str, address: str, record_type: str = "A") -> None:
+        self._records.setdefault(hostname, {})[record_type] = address
+
+    def invalidate(self, hostname: str) -> None:
+        self._records.pop(hostname, None)
+        self._reconciled.pop(hostname, None)
+
+    def load(self) -> None:
+        if not self._state_file or not os.path.exists(self._state_file):
+            return
+        try:
+            with open(self._state_file) as f:
+                data = json.load(f)
+            if data.get("version") not in (1, State.VERSION):
+                return
+            self._records = data["records"]
+            # Version 1 had a single reconciliation time for all the hosts.
+            self._reconciled = data.get("reconciled", {})
+            self._zones = data.get("zones")
+            self._zones_listed_at = data.get("zones_listed_at")
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            # A broken state file is just a cache miss.
+            logger.warning(f"Ignoring invalid state file {self._state_file}: {e}")
+
+    def store(self) -> None:
+        if not self._state_file:
+            return
+        try:
+            dirname = os.path.abspath(os.path.dirname(self._state_file))
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+            tmp_file = f"{self._state_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(
+                    {
+                        "version": State.VERSION,
+                        "reconciled": self._reconciled,
+                        "zones": self._zones,
+                        "zones_listed_at": self._zones_listed_at,
+                        "records": self._records,
+                    },
+                    f,
+                )
+            os.replace(tmp_file, self._state_file)
+        except OSError as e:
+            raise SudException(
+                f"Cannot save the SUD state file: {str(e)}",
+            ) from e
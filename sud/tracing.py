@@ -0,0 +1,199 @@
+import importlib
+import json
+import logging
+import math
+import secrets
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+from sud.exceptions import SudException
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start: float
+    duration: float = 0.0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+
+class Exporter:
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JSONLExporter(Exporter):
+    """
+    Append each span to a file as a JSON line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._file = open(path, "a", buffering=1)
+        except OSError as e:
+            raise SudException(f"Cannot open the trace file: {e}") from e
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(asdict(span), separators=(",", ":")) + "\n"
+        # Spans are exported from the event loop and from worker threads.
+        with self._lock:
+            self._file.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    def __init__(self, exporter: Exporter):
+        self.exporter = exporter
+
+    def export(self, span: Span) -> None:
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.warning(f"Cannot export span {span.name}: {e}")
+
+    def close(self) -> None:
+        self.exporter.close()
+
+
+_tracer: Tracer | None = None
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def set_tracer(tracer: Tracer | None) -> None:
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Tracer | None:
+    return _tracer
+
+
+def _new_span(name: str, start: float, attributes: dict) -> Span:
+    parent = _current_span.get()
+    return Span(
+        name,
+        parent.trace_id if parent else secrets.token_hex(8),
+        secrets.token_hex(4),
+        parent.span_id if parent else None,
+        start,
+        attributes=attributes,
+    )
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    """
+    Time the enclosed code as a span, child of the current span. This is
+    a no-op when tracing is disabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+    current = _new_span(name, time.time(), attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        tracer.export(current)
+
+
+def record_span(name: str, start: float, duration: float, **attributes) -> None:
+    """
+    Export a span whose timing has been measured elsewhere.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return
+    current = _new_span(name, start, attributes)
+    current.duration = duration
+    tracer.export(current)
+
+
+def create_tracer(path: str | None = None, exporter: str | None = None) -> Tracer:
+    """
+    Create a tracer that exports spans to `path` as JSON lines, or through
+    the `exporter` factory given as "module:callable".
+    """
+    if exporter:
+        module_name, _, attr = exporter.partition(":")
+        try:
+            factory = getattr(importlib.import_module(module_name), attr)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise SudException(
+                f"Cannot load the trace exporter {exporter}: {e}",
+            ) from e
+        return Tracer(factory())
+    if not path:
+        raise SudException("A trace file or exporter is required to enable tracing")
+    return Tracer(JSONLExporter(path))
+
+
+@dataclass
+class SpanStats:
+    count: int
+    p50: float
+    p95: float
+    p99: float
+    max: float
+    errors: int
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(lines: Iterable[str]) -> dict[str, SpanStats]:
+    durations: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            name, duration = data["name"], float(data["duration"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise SudException(f"Invalid span at line {number}: {e}") from e
+        durations.setdefault(name, []).append(duration)
+        errors[name] = errors.get(name, 0) + bool(data.get("error"))
+
+    stats = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        stats[name] = SpanStats(
+            count=len(values),
+            p50=percentile(values, 50),
+            p95=percentile(values, 95),
+            p99=percentile(values, 99),
+            max=values[-1],
+            errors=errors[name],
+        )
+    return stats
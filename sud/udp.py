@@ -0,0 +1,56 @@
+import asyncio
+from collections.abc import Callable
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, accept: Callable[[bytes], bool]):
+        self.accept = accept
+        self.response: asyncio.Future[
+            bytes
+        ] = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        # Ignore stray packets that don't answer our request.
+        if self.accept(data) and not self.response.done():
+            self.response.set_result(data)
+
+    def error_received(self, exc):
+        if not self.response.done():
+            self.response.set_exception(exc)
+
+
+async def request(
+    host: str,
+    port: int,
+    payload: bytes,
+    accept: Callable[[bytes], bool],
+    timeout: float,
+    retries: int,
+    backoff: float = 1.0,
+) -> bytes:
+    """
+    Send `payload` to host:port, resending it on timeout, and return the
+    first datagram accepted by `accept`.
+
+    Raise OSError on socket errors and TimeoutError when no answer is
+    received. The timeout is multiplied by `backoff` after each attempt.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: _UDPProtocol(accept),
+        remote_addr=(host, port),
+    )
+    try:
+        for _ in range(retries + 1):
+            transport.sendto(payload)
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(protocol.response),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                timeout *= backoff
+    finally:
+        transport.close()
+
+    raise TimeoutError(f"no answer from {host}:{port}")
@@ -1,237 +1,852 @@
 import asyncio
+import ipaddress
 import logging
 import time
-from dataclasses import dataclass
-from typing import Optional
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from urllib.parse import urljoin
 
 import humanize
 import requests
-import telegram
 
 from sud.config import Config
-from sud.constants import (
-    CHECK_IP_ADDRESS,
-    SCALEWAY_API_BASE_URL,
-    TG_CREATED_MSG,
-    TG_UPDATED_MSG,
+from sud.deadline import get_timeout, run_phase
+from sud.discovery import AddressDiscoverer, create_discoverer
+from sud.exceptions import APIException, RetryLaterException, SudException
+from sud.metrics import Metrics, MetricsServer
+from sud.netlink import NetlinkMonitor
+from sud.notifications import (
+    Notification,
+    NotificationDispatcher,
+    create_dispatcher,
 )
-from sud.exceptions import SudException
+from sud.prefix import compose_address, get_prefix
+from sud.records import ARecordInfo, ZoneRecordIndex, ZoneSuffixTrie
+from sud.scheduler import Scheduler
+from sud.session import create_session, get_retry_after
+from sud.state import State
+from sud.tracing import create_tracer, get_tracer, set_tracer, span
+from sud.writer import Write, ZoneWriter
 
 logger = logging.getLogger(__name__)
 
 
 @dataclass
-class ARecordInfo:
-    name: str
-    domain: str
-    ttl: Optional[int] = 300
-    address: Optional[str] = None
+class CycleResult:
+    hostnames: list[str]
+    changed: list[str] = field(default_factory=list)
+    failed: dict[str, SudException] = field(default_factory=dict)
 
-    @classmethod
-    def from_hostname(cls, hostname) -> "ARecordInfo":
-        if not hostname:
-            raise SudException("Hostname is required")
-
-        parts = hostname.split(".")
-
-        if len(parts) < 2:
-            raise SudException(f"Invalid hostname: {hostname}")
-
-        domain = ".".join(parts[-2:])
-        name = ".".join(parts[:-2])
+    @property
+    def unchanged(self) -> list[str]:
+        return [
+            hostname
+            for hostname in self.hostnames
+            if hostname not in self.changed and hostname not in self.failed
+        ]
 
-        return cls(name, domain)
+    @property
+    def status(self) -> str:
+        if self.failed:
+            return "partial" if len(self.failed) < len(self.hostnames) else "failed"
+        return "updated" if self.changed else "unchanged"
 
-    def get_dns_name(self):
-        return f"{self.name}.{self.domain}." if self.name else f"{self.domain}."
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "failed": {hostname: str(error) for hostname, error in self.failed.items()},
+        }
 
 
 class Updater:
+    RECORDS_PAGE_SIZE = 1000
+    ZONES_PAGE_SIZE = 100
+    # Delay before listing the zones again after a failure, unless the API
+    # asked for longer with Retry-After.
+    ZONES_RETRY_DELAY = 60
+
     def __init__(self, config: Config):
         self._config: Config = config
+        self._indexes: dict[str, ZoneRecordIndex] = {}
+        self._zones: ZoneSuffixTrie | None = None
+        self._zones_expiry = 0.0
+        self._session: requests.Session = create_session(
+            config.pool_size,
+            config.retries,
+            config.api_url,
+        )
+        self._state: State = State(config.state_file)
+        self._state.load()
+        self._semaphore = asyncio.Semaphore(config.concurrency)
+        self._writer = ZoneWriter(self.write_zone, config.write_concurrency)
+        record_types = {
+            record_type
+            for types in config.host_record_types.values()
+            for record_type in types
+        }
+        self._discoverers: dict[str, AddressDiscoverer] = {}
+        if "A" in record_types:
+            self._discoverers["A"] = create_discoverer(config.discovery, self._request)
+        if "AAAA" in record_types:
+            self._discoverers["AAAA"] = create_discoverer(
+                config.discovery6,
+                self._request,
+                version=6,
+            )
+        self._suffixes = config.host_ipv6_suffixes
+        self._prefix: ipaddress.IPv6Network | None = None
+        self._wakeup = asyncio.Event()
+        self._metrics = Metrics()
+        self._notifications: NotificationDispatcher | None = create_dispatcher(
+            config,
+            self._request,
+            self._metrics,
+        )
 
-    @staticmethod
-    def discover_address() -> str:
+    def close(self) -> None:
+        for discoverer in self._discoverers.values():
+            discoverer.close()
+        self._session.close()
+
+    async def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        # The pooled session is blocking: requests run in worker threads,
+        # at most `concurrency` at a time. The timeouts bound how long a
+        # worker thread can outlive a cancelled cycle.
+        async with self._semaphore:
+            timeouts = self._config.timeouts
+            kwargs.setdefault("timeout", get_timeout(timeouts.connect, timeouts.read))
+            with span("request", method=method, url=url) as current:
+                resp = await asyncio.to_thread(
+                    self._session.request,
+                    method,
+                    url,
+                    **kwargs,
+                )
+                if current:
+                    current.attributes["status"] = resp.status_code
+                return resp
+
+    async def discover_address(self, record_type: str = "A") -> str:
+        with self._metrics.time("discovery"), span(
+            "discovery",
+            record_type=record_type,
+        ):
+            return await self._discoverers[record_type].discover()
+
+    async def fetch_zones(self) -> ZoneSuffixTrie:
+        url = urljoin(self._config.api_url, "dns-zones")
+        zones = []
+        page = 1
         try:
-            resp = requests.get(CHECK_IP_ADDRESS)
-            resp.raise_for_status()
-            return resp.text.strip()
+            with span("zones"):
+                while True:
+                    resp = await self._request(
+                        "GET",
+                        url,
+                        headers={"X-Auth-Token": self._config.api_secret},
+                        params={"page": page, "page_size": self.ZONES_PAGE_SIZE},
+                    )
+                    resp.raise_for_status()
+                    data = resp.json()
+                    zones.extend(data["dns_zones"])
+                    if not data["dns_zones"] or len(zones) >= data["total_count"]:
+                        break
+                    page += 1
         except requests.RequestException as e:
-            raise SudException(
-                f"Cannot determine current public ip address: {str(e)}.",
-            ) from e
+            raise self._api_exception("Cannot list the DNS zones", e) from e
 
-    def get_record(self) -> ARecordInfo | None:
-        info = ARecordInfo.from_hostname(self._config.hostname)
-
-        url = urljoin(
-            SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
+        return ZoneSuffixTrie(
+            f"{zone['subdomain']}.{zone['domain']}"
+            if zone.get("subdomain")
+            else zone["domain"]
+            for zone in zones
         )
 
+    async def resolve_zones(self) -> None:
+        """
+        Refresh the zones of the account once their `zones_ttl` expires.
+        If they cannot be listed, the previous zones are kept or, before
+        the first listing, hostnames fall in the zone of their last two
+        labels, until the listing is retried. The zones are kept in the
+        state, so that runs of `sync` don't list them every time.
+        """
+        if time.monotonic() < self._zones_expiry:
+            return
+        ttl = self._config.zones_ttl.total_seconds()
+        age = self._state.get_zones_age()
+        if age is not None and 0 <= age < ttl:
+            self._zones = ZoneSuffixTrie(self._state.zones)
+            self._zones_expiry = time.monotonic() + ttl - age
+            return
         try:
-            resp = requests.get(
-                url,
-                headers={"X-Auth-Token": self._config.api_secret},
-                params={
-                    "type": "A",
-                    "name": info.name,
-                },
+            self._zones = await run_phase(
+                "lookup",
+                self._config.timeouts.lookup,
+                self.fetch_zones(),
             )
-            resp.raise_for_status()
-            data = resp.json()
-            for record in data["records"]:
-                if record["name"] == info.name:
-                    return ARecordInfo(
-                        record["name"],
-                        info.domain,
-                        ttl=record["ttl"],
-                        address=record["data"],
-                    )
+        except SudException as e:
+            if self._zones is None and self._state.zones is not None:
+                self._zones = ZoneSuffixTrie(self._state.zones)
+            if self._zones is None:
+                logger.warning(f"{e}, zones are guessed from the hostnames")
+            else:
+                logger.warning(f"{e}, the previous zones are kept")
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is None:
+                retry_after = min(ttl, self.ZONES_RETRY_DELAY)
+            self._zones_expiry = time.monotonic() + retry_after
+            return
+        self._state.set_zones(sorted(self._zones))
+        self._zones_expiry = time.monotonic() + ttl
+
+    def get_zones(
+        self,
+        hostnames: list[str] | None = None,
+    ) -> tuple[dict[str, list[ARecordInfo]], dict[str, SudException]]:
+        """
+        Group the records of `hostnames`, or of every hostname, by zone
+        and return them with the errors of the hostnames that are in no
+        zone of the account.
+        """
+        zones: dict[str, list[ARecordInfo]] = {}
+        failed: dict[str, SudException] = {}
+        for hostname, record_types in self._config.host_record_types.items():
+            name = ARecordInfo.from_hostname(hostname).get_hostname()
+            if hostnames is not None and name not in hostnames:
+                continue
+            try:
+                infos = [
+                    self.get_record_info(hostname, record_type)
+                    for record_type in record_types
+                ]
+            except SudException as e:
+                failed[name] = e
+                continue
+            for info in infos:
+                zones.setdefault(info.domain, []).append(info)
+        return zones, failed
+
+    def get_record_info(self, hostname: str, record_type: str = "A") -> ARecordInfo:
+        """
+        Return the record of a hostname in its zone, raise SudException if
+        no zone of the account contains it.
+        """
+        zone = None
+        if self._zones is not None:
+            zone = self._zones.lookup(hostname)
+            if zone is None:
+                raise SudException(f"No DNS zone of the account contains {hostname}")
+        return ARecordInfo.from_hostname(hostname, record_type, zone)
 
+    @staticmethod
+    def _api_exception(
+        message: str,
+        e: requests.RequestException,
+    ) -> APIException:
+        status = e.response.status_code if e.response is not None else None
+        retry_after = get_retry_after(e.response)
+        if retry_after is not None:
+            return RetryLaterException(f"{message}: {e}", retry_after, status)
+        return APIException(f"{message}: {e}", status)
+
+    async def fetch_records(self, domain: str) -> ZoneRecordIndex:
+        url = urljoin(
+            self._config.api_url,
+            f"dns-zones/{domain}/records",
+        )
+        records = []
+        page = 1
+        try:
+            with self._metrics.time("lookup"), span("lookup", zone=domain):
+                while True:
+                    resp = await self._request(
+                        "GET",
+                        url,
+                        headers={"X-Auth-Token": self._config.api_secret},
+                        params={
+                            "page": page,
+                            "page_size": self.RECORDS_PAGE_SIZE,
+                        },
+                    )
+                    resp.raise_for_status()
+                    with span("parse"):
+                        data = resp.json()
+                    records.extend(data["records"])
+                    if not data["records"] or len(records) >= data["total_count"]:
+                        break
+                    page += 1
         except requests.RequestException as e:
-            raise SudException(
-                "Cannot retrieve information for A "
-                f"record `{info.name}` from zone `{info.domain}`: {e}",
+            raise self._api_exception(
+                f"Cannot retrieve records of zone `{domain}`",
+                e,
             ) from e
 
-    def add_record(self, address: str) -> ARecordInfo:
-        info = ARecordInfo.from_hostname(self._config.hostname)
-        changes = [
-            {
-                "add": {
-                    "records": [
-                        {
-                            "name": info.get_dns_name(),
-                            "type": "A",
-                            "ttl": info.ttl,
-                            "data": address,
-                        },
-                    ],
-                },
-            },
-        ]
-        return self._update_zone(info, changes)
+        index = ZoneRecordIndex(domain)
+        index.load(records)
+        self._indexes[domain] = index
+        return index
 
-    def change_record(self, address: str) -> ARecordInfo:
-        info = ARecordInfo.from_hostname(self._config.hostname)
-        changes = [
-            {
-                "set": {
-                    "id_fields": {
+    async def get_record(self, info: ARecordInfo) -> ARecordInfo | None:
+        index = self._indexes.get(info.domain)
+        if index is None:
+            index = await self.fetch_records(info.domain)
+        return index.get(info.name, info.record_type)
+
+    @staticmethod
+    def add_change(info: ARecordInfo, address: str) -> dict:
+        return {
+            "add": {
+                "records": [
+                    {
                         "name": info.get_dns_name(),
-                        "type": "A",
+                        "type": info.record_type,
+                        "ttl": info.ttl,
+                        "data": address,
                     },
-                    "records": [
-                        {
-                            "name": info.get_dns_name(),
-                            "type": "A",
-                            "ttl": info.ttl,
-                            "data": address,
-                        },
-                    ],
+                ],
+            },
+        }
+
+    @staticmethod
+    def set_change(info: ARecordInfo, address: str) -> dict:
+        return {
+            "set": {
+                "id_fields": {
+                    "name": info.get_dns_name(),
+                    "type": info.record_type,
                 },
-            }
-        ]
-        return self._update_zone(info, changes)
+                "records": [
+                    {
+                        "name": info.get_dns_name(),
+                        "type": info.record_type,
+                        "ttl": info.ttl,
+                        "data": address,
+                    },
+                ],
+            },
+        }
 
     def run(self) -> None:
-        while True:
+        try:
+            self._check_hostnames()
+            asyncio.run(self.run_forever())
+        except KeyboardInterrupt:
+            logger.info("Exiting...")
+        finally:
+            self.close()
+
+    def sync(self, reconcile: bool = False) -> CycleResult:
+        try:
+            self._check_hostnames()
+            return asyncio.run(self.run_once(reconcile))
+        finally:
+            self.close()
+
+    def _check_hostnames(self) -> None:
+        if not self._config.hostnames:
+            raise SudException("No hostnames are configured")
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator[None]:
+        """
+        Start the tracer and the notifications for the duration of a run,
+        pending notifications are flushed on exit.
+        """
+        tracing = self._config.tracing
+        if tracing.enabled:
+            set_tracer(create_tracer(tracing.path, tracing.exporter))
+        if self._notifications:
+            await self._notifications.start()
+        try:
+            yield
+        finally:
+            if self._notifications:
+                await self._notifications.close(self._config.timeouts.notify)
+            if tracing.enabled:
+                get_tracer().close()
+                set_tracer(None)
+
+    async def run_once(self, reconcile: bool = False) -> CycleResult:
+        """
+        Check every hostname once, reading the records from the API if
+        `reconcile` is set even if they are known from the state.
+        """
+        hostnames = [
+            ARecordInfo.from_hostname(hostname).get_hostname()
+            for hostname in self._config.hostnames
+        ]
+        async with self.running():
+            result = await self.check(hostnames, reconcile=reconcile)
+        self.record_metrics(result)
+        return result
+
+    async def run_forever(self) -> None:
+        async with self.running():
+            metrics_server = await self.start_metrics_server()
+            monitor = self.start_monitor()
+            scheduler = self.create_scheduler()
             try:
-                self.update()
-            except KeyboardInterrupt:
-                logger.info("Exiting...")
-                return
-            except SudException as e:
-                logger.error(f"Error while updating: {e}")
-                time.sleep(self._config.frequency.seconds)
-                continue
-            logger.info(
-                f"Wait {humanize.naturaldelta(self._config.frequency)} "
-                "before next check ..zzZZ..",
+                while True:
+                    hostnames = scheduler.pop_due(time.monotonic())
+                    if hostnames:
+                        await self.run_cycle(scheduler, hostnames)
+                    delay = max(0.0, scheduler.next_run() - time.monotonic())
+                    logger.info(
+                        f"Wait {humanize.naturaldelta(delay)} "
+                        "before next check ..zzZZ..",
+                    )
+                    with span("sleep", seconds=delay):
+                        woken = await self.sleep(delay)
+                    if woken:
+                        scheduler.run_now(time.monotonic())
+            finally:
+                if monitor:
+                    monitor.stop()
+                if metrics_server:
+                    await metrics_server.stop()
+
+    def create_scheduler(self) -> Scheduler:
+        schedule = self._config.schedule
+        return Scheduler(
+            {
+                ARecordInfo.from_hostname(hostname).get_hostname(): (
+                    frequency.total_seconds()
+                )
+                for hostname, frequency in self._config.host_frequencies.items()
+            },
+            jitter=schedule.jitter,
+            max_backoff=schedule.max_backoff.total_seconds(),
+            boost_interval=schedule.boost_frequency.total_seconds(),
+            boost_duration=schedule.boost_duration.total_seconds(),
+            now=time.monotonic(),
+        )
+
+    async def run_cycle(
+        self,
+        scheduler: Scheduler,
+        hostnames: list[str],
+    ) -> CycleResult:
+        result = await self.check(hostnames)
+        now = time.monotonic()
+        for hostname in hostnames:
+            error = result.failed.get(hostname)
+            next_run = scheduler.reschedule(
+                hostname,
+                now,
+                success=error is None,
+                changed=hostname in result.changed,
+                retry_after=getattr(error, "retry_after", None),
             )
-            time.sleep(self._config.frequency.seconds)
-
-    def update(self) -> None:
-        previous_record = self.get_record()
-        detected_address = Updater.discover_address()
-        if not previous_record:
-            logger.info(f"No 'A' record found for {self._config.hostname}")
-            new_record = self.add_record(detected_address)
-            logger.info(
-                f"'A' record added for {self._config.hostname}: "
-                f"{new_record.address}",
+            self._metrics.failures.set(scheduler[hostname].failures, hostname=hostname)
+            self._metrics.next_check.set(next_run - now, hostname=hostname)
+        self.record_metrics(result)
+        return result
+
+    async def check(
+        self,
+        hostnames: list[str],
+        reconcile: bool = False,
+    ) -> CycleResult:
+        try:
+            with span("cycle", hostnames=hostnames):
+                return await run_phase(
+                    "cycle",
+                    self._config.timeouts.cycle,
+                    self.update(hostnames, reconcile=reconcile),
+                )
+        except SudException as e:
+            logger.error(f"Error while updating: {e}")
+            return CycleResult(hostnames, failed=dict.fromkeys(hostnames, e))
+
+    def record_metrics(self, result: CycleResult) -> None:
+        metrics = self._metrics
+        metrics.cycles.inc(result="failure" if result.failed else "success")
+        for hostname in result.changed:
+            metrics.changes.inc(hostname=hostname)
+        timestamp = time.time()
+        for hostname in result.hostnames:
+            if hostname not in result.failed:
+                metrics.last_success.set(timestamp, hostname=hostname)
+        # Hosts of a zone share the same error, count it once.
+        for error in {id(e): e for e in result.failed.values()}.values():
+            metrics.errors.inc(
+                type=type(error).__name__,
+                status=getattr(error, "status", None) or "",
             )
-            asyncio.run(self.notify(detected_address))
-            return
 
-        if previous_record.address == detected_address:
+    async def start_metrics_server(self) -> MetricsServer | None:
+        config = self._config.metrics
+        if not config.enabled:
+            return None
+        server = MetricsServer(self._metrics, config.host, config.port)
+        try:
+            await server.start()
+        except OSError as e:
+            logger.warning(f"Cannot serve metrics: {e}")
+            return None
+        return server
+
+    def start_monitor(self) -> NetlinkMonitor | None:
+        watch = self._config.watch
+        if not watch.enabled:
+            return None
+        monitor = NetlinkMonitor(self.wakeup, debounce=watch.debounce)
+        try:
+            monitor.start()
+        except SudException as e:
+            logger.warning(f"{e}, falling back to polling only")
+            return None
+        logger.info("Watching for network changes")
+        return monitor
+
+    def wakeup(self) -> None:
+        self._wakeup.set()
+
+    async def sleep(self, seconds: float) -> bool:
+        """
+        Sleep for `seconds`, return True if woken up by a network change.
+        """
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        logger.info("Network change detected, checking now")
+        self._wakeup.clear()
+        return True
+
+    async def update(
+        self,
+        hostnames: list[str] | None = None,
+        reconcile: bool = False,
+    ) -> CycleResult:
+        await self.resolve_zones()
+        zones, unresolved = self.get_zones(hostnames)
+        result = CycleResult(
+            list(
+                dict.fromkeys(
+                    [
+                        *(
+                            info.get_hostname()
+                            for infos in zones.values()
+                            for info in infos
+                        ),
+                        *unresolved,
+                    ],
+                ),
+            ),
+            failed=unresolved,
+        )
+        # The API is queried only for zones with hosts to reconcile or
+        # whose last known address is not in the state. Hosts are
+        # reconciled separately as they are checked in different cycles.
+        interval = self._config.reconcile_frequency
+        refresh = [
+            domain
+            for domain, infos in zones.items()
+            if any(
+                reconcile
+                or self._state.needs_reconciliation(info.get_hostname(), interval)
+                or self._state.get_address(info.get_hostname(), info.record_type)
+                is None
+                for info in infos
+            )
+        ]
+        if refresh:
             logger.info(
-                "No IP change detected for "
-                f"{self._config.hostname}: {previous_record.address}",
+                f"Reconciling records of {', '.join(refresh)} "
+                "with the Scaleway DNS API",
             )
-            return
 
-        logger.info(
-            f"IP address for {self._config.hostname} have changed: "
-            f"{previous_record.address} -> {detected_address}",
+        # The IPv4 and IPv6 addresses are discovered concurrently, along
+        # with the lookups.
+        record_types = sorted(
+            {info.record_type for infos in zones.values() for info in infos},
         )
-        updated_record = self.change_record(detected_address)
-        logger.info(
-            f"'A' record modified for {self._config.hostname}: "
-            f"{previous_record.address} -> {updated_record.address}",
+        timeouts = self._config.timeouts
+        results = await asyncio.gather(
+            *(
+                run_phase(
+                    "discovery",
+                    timeouts.discovery,
+                    self.discover_address(record_type),
+                )
+                for record_type in record_types
+            ),
+            *(
+                run_phase("lookup", timeouts.lookup, self.fetch_records(domain))
+                for domain in refresh
+            ),
+            return_exceptions=True,
         )
-        asyncio.run(
-            self.notify(detected_address, previous=previous_record.address),
+        discovered, results = results[: len(record_types)], results[len(record_types) :]
+        addresses, errors = self._get_addresses(record_types, discovered)
+        if self._suffixes and "AAAA" in addresses:
+            self.set_prefix(addresses["AAAA"])
+        for domain, infos in zones.items():
+            for info in infos:
+                if info.record_type in errors:
+                    result.failed[info.get_hostname()] = errors[info.record_type]
+            zones[domain] = [info for info in infos if info.record_type in addresses]
+
+        failed_zones = self._get_failed_zones(refresh, results)
+        domains = [
+            domain for domain in zones if domain not in failed_zones and zones[domain]
+        ]
+        results = await asyncio.gather(
+            *(
+                self.update_zone(
+                    domain,
+                    zones[domain],
+                    addresses,
+                    refresh=domain in refresh,
+                )
+                for domain in domains
+            ),
+            return_exceptions=True,
         )
+        failed_zones.update(self._get_failed_zones(domains, results))
+        for outcome in results:
+            if isinstance(outcome, tuple):
+                changed, failed = outcome
+                result.changed.extend(changed)
+                for hostname, error in failed.items():
+                    self._state.invalidate(hostname)
+                    result.failed[hostname] = error
+
+        for domain, error in failed_zones.items():
+            for info in zones[domain]:
+                self._state.invalidate(info.get_hostname())
+                result.failed[info.get_hostname()] = error
+
+        for domain in refresh:
+            for info in zones[domain]:
+                if info.get_hostname() not in result.failed:
+                    self._state.mark_reconciled(info.get_hostname())
+        self.store_state()
+        return result
+
+    def set_prefix(self, address: str) -> None:
+        prefix = get_prefix(address, self._config.ipv6_prefix_length)
+        if prefix != self._prefix:
+            logger.info(f"Delegated IPv6 prefix: {prefix}")
+            self._prefix = prefix
+
+    def get_address(self, info: ARecordInfo, addresses: dict[str, str]) -> str:
+        """
+        Return the address of a record: the discovered address of its type
+        or, for AAAA records of hosts with a suffix, the delegated prefix
+        followed by the suffix.
+        """
+        suffix = self._suffixes.get(info.get_hostname())
+        if info.record_type == "AAAA" and suffix is not None and self._prefix:
+            return compose_address(self._prefix, suffix)
+        return addresses[info.record_type]
 
-    async def notify(self, address: str, previous: str | None = None) -> None:
-        template = TG_UPDATED_MSG
-        data = {
-            "name": self._config.hostname,
-            "address": address,
-            "previous": previous,
+    @staticmethod
+    def _get_addresses(
+        record_types: list[str],
+        discovered: list,
+    ) -> tuple[dict[str, str], dict[str, SudException]]:
+        """
+        Split the discovered addresses by record type from the errors. A
+        failed discovery only fails the records of its type, unless all
+        of them fail.
+        """
+        addresses = {}
+        errors = {}
+        for record_type, address in zip(record_types, discovered, strict=True):
+            if isinstance(address, BaseException):
+                errors[record_type] = address
+            else:
+                addresses[record_type] = address
+        for error in errors.values():
+            if not addresses or not isinstance(error, SudException):
+                raise error
+        for record_type, error in errors.items():
+            logger.error(f"Error while discovering the {record_type} address: {error}")
+        return addresses, errors
+
+    @staticmethod
+    def _get_failed_zones(
+        domains: list[str],
+        results: list,
+    ) -> dict[str, SudException]:
+        failed_zones = {}
+        for domain, result in zip(domains, results, strict=True):
+            if isinstance(result, SudException):
+                logger.error(f"Error while updating zone {domain}: {result}")
+                failed_zones[domain] = result
+            elif isinstance(result, BaseException):
+                raise result
+        return failed_zones
+
+    def store_state(self) -> None:
+        try:
+            self._state.store()
+        except SudException as e:
+            logger.warning(str(e))
+
+    async def update_zone(
+        self,
+        domain: str,
+        infos: list[ARecordInfo],
+        addresses: dict[str, str],
+        refresh: bool = False,
+    ) -> tuple[list[str], dict[str, SudException]]:
+        """
+        Bring the records of a zone to the detected `addresses` by record
+        type, A and AAAA changes go out in the same PATCH. Return the
+        changed hostnames and the errors of the records the API rejected,
+        raise if no record could be written.
+        """
+        pending = []
+        for info in infos:
+            hostname = info.get_hostname()
+            address = self.get_address(info, addresses)
+            if refresh:
+                record = await self.get_record(info)
+                previous = record.address if record else None
+            else:
+                previous = self._state.get_address(hostname, info.record_type)
+
+            if not previous:
+                logger.info(f"No '{info.record_type}' record found for {hostname}")
+                pending.append((info, address, None))
+                continue
+
+            if previous == address:
+                logger.info(
+                    f"No IP change detected for {hostname}: {previous}",
+                )
+                continue
+
+            logger.info(
+                f"IP address for {hostname} have changed: {previous} -> {address}",
+            )
+            pending.append((info, address, previous))
+
+        errors = await self.write(domain, pending) if pending else []
+        if errors and all(errors):
+            raise errors[0]
+        failed = {
+            info.get_hostname(): error
+            for (info, *_), error in zip(pending, errors, strict=True)
+            if error
         }
-        if not previous:
-            template = TG_CREATED_MSG
-            del data["previous"]
-
-        if self._config.telegram:
-            async with telegram.Bot(self._config.telegram.token) as bot:
-                await bot.send_message(
-                    self._config.telegram.chat_id,
-                    template.format(**data),
-                    parse_mode=telegram.constants.ParseMode.HTML,
+
+        for info in infos:
+            if info.get_hostname() not in failed:
+                self._state.set_address(
+                    info.get_hostname(),
+                    self.get_address(info, addresses),
+                    info.record_type,
                 )
+        changed = [
+            info.get_hostname()
+            for info, *_ in pending
+            if info.get_hostname() not in failed
+        ]
+        return list(dict.fromkeys(changed)), failed
+
+    async def write(
+        self,
+        domain: str,
+        writes: list[Write],
+    ) -> list[SudException | None]:
+        """
+        Write records of a zone through its write queue, along with the
+        other records queued for the zone, and return the error of each.
+        """
+        return await self._writer.write(domain, writes)
 
-    def _update_zone(self, info, changes):
+    async def write_zone(self, domain: str, pending: list[Write]) -> None:
+        """
+        Write the `(info, address, previous)` records of a zone in a single
+        PATCH, adding those without a previous address, then notify.
+        """
+        changes = [
+            Updater.set_change(info, address)
+            if previous
+            else Updater.add_change(info, address)
+            for info, address, previous in pending
+        ]
+        await run_phase(
+            "write",
+            self._config.timeouts.write,
+            self._update_zone(domain, changes),
+        )
+
+        for info, address, previous in pending:
+            hostname = info.get_hostname()
+            self._state.set_address(hostname, address, info.record_type)
+            if previous:
+                logger.info(
+                    f"'{info.record_type}' record modified for {hostname}: "
+                    f"{previous} -> {address}",
+                )
+            else:
+                logger.info(
+                    f"'{info.record_type}' record added for {hostname}: {address}",
+                )
+            self.notify(
+                hostname,
+                address,
+                previous=previous,
+                record_type=info.record_type,
+            )
+
+    def notify(
+        self,
+        hostname: str,
+        address: str,
+        previous: str | None = None,
+        record_type: str = "A",
+    ) -> None:
+        if self._notifications:
+            self._notifications.put(
+                Notification(hostname, address, previous, record_type=record_type),
+            )
+
+    async def _update_zone(
+        self,
+        domain: str,
+        changes: list[dict],
+    ) -> list[ARecordInfo]:
         url = urljoin(
-            SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
+            self._config.api_url,
+            f"dns-zones/{domain}/records",
         )
 
+        # Without an index for this zone, ask for the whole zone so that
+        # the index can be built from the response instead of a new GET.
+        index = self._indexes.get(domain)
+        return_all_records = index is None
+
         try:
-            resp = requests.patch(
-                url,
-                headers={"X-Auth-Token": self._config.api_secret},
-                json={
-                    "changes": changes,
-                    "disallow_new_zone_creation": True,
-                    "return_all_records": False,
-                },
-            )
+            with self._metrics.time("write"), span("write", zone=domain):
+                resp = await self._request(
+                    "PATCH",
+                    url,
+                    headers={"X-Auth-Token": self._config.api_secret},
+                    json={
+                        "changes": changes,
+                        "disallow_new_zone_creation": True,
+                        "return_all_records": return_all_records,
+                    },
+                )
             resp.raise_for_status()
-            data = resp.json()
-            record = data["records"][0]
-            return ARecordInfo(
-                record["name"],
-                info.domain,
-                ttl=record["ttl"],
-                address=record["data"],
-            )
+            with span("parse"):
+                data = resp.json()
         except requests.RequestException as e:
-            raise SudException(
-                f"Cannot add A record for `{info.name}` "
-                f"to zone `{info.domain}`: {str(e)}",
+            raise self._api_exception(
+                f"Cannot update records of zone `{domain}`",
+                e,
             ) from e
+
+        if return_all_records:
+            index = ZoneRecordIndex(domain)
+            self._indexes[domain] = index
+        return index.update(data["records"])
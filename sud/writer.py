@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sud.exceptions import APIException, SudException
+from sud.records import ARecordInfo
+
+logger = logging.getLogger(__name__)
+
+# A record to write: (info, address, previous address or None to add it).
+Write = tuple[ARecordInfo, str, str | None]
+
+
+@dataclass
+class _Entry:
+    write: Write
+    future: asyncio.Future
+
+
+def retrieve_exception(future: asyncio.Future) -> None:
+    """
+    Mark the exception of a shared future as retrieved, the callers that
+    waited for it may be gone when it fails.
+    """
+    if not future.cancelled():
+        future.exception()
+
+
+class ZoneWriter:
+    """
+    Write the records of each zone through an ordered queue: the records
+    queued while a write of the zone is in flight are merged and sent by
+    the next one, in a single batch. A record queued while it is itself in
+    flight is modified from the address being written. Zones are written
+    in parallel, at most `max_zones` at a time.
+
+    A batch rejected by the API is split in halves that are retried, so
+    that only the invalid records fail.
+    """
+
+    REJECTED_STATUSES = (400, 409, 422)
+
+    def __init__(
+        self,
+        send: Callable[[str, list[Write]], Awaitable[None]],
+        max_zones: int,
+    ):
+        self._send = send
+        self._semaphore = asyncio.Semaphore(max_zones)
+        self._queues: dict[str, dict[tuple[str, str], _Entry]] = {}
+        self._inflight: dict[str, dict[tuple[str, str], _Entry]] = {}
+        self._flushing: dict[str, asyncio.Task] = {}
+
+    async def write(
+        self,
+        domain: str,
+        writes: list[Write],
+    ) -> list[SudException | None]:
+        """
+        Queue records of a zone, wait for them to be written and return
+        the error of each record, None if it was written.
+        """
+        futures = [self._queue(domain, write) for write in writes]
+        if domain not in self._flushing:
+            self._flushing[domain] = asyncio.create_task(self._flush(domain))
+        results = await asyncio.gather(
+            *(asyncio.shield(future) for future in futures),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(
+                result,
+                SudException,
+            ):
+                raise result
+        return results
+
+    def _queue(self, domain: str, write: Write) -> asyncio.Future:
+        queue = self._queues.setdefault(domain, {})
+        info, address, previous = write
+        key = (info.name, info.record_type)
+        entry = queue.get(key)
+        if entry is not None:
+            # Written once, with the latest address.
+            entry.write = (info, address, entry.write[2])
+            return entry.future
+        inflight = self._inflight.get(domain, {}).get(key)
+        if inflight is not None:
+            # Written once the in-flight write has set the record.
+            previous = inflight.write[1]
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(retrieve_exception)
+        queue[key] = _Entry((info, address, previous), future)
+        return future
+
+    async def _flush(self, domain: str) -> None:
+        try:
+            while domain in self._queues:
+                entries = self._inflight[domain] = self._queues.pop(domain)
+                async with self._semaphore:
+                    await self._send_batch(domain, list(entries.values()))
+                del self._inflight[domain]
+        finally:
+            del self._flushing[domain]
+            # Cancelled, e.g. on exit: the writes left are not sent.
+            for queue in (self._inflight.pop(domain, {}), self._queues.pop(domain, {})):
+                for entry in queue.values():
+                    entry.future.cancel()
+
+    async def _send_batch(self, domain: str, entries: list[_Entry]) -> None:
+        try:
+            await self._send(domain, [entry.write for entry in entries])
+        except APIException as e:
+            if e.status in self.REJECTED_STATUSES and len(entries) > 1:
+                logger.warning(
+                    f"{len(entries)} changes rejected for zone {domain}, "
+                    f"retrying them in two batches: {e}",
+                )
+                middle = len(entries) // 2
+                await self._send_batch(domain, entries[:middle])
+                await self._send_batch(domain, entries[middle:])
+                return
+            self._fail(domain, entries, e)
+        except Exception as e:
+            self._fail(domain, entries, e)
+        else:
+            for entry in entries:
+                entry.future.set_result(None)
+
+    def _fail(self, domain: str, entries: list[_Entry], error: Exception) -> None:
+        queue = self._queues.get(domain, {})
+        for entry in entries:
+            entry.future.set_exception(error)
+            info, _, previous = entry.write
+            queued = queue.get((info.name, info.record_type))
+            if queued is not None:
+                # The record was not written, it still has its previous address.
+                queued.write = (*queued.write[:2], previous)
@@ -1,7 +1,11 @@
+import asyncio
+
 import pytest
+import pytest_asyncio
 import responses
 
 from sud.config import Config
+from sud.fake import FakeScalewayAPI
 
 
 @pytest.fixture()
@@ -61,3 +65,64 @@ def config(mocker, config_file_factory, telegram_config_factory):
     c = Config(mocker.MagicMock())
     c._config = config_file
     return c
+
+
+@pytest.fixture()
+def fake_api():
+    """
+    A local Scaleway DNS API and checkip stand-in.
+    """
+    with FakeScalewayAPI(api_secret="my-secret-key", seed=0) as api:
+        yield api
+
+
+@pytest.fixture()
+def fake_api_config(mocker, config_file_factory, fake_api):
+    """
+    A configuration that talks to `fake_api` only.
+    """
+    c = Config(mocker.MagicMock())
+    c._config = {
+        **config_file_factory(),
+        "api_url": fake_api.api_url,
+        "discovery": {"providers": [fake_api.checkip_url]},
+        "discovery6": {"providers": [fake_api.checkip6_url]},
+    }
+    return c
+
+
+class FakeUDPServer(asyncio.DatagramProtocol):
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests.append(data)
+        for response in self.handler(data):
+            self.transport.sendto(response, addr)
+
+
+@pytest_asyncio.fixture()
+async def udp_server():
+    """
+    Start local UDP servers that answer each request with the
+    datagrams returned by `handler(request)`.
+    """
+    transports = []
+
+    async def _start(handler):
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: FakeUDPServer(handler),
+            local_addr=("127.0.0.1", 0),
+        )
+        transports.append(transport)
+        return transport.get_extra_info("sockname")[1], protocol
+
+    yield _start
+
+    for transport in transports:
+        transport.close()
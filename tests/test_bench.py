@@ -0,0 +1,66 @@
+import pytest
+
+from sud.bench import (
+    get_hostnames,
+    run_benchmark,
+    run_benchmarks,
+    run_gateway_benchmark,
+)
+
+
+def test_get_hostnames():
+    assert get_hostnames(3, 2) == [
+        "host0.zone0.test",
+        "host1.zone1.test",
+        "host2.zone0.test",
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_run_benchmark():
+    result = await run_benchmark(20, zones=4, cycles=2)
+
+    assert result.hosts == 20
+    assert result.zones == 4
+    assert result.cycles == 2
+    assert result.failed == 0
+    # One discovery and one write per zone.
+    assert result.requests_per_cycle == 5
+    assert result.cycles_per_second > 0
+    assert 0 < result.p50_cycle_seconds <= result.p99_cycle_seconds
+    assert result.cpu_seconds_per_host > 0
+    assert result.rss_bytes_per_host >= 0
+
+
+@pytest.mark.asyncio()
+async def test_run_benchmark_no_change():
+    result = await run_benchmark(10, cycles=2, change=False)
+
+    assert result.zones == 1
+    # Nothing to write: only the discovery.
+    assert result.requests_per_cycle == 1
+
+
+def test_run_benchmarks(mocker):
+    m_run = mocker.patch(
+        "sud.bench.run_benchmark",
+        new=mocker.Mock(side_effect=lambda n, **_: n),
+    )
+    mocker.patch("sud.bench.asyncio.run", side_effect=lambda n: n)
+
+    assert run_benchmarks([100, 1], cycles=3) == [1, 100]
+    m_run.assert_called_with(100, cycles=3, latency=0.0, change=True)
+
+
+@pytest.mark.asyncio()
+async def test_run_gateway_benchmark():
+    result = await run_gateway_benchmark(20, zones=2, rounds=2, concurrency=5)
+
+    assert result.clients == 20
+    assert result.zones == 2
+    assert result.rounds == 2
+    assert result.failed == 0
+    assert result.requests_per_second > 0
+    assert 0 < result.p50_request_seconds <= result.p99_request_seconds
+    # Concurrent updates of a zone share a write.
+    assert 0 < result.patches_per_round < 20
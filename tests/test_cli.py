@@ -1,11 +1,16 @@
+import json
+from dataclasses import asdict
 from datetime import timedelta
 from pathlib import Path
 
+import pytest
 from typer.testing import CliRunner
 
+from sud.bench import BenchResult, GatewayBenchResult
 from sud.cli import app
 from sud.config import Config, TelegramConfig
-from sud.updater import Updater
+from sud.exceptions import SudException
+from sud.updater import CycleResult
 
 runner = CliRunner()
 
@@ -19,12 +24,39 @@ def test_version(mocker):
 
 def test_run(mocker):
     m_cfg_ctor = mocker.patch("sud.cli.Config")
-    m_run = mocker.patch.object(Updater, "run")
+    m_updater_ctor = mocker.patch("sud.updater.Updater")
 
     result = runner.invoke(app, ["--config-file", "/my/config.yml", "run"])
     assert result.exit_code == 0
     m_cfg_ctor.assert_called_once_with(Path("/my/config.yml"))
-    m_run.assert_called_once()
+    m_updater_ctor.assert_called_once_with(m_cfg_ctor.return_value)
+    m_updater_ctor.return_value.run.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    ("changed", "failed", "exit_code"),
+    [
+        ([], [], 0),
+        (["a.example.com"], [], 3),
+        (["a.example.com"], ["b.example.com"], 4),
+        ([], ["a.example.com", "b.example.com"], 1),
+    ],
+)
+def test_sync(mocker, changed, failed, exit_code):
+    mocker.patch.object(Config, "load")
+    m_updater_ctor = mocker.patch("sud.updater.Updater")
+    result = CycleResult(
+        ["a.example.com", "b.example.com"],
+        changed=changed,
+        failed={hostname: SudException("boom") for hostname in failed},
+    )
+    m_updater_ctor.return_value.sync.return_value = result
+
+    cli_result = runner.invoke(app, ["sync", "--reconcile"])
+
+    assert cli_result.exit_code == exit_code
+    assert json.loads(cli_result.stdout) == result.to_dict()
+    m_updater_ctor.return_value.sync.assert_called_once_with(reconcile=True)
 
 
 def test_init(mocker):
@@ -112,3 +144,110 @@ def test_init_invalid_frequency(mocker):
     assert result.exit_code != 0
     assert "Minimum frequency is once per" in result.stdout
     assert "minutes (60 seconds)." in result.stdout
+
+
+def test_init_multiple_hostnames(mocker):
+    mocker.patch.object(Config, "load")
+    mocker.patch.object(Config, "store")
+
+    config = Config("/etc/sud/sud-config.yml")
+
+    mocker.patch("sud.cli.Config", return_value=config)
+
+    result = runner.invoke(
+        app,
+        [
+            "init",
+            "--hostname",
+            "a.host.name",
+            "--hostname",
+            "b.other.name",
+            "--api-secret",
+            "super-duper-secret",
+        ],
+    )
+    assert result.exit_code == 0
+    assert config.hostnames == ["a.host.name", "b.other.name"]
+
+
+def test_trace_summarize(mocker, tmp_path):
+    m_cfg_load = mocker.patch.object(Config, "load")
+    trace_file = tmp_path / "trace.jsonl"
+    trace_file.write_text(
+        json.dumps({"name": "lookup", "duration": 0.25})
+        + "\n"
+        + json.dumps({"name": "lookup", "duration": 0.5, "error": "boom"})
+        + "\n",
+    )
+
+    result = runner.invoke(app, ["trace", "summarize", str(trace_file)])
+
+    assert result.exit_code == 0
+    m_cfg_load.assert_not_called()
+    row = next(line for line in result.stdout.splitlines() if "lookup" in line)
+    assert "250.0 ms" in row
+    assert "500.0 ms" in row
+
+
+def test_trace_summarize_missing_file(mocker, tmp_path):
+    mocker.patch.object(Config, "load")
+
+    result = runner.invoke(app, ["trace", "summarize", str(tmp_path / "x.jsonl")])
+
+    assert result.exit_code == 1
+    assert "Cannot read the trace file" in result.stdout
+
+
+def test_bench(mocker, tmp_path):
+    m_cfg_load = mocker.patch.object(Config, "load")
+    result = BenchResult(1, 1, 2, 100.0, 0.01, 0.02, 2.0, 0.001, 4096.0, 0)
+    m_run = mocker.patch("sud.bench.run_benchmarks", return_value=[result])
+
+    cli_result = runner.invoke(app, ["bench", "-n", "1", "--cycles", "2"])
+
+    assert cli_result.exit_code == 0
+    m_cfg_load.assert_not_called()
+    m_run.assert_called_once_with([1], cycles=2, latency=0.0, change=True)
+    assert json.loads(cli_result.stdout) == [asdict(result)]
+
+    output = tmp_path / "bench.json"
+    cli_result = runner.invoke(app, ["bench", "--no-change", "-o", str(output)])
+
+    assert cli_result.exit_code == 0
+    m_run.assert_called_with([1, 100, 10000], cycles=5, latency=0.0, change=False)
+    assert json.loads(output.read_text()) == [asdict(result)]
+
+
+def test_bench_gateway(mocker):
+    m_cfg_load = mocker.patch.object(Config, "load")
+    result = GatewayBenchResult(10, 1, 2, 500.0, 0.01, 0.02, 3.0, 0)
+    m_run = mocker.patch(
+        "sud.bench.run_gateway_benchmark",
+        new=mocker.AsyncMock(return_value=result),
+    )
+
+    cli_result = runner.invoke(app, ["bench-gateway", "-n", "10", "--rounds", "2"])
+
+    assert cli_result.exit_code == 0
+    m_cfg_load.assert_not_called()
+    m_run.assert_awaited_once_with(10, rounds=2, concurrency=256, latency=0.0)
+    assert json.loads(cli_result.stdout) == [asdict(result)]
+
+
+def test_serve(mocker):
+    mocker.patch.object(Config, "load")
+    m_serve = mocker.patch("sud.gateway.serve")
+
+    result = runner.invoke(app, ["serve"])
+
+    assert result.exit_code == 0
+    m_serve.assert_called_once()
+
+
+def test_bench_output_error(mocker, tmp_path):
+    mocker.patch("sud.bench.run_benchmarks", return_value=[])
+
+    result = runner.invoke(app, ["bench", "-o", str(tmp_path / "x" / "bench.json")])
+
+    assert result.exit_code == 1
+    assert "Cannot write the benchmark results" in result.stdout
@@ -1,9 +1,26 @@
+import ipaddress
 from datetime import timedelta
 
 import pytest
 import yaml
 
-from sud.config import Config, TelegramConfig
+from sud.config import (
+    Config,
+    DiscoveryConfig,
+    GatewayUser,
+    MetricsConfig,
+    ScheduleConfig,
+    ServeConfig,
+    TelegramConfig,
+    TimeoutConfig,
+    TracingConfig,
+    WatchConfig,
+)
+from sud.constants import (
+    CHECK_IP_ADDRESS,
+    CHECK_IPV6_ADDRESS,
+    SCALEWAY_API_BASE_URL,
+)
 from sud.exceptions import SudException
 
 
@@ -134,3 +151,338 @@ def test_store_exception(mocker):
         c.store()
 
     assert raised.value.message == ("Cannot save the SUD configuration file: msg")
+
+
+def test_hostnames(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.hostnames == ["my.host.name"]
+
+    c.hostnames = ["a.host.name", "b.other.name"]
+    assert c.hostnames == ["a.host.name", "b.other.name"]
+    assert c._config["hostnames"] == ["a.host.name", "b.other.name"]
+
+    c._config["hostnames"] = ["a.host.name", {"name": "b.other.name"}]
+    assert c.hostnames == ["a.host.name", "b.other.name"]
+
+
+def test_no_hostnames():
+    c = Config("config.yml", {"serve": {"users": {"nas": {"password": "secret"}}}})
+
+    assert c.hostnames == []
+    assert c.host_frequencies == {}
+    assert c.host_record_types == {}
+
+
+def test_host_frequencies(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.host_frequencies == {"my.host.name": timedelta(minutes=5)}
+
+    c._config["frequency"] = 600
+    c._config["hostnames"] = [
+        "a.host.name",
+        {"name": "b.host.name", "frequency": 60},
+        {"name": "c.other.name"},
+    ]
+    assert c.host_frequencies == {
+        "a.host.name": timedelta(minutes=10),
+        "b.host.name": timedelta(minutes=1),
+        "c.other.name": timedelta(minutes=10),
+    }
+
+
+def test_schedule(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.schedule == ScheduleConfig()
+
+    c._config["schedule"] = {
+        "jitter": 0,
+        "max_backoff": 7200,
+        "boost_frequency": 30,
+        "boost_duration": 600,
+    }
+    assert c.schedule == ScheduleConfig(
+        jitter=0.0,
+        max_backoff=timedelta(hours=2),
+        boost_frequency=timedelta(seconds=30),
+        boost_duration=timedelta(minutes=10),
+    )
+
+
+def test_http_settings(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.pool_size == Config.DEFAULT_POOL_SIZE
+    assert c.retries == Config.DEFAULT_RETRIES
+
+    c._config["http"] = {"pool_size": 32, "retries": 0}
+    assert c.pool_size == 32
+    assert c.retries == 0
+
+
+def test_state_settings(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.state_file is None
+    assert c.reconcile_frequency == timedelta(
+        seconds=Config.DEFAULT_RECONCILE_FREQUENCY,
+    )
+
+    c._config["state_file"] = "/var/lib/sud/state.json"
+    c._config["reconcile_frequency"] = 86400
+    assert c.state_file == "/var/lib/sud/state.json"
+    assert c.reconcile_frequency == timedelta(days=1)
+
+
+def test_zones_ttl(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.zones_ttl == timedelta(seconds=Config.DEFAULT_ZONES_TTL)
+
+    c._config["zones_ttl"] = 600
+    assert c.zones_ttl == timedelta(minutes=10)
+
+
+def test_concurrency(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.concurrency == Config.DEFAULT_CONCURRENCY
+
+    c._config["concurrency"] = 50
+    assert c.concurrency == 50
+
+
+def test_write_concurrency(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.write_concurrency == Config.DEFAULT_WRITE_CONCURRENCY
+
+    c._config["write_concurrency"] = 8
+    assert c.write_concurrency == 8
+
+    c._config["write_concurrency"] = 0
+    with pytest.raises(SudException) as raised:
+        c.write_concurrency  # noqa: B018
+
+    assert raised.value.message == "Invalid write concurrency: 0"
+
+
+def test_api_url(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.api_url == SCALEWAY_API_BASE_URL
+
+    c._config["api_url"] = "http://127.0.0.1:8080/domain/v2beta1/"
+    assert c.api_url == "http://127.0.0.1:8080/domain/v2beta1/"
+
+
+def test_discovery(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.discovery == DiscoveryConfig()
+    assert c.discovery.providers == [{"type": "http", "url": CHECK_IP_ADDRESS}]
+
+    c._config["discovery"] = {
+        "strategy": "quorum",
+        "quorum": 2,
+        "providers": [
+            "https://a.example.com/",
+            {"type": "http", "url": "https://b.example.com/", "name": "b"},
+        ],
+    }
+    assert c.discovery == DiscoveryConfig(
+        strategy="quorum",
+        quorum=2,
+        providers=[
+            {"type": "http", "url": "https://a.example.com/"},
+            {"type": "http", "url": "https://b.example.com/", "name": "b"},
+        ],
+    )
+
+
+def test_discovery6(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.discovery6.providers == [{"type": "http", "url": CHECK_IPV6_ADDRESS}]
+
+    c._config["discovery6"] = {"providers": [{"type": "dns"}], "strategy": "fallback"}
+    assert c.discovery6 == DiscoveryConfig(
+        strategy="fallback",
+        providers=[{"type": "dns"}],
+    )
+
+
+def test_record_types(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.record_types == ["A"]
+    assert c.host_record_types == {"my.host.name": ["A"]}
+
+    c._config["record_types"] = ["A", "AAAA"]
+    c._config["hostnames"] = [
+        "a.example.com",
+        {"name": "b.example.com", "record_types": "AAAA"},
+        {"name": "c.example.com", "frequency": 60},
+    ]
+    assert c.host_record_types == {
+        "a.example.com": ["A", "AAAA"],
+        "b.example.com": ["AAAA"],
+        "c.example.com": ["A", "AAAA"],
+    }
+
+
+@pytest.mark.parametrize(
+    ("record_types", "message"),
+    [
+        (["A", "MX"], "Invalid record type: MX"),
+        ([], "At least one record type is required"),
+    ],
+)
+def test_record_types_invalid(config_file_factory, record_types, message):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    c._config["record_types"] = record_types
+
+    with pytest.raises(SudException) as raised:
+        c.host_record_types  # noqa: B018
+
+    assert raised.value.message == message
+
+
+def test_ipv6_suffixes(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.ipv6_prefix_length == 64
+    assert c.host_ipv6_suffixes == {}
+
+    c._config["ipv6_prefix_length"] = 56
+    c._config["hostnames"] = [
+        "a.example.com",
+        {"name": "b.example.com", "ipv6_suffix": "::12:0:0:0:5"},
+    ]
+    assert c.host_ipv6_suffixes == {
+        "b.example.com": ipaddress.IPv6Address("::12:0:0:0:5"),
+    }
+
+
+@pytest.mark.parametrize(
+    ("prefix_length", "suffix", "message"),
+    [
+        (0, "::1", "Invalid IPv6 prefix length: 0"),
+        (128, "::1", "Invalid IPv6 prefix length: 128"),
+        (64, "::1:0:0:0:1", "IPv6 suffix ::1:0:0:0:1 overlaps the /64 prefix"),
+    ],
+)
+def test_ipv6_suffixes_invalid(config_file_factory, prefix_length, suffix, message):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    c._config["ipv6_prefix_length"] = prefix_length
+    c._config["hostnames"] = [{"name": "a.example.com", "ipv6_suffix": suffix}]
+
+    with pytest.raises(SudException) as raised:
+        c.host_ipv6_suffixes  # noqa: B018
+
+    assert raised.value.message == message
+
+
+def test_ipv6_suffix_not_an_address(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    c._config["hostnames"] = [{"name": "a.example.com", "ipv6_suffix": "nope"}]
+
+    with pytest.raises(SudException) as raised:
+        c.host_ipv6_suffixes  # noqa: B018
+
+    assert raised.value.message.startswith("Invalid IPv6 suffix nope: ")
+
+
+def test_serve(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.serve == ServeConfig()
+
+    c._config["serve"] = {
+        "port": 8080,
+        "users": {
+            "router": {"password": "secret"},
+            "nas": {"password": "other", "hostnames": "nas.example.com"},
+        },
+    }
+    assert c.serve == ServeConfig(
+        port=8080,
+        users={
+            "router": GatewayUser("secret"),
+            "nas": GatewayUser("other", ["nas.example.com"]),
+        },
+    )
+
+    c._config["serve"]["users"]["nas"] = {"hostnames": ["nas.example.com"]}
+    with pytest.raises(SudException) as raised:
+        c.serve  # noqa: B018
+
+    assert raised.value.message == "Gateway user nas has no password"
+
+
+def test_watch(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.watch == WatchConfig()
+
+    c._config["watch"] = {"enabled": True, "debounce": 5}
+    assert c.watch == WatchConfig(enabled=True, debounce=5.0)
+
+
+def test_timeouts(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.timeouts == TimeoutConfig()
+
+    c._config["timeouts"] = {"cycle": 60, "connect": 2, "notify": 5}
+    assert c.timeouts == TimeoutConfig(cycle=60.0, connect=2.0, notify=5.0)
+
+
+def test_notification_window(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.notification_window == Config.DEFAULT_NOTIFICATION_WINDOW
+
+    c._config["notifications"] = {"window": 30}
+    assert c.notification_window == 30.0
+
+
+def test_notifiers(config_file_factory, telegram_config_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.notifiers == []
+
+    c._config["notifications"] = {
+        "window": 10,
+        "syslog": {"facility": "daemon"},
+        "telegram": telegram_config_factory(),
+        "webhook": {"url": "https://hooks.example.com/"},
+    }
+    assert c.notifiers == [
+        {"type": "telegram", **telegram_config_factory()},
+        {"type": "webhook", "url": "https://hooks.example.com/"},
+        {"type": "syslog", "facility": "daemon"},
+    ]
+
+
+def test_metrics(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.metrics == MetricsConfig()
+
+    c._config["metrics"] = {"enabled": True, "host": "0.0.0.0", "port": "9100"}
+    assert c.metrics == MetricsConfig(enabled=True, host="0.0.0.0", port=9100)
+
+
+def test_tracing(config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert c.tracing == TracingConfig()
+
+    c._config["tracing"] = {"enabled": True, "path": "/var/log/sud/trace.jsonl"}
+    assert c.tracing == TracingConfig(enabled=True, path="/var/log/sud/trace.jsonl")
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from sud.deadline import deadline, get_remaining, get_timeout, run_phase
+from sud.exceptions import DeadlineExceeded
+
+
+def test_deadline():
+    assert get_remaining() is None
+    with deadline(10):
+        assert 9 < get_remaining() <= 10
+        with deadline(60):
+            assert get_remaining() <= 10
+        with deadline(1):
+            assert get_remaining() <= 1
+    assert get_remaining() is None
+
+
+def test_get_timeout():
+    assert get_timeout(5, 30) == (5, 30)
+    with deadline(10):
+        connect, read = get_timeout(5, 30)
+        assert connect == 5
+        assert 9 < read <= 10
+    with deadline(0), pytest.raises(DeadlineExceeded):
+        get_timeout(5, 30)
+
+
+@pytest.mark.asyncio()
+async def test_run_phase():
+    async def remaining():
+        return get_remaining()
+
+    assert await run_phase("test", 10, remaining()) <= 10
+    with deadline(1):
+        assert await run_phase("test", 10, remaining()) <= 1
+
+
+@pytest.mark.asyncio()
+async def test_run_phase_timeout():
+    cancelled = asyncio.Event()
+
+    async def stuck():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as raised:
+        await run_phase("test", 0.05, stuck())
+
+    assert time.monotonic() - start < 1
+    assert cancelled.is_set()
+    assert raised.value.message == "The test phase exceeded its budget of 0.05s"
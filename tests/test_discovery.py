@@ -0,0 +1,440 @@
+import asyncio
+
+import pytest
+from requests import RequestException
+
+from sud.config import DiscoveryConfig
+from sud.discovery import (
+    AddressDiscoverer,
+    DiscoveryProvider,
+    DNSProvider,
+    HTTPProvider,
+    ProviderStats,
+    create_discoverer,
+    create_provider,
+)
+from sud.exceptions import SudException
+
+
+class FakeProvider(DiscoveryProvider):
+    def __init__(self, name, address=None, delay=0, error=None, version=4):
+        super().__init__(name, version)
+        self.address = address
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def discover(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.address
+
+
+async def wait_background():
+    # Let the queries left running in background by the discoverer end.
+    current = asyncio.current_task()
+    while any(task is not current for task in asyncio.all_tasks()):
+        await asyncio.sleep(0.01)
+
+
+def test_provider_stats():
+    stats = ProviderStats()
+    stats.record(1.0)
+    assert stats.latency == 1.0
+    assert stats.error_score == 0
+
+    stats.record(2.0, error=True)
+    assert stats.requests == 2
+    assert stats.errors == 1
+    assert stats.latency == pytest.approx(1.3)
+    assert stats.error_score == pytest.approx(0.3)
+
+
+@pytest.mark.asyncio()
+async def test_provider_query():
+    provider = FakeProvider("fake", "1.2.3.4")
+    assert await provider.query() == "1.2.3.4"
+    assert provider.stats.requests == 1
+    assert provider.stats.errors == 0
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize(
+    ("address", "error", "message"),
+    [
+        ("not-an-ip", None, "fake: Expected 4 octets in 'not-an-ip'"),
+        (None, SudException("boom"), "fake: boom"),
+    ],
+)
+async def test_provider_query_error(address, error, message):
+    provider = FakeProvider("fake", address, error=error)
+
+    with pytest.raises(SudException) as raised:
+        await provider.query()
+
+    assert raised.value.message.startswith(message)
+    assert provider.stats.errors == 1
+
+
+@pytest.mark.asyncio()
+async def test_provider_query_ipv6():
+    provider = FakeProvider("fake", "2001:DB8:0:0::1", version=6)
+
+    # Addresses are normalized so that they compare with the records.
+    assert await provider.query() == "2001:db8::1"
+
+    provider = FakeProvider("fake", "1.2.3.4", version=6)
+    with pytest.raises(SudException) as raised:
+        await provider.query()
+
+    assert raised.value.message.startswith("fake: ")
+    assert "1.2.3.4" in raised.value.message
+
+    provider = FakeProvider("fake", "2001:db8::1")
+    with pytest.raises(SudException):
+        await provider.query()
+
+
+@pytest.mark.asyncio()
+async def test_discover_ipv6_error():
+    discoverer = AddressDiscoverer(
+        [FakeProvider("a", error=SudException("down"), version=6)],
+        version=6,
+    )
+
+    with pytest.raises(SudException) as raised:
+        await discoverer.discover()
+
+    assert raised.value.message == (
+        "Cannot determine current public IPv6 address: a: down."
+    )
+
+
+@pytest.mark.asyncio()
+async def test_http_provider(mocker):
+    response = mocker.MagicMock(text="1.2.3.4\n")
+    request = mocker.AsyncMock(return_value=response)
+    provider = HTTPProvider("https://ip.example.com/", request)
+
+    assert provider.name == "https://ip.example.com/"
+    assert await provider.discover() == "1.2.3.4"
+    request.assert_awaited_once_with("GET", "https://ip.example.com/")
+
+
+@pytest.mark.asyncio()
+async def test_http_provider_error(mocker):
+    request = mocker.AsyncMock(side_effect=RequestException("msg"))
+    provider = HTTPProvider("https://ip.example.com/", request, name="example")
+
+    assert provider.name == "example"
+    with pytest.raises(SudException) as raised:
+        await provider.discover()
+
+    assert raised.value.message == "msg"
+
+
+@pytest.mark.asyncio()
+async def test_discover_first_wins():
+    slow = FakeProvider("slow", "5.6.7.8", delay=0.2)
+    fast = FakeProvider("fast", "1.2.3.4")
+    discoverer = AddressDiscoverer([slow, fast])
+
+    assert await discoverer.discover() == "1.2.3.4"
+    # The loser completes in background to measure its real latency.
+    assert slow.stats.requests == 0
+    await wait_background()
+    assert slow.stats.requests == 1
+    assert slow.stats.latency >= 0.2
+
+
+@pytest.mark.asyncio()
+async def test_discover_demotes_slow_provider():
+    slow = FakeProvider("slow", "1.2.3.4", delay=0.2)
+    fast = FakeProvider("fast", "1.2.3.4", delay=0.01)
+    discoverer = AddressDiscoverer([slow, fast])
+
+    assert await discoverer.discover() == "1.2.3.4"
+    await wait_background()
+
+    assert discoverer.is_demoted(slow) is True
+    assert discoverer.is_demoted(fast) is False
+
+    for _ in range(3):
+        assert await discoverer.discover() == "1.2.3.4"
+        await wait_background()
+    assert slow.calls == 1
+
+
+@pytest.mark.asyncio()
+async def test_discover_probes_demoted_provider(mocker):
+    flaky = FakeProvider("flaky", error=SudException("boom"))
+    stable = FakeProvider("stable", "1.2.3.4")
+    discoverer = AddressDiscoverer([flaky, stable])
+
+    for _ in range(2):
+        await discoverer.discover()
+        await wait_background()
+
+    assert discoverer.is_demoted(flaky) is True
+    calls = flaky.calls
+    await discoverer.discover()
+    await wait_background()
+    assert flaky.calls == calls
+
+    # Once the probe interval elapses the demoted provider is probed again
+    # and promoted when it recovers.
+    mocker.patch.object(AddressDiscoverer, "PROBE_INTERVAL", 0)
+    flaky.error = None
+    flaky.address = "1.2.3.4"
+    await discoverer.discover()
+    await wait_background()
+
+    assert flaky.calls == calls + 1
+    assert discoverer.is_demoted(flaky) is False
+
+
+@pytest.mark.asyncio()
+async def test_discoverer_close():
+    slow = FakeProvider("slow", "5.6.7.8", delay=10)
+    fast = FakeProvider("fast", "1.2.3.4")
+    discoverer = AddressDiscoverer([slow, fast])
+
+    await discoverer.discover()
+    discoverer.close()
+    await wait_background()
+
+    assert slow.stats.requests == 0
+
+
+@pytest.mark.asyncio()
+async def test_discover_first_skips_errors():
+    broken = FakeProvider("broken", error=SudException("boom"))
+    working = FakeProvider("working", "1.2.3.4", delay=0.01)
+    discoverer = AddressDiscoverer([broken, working])
+
+    assert await discoverer.discover() == "1.2.3.4"
+
+
+@pytest.mark.asyncio()
+async def test_discover_all_fail():
+    discoverer = AddressDiscoverer(
+        [
+            FakeProvider("a", delay=0.01, error=SudException("boom")),
+            FakeProvider("b", "invalid"),
+        ],
+    )
+
+    with pytest.raises(SudException) as raised:
+        await discoverer.discover()
+
+    # In the order of the providers, whichever fails first.
+    assert raised.value.message == (
+        "Cannot determine current public ip address: "
+        "a: boom; b: Expected 4 octets in 'invalid'."
+    )
+
+
+@pytest.mark.asyncio()
+async def test_discover_unexpected_error():
+    discoverer = AddressDiscoverer([FakeProvider("a", error=RuntimeError("bug"))])
+
+    with pytest.raises(RuntimeError):
+        await discoverer.discover()
+
+
+@pytest.mark.asyncio()
+async def test_discover_quorum():
+    liar = FakeProvider("liar", "6.6.6.6")
+    honest = [
+        FakeProvider("a", "1.2.3.4", delay=0.01),
+        FakeProvider("b", "1.2.3.4", delay=0.02),
+    ]
+    discoverer = AddressDiscoverer([liar, *honest], strategy="quorum", quorum=2)
+
+    assert await discoverer.discover() == "1.2.3.4"
+
+
+@pytest.mark.asyncio()
+async def test_discover_no_quorum():
+    discoverer = AddressDiscoverer(
+        [FakeProvider("a", "1.2.3.4"), FakeProvider("b", "5.6.7.8")],
+        strategy="quorum",
+        quorum=2,
+    )
+
+    with pytest.raises(SudException) as raised:
+        await discoverer.discover()
+
+    assert "no quorum reached" in raised.value.message
+
+
+@pytest.mark.asyncio()
+async def test_discover_demoted_providers():
+    slow = FakeProvider("slow", "1.2.3.4")
+    fast = FakeProvider("fast", "1.2.3.4")
+    slow.stats.record(1.0)
+    fast.stats.record(0.1)
+    discoverer = AddressDiscoverer([slow, fast])
+
+    assert discoverer.rank() == ([fast], [slow])
+    assert await discoverer.discover() == "1.2.3.4"
+    assert slow.calls == 0
+
+    fast.error = SudException("boom")
+    assert await discoverer.discover() == "1.2.3.4"
+    assert slow.calls == 1
+
+
+@pytest.mark.asyncio()
+async def test_discover_fallback():
+    gateway = FakeProvider("gateway", error=SudException("no gateway"))
+    checker = FakeProvider("checker", "1.2.3.4")
+    unused = FakeProvider("unused", "5.6.7.8")
+    discoverer = AddressDiscoverer([gateway, checker, unused], strategy="fallback")
+
+    assert await discoverer.discover() == "1.2.3.4"
+    assert (gateway.calls, checker.calls, unused.calls) == (1, 1, 0)
+
+
+@pytest.mark.asyncio()
+async def test_discover_fallback_all_fail():
+    discoverer = AddressDiscoverer(
+        [
+            FakeProvider("a", error=SudException("boom")),
+            FakeProvider("b", error=SudException("bang")),
+        ],
+        strategy="fallback",
+    )
+
+    with pytest.raises(SudException) as raised:
+        await discoverer.discover()
+
+    assert raised.value.message == (
+        "Cannot determine current public ip address: a: boom; b: bang."
+    )
+
+
+def test_rank_ignores_failing_latency():
+    failing = FakeProvider("failing")
+    other = FakeProvider("other")
+    for _ in range(3):
+        failing.stats.record(0.001, error=True)
+    other.stats.record(0.1)
+    discoverer = AddressDiscoverer([failing, other])
+
+    assert discoverer.rank() == ([other], [failing])
+
+
+def test_rank_demotes_errors():
+    failing = FakeProvider("failing")
+    other = FakeProvider("other")
+    for _ in range(3):
+        failing.stats.record(0.1, error=True)
+    discoverer = AddressDiscoverer([failing, other])
+
+    assert discoverer.rank() == ([other], [failing])
+
+
+def test_rank_all_demoted():
+    a = FakeProvider("a")
+    a.stats.record(0.1, error=True)
+    a.stats.record(0.1, error=True)
+    discoverer = AddressDiscoverer([a])
+
+    assert discoverer.rank() == ([a], [])
+
+
+@pytest.mark.parametrize(
+    ("kwargs", "message"),
+    [
+        ({"providers": []}, "At least one discovery provider is required."),
+        ({"strategy": "fastest"}, "Invalid discovery strategy: fastest"),
+        (
+            {"strategy": "quorum", "quorum": 3},
+            "Invalid discovery quorum 3 for 1 provider(s).",
+        ),
+    ],
+)
+def test_discoverer_invalid(kwargs, message):
+    kwargs.setdefault("providers", [FakeProvider("a")])
+    with pytest.raises(SudException) as raised:
+        AddressDiscoverer(**kwargs)
+
+    assert raised.value.message == message
+
+
+def test_create_provider(mocker):
+    request = mocker.AsyncMock()
+    provider = create_provider({"url": "https://ip.example.com/"}, request)
+    assert isinstance(provider, HTTPProvider)
+
+    provider = create_provider({"type": "dns"}, request)
+    assert isinstance(provider, DNSProvider)
+    assert provider.server == "208.67.222.222"
+    assert provider.qname == "myip.opendns.com"
+    assert provider.qtype == "A"
+
+    provider = create_provider(
+        {
+            "type": "dns",
+            "server": "216.239.32.10",
+            "qname": "o-o.myaddr.l.google.com",
+            "qtype": "TXT",
+            "timeout": 1,
+            "retries": 0,
+        },
+        request,
+    )
+    assert provider.qtype == "TXT"
+    assert provider.timeout == 1.0
+    assert provider.retries == 0
+
+    provider = create_provider({"type": "dns"}, request, version=6)
+    assert provider.server == "2620:119:35::35"
+    assert provider.qtype == "AAAA"
+    assert provider.version == 6
+    assert provider.name == "dns://[2620:119:35::35]:53/myip.opendns.com"
+
+    provider = create_provider({"url": "https://ip6.example.com/"}, request, 6)
+    assert provider.version == 6
+
+    with pytest.raises(SudException) as raised:
+        create_provider({"type": "natpmp"}, request, version=6)
+
+    assert raised.value.message == "NAT-PMP can only discover IPv4 addresses"
+
+    with pytest.raises(SudException) as raised:
+        create_provider({"type": "carrier-pigeon"}, request)
+
+    assert raised.value.message == ("Invalid discovery provider type: carrier-pigeon")
+
+
+def test_create_discoverer(mocker):
+    config = DiscoveryConfig(
+        strategy="quorum",
+        quorum=2,
+        providers=[
+            {"type": "http", "url": "https://a.example.com/"},
+            {"type": "http", "url": "https://b.example.com/"},
+        ],
+    )
+    discoverer = create_discoverer(config, mocker.AsyncMock())
+
+    assert discoverer.version == 4
+    assert discoverer.strategy == "quorum"
+    assert discoverer.quorum == 2
+    assert [p.name for p in discoverer.providers] == [
+        "https://a.example.com/",
+        "https://b.example.com/",
+    ]
+
+
+def test_create_discoverer_ipv6(mocker):
+    config = DiscoveryConfig(providers=[{"url": "https://ip6.example.com/"}])
+
+    discoverer = create_discoverer(config, mocker.AsyncMock(), version=6)
+
+    assert discoverer.version == 6
+    assert discoverer.providers[0].version == 6
@@ -0,0 +1,203 @@
+import asyncio
+import socket
+
+import pytest
+
+from sud import dns
+from sud.discovery import DNSProvider
+from sud.exceptions import SudException
+
+
+def build_response(request, answers, flags=0x8180):
+    qid = int.from_bytes(request[:2], "big")
+    question = request[dns.HEADER.size :]
+    data = dns.HEADER.pack(qid, flags, 1, len(answers), 0, 0) + question
+    for rtype, rdata in answers:
+        # Name compressed as a pointer to the question.
+        data += b"\xc0\x0c" + dns.RR.pack(rtype, 1, 60, len(rdata)) + rdata
+    return data
+
+
+def test_build_query():
+    query = dns.build_query(0x1234, "myip.opendns.com", "A")
+
+    assert query == (
+        b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04myip\x07opendns\x03com\x00"
+        b"\x00\x01\x00\x01"
+    )
+
+
+def test_encode_name_invalid():
+    with pytest.raises(SudException) as raised:
+        dns.encode_name("a..b")
+
+    assert raised.value.message == "Invalid DNS name: a..b"
+
+
+def test_parse_response():
+    request = dns.build_query(1, "myip.opendns.com", "A")
+    response = build_response(
+        request,
+        [
+            (dns.QTYPES["TXT"], b"\x03foo\x03bar"),
+            (dns.QTYPES["A"], bytes([1, 2, 3, 4])),
+        ],
+    )
+
+    assert dns.parse_response(response, 1, "A") == ["1.2.3.4"]
+    assert dns.parse_response(response, 1, "TXT") == ["foobar"]
+
+
+def test_parse_response_aaaa():
+    request = dns.build_query(1, "myip.opendns.com", "AAAA")
+    response = build_response(
+        request,
+        [(dns.QTYPES["AAAA"], bytes([0x20, 0x01, 0x0D, 0xB8] + [0] * 11 + [1]))],
+    )
+
+    assert dns.parse_response(response, 1, "AAAA") == ["2001:db8::1"]
+
+
+@pytest.mark.parametrize(
+    ("response", "message"),
+    [
+        (b"\x00\x02\x81\x80" + b"\x00" * 8, "Unexpected DNS response"),
+        (b"\x00\x01\x01\x00" + b"\x00" * 8, "Unexpected DNS response"),
+        (b"\x00\x01\x83\x80" + b"\x00" * 8, "Truncated DNS response"),
+        (b"\x00\x01\x81\x83" + b"\x00" * 8, "DNS query failed with rcode 3"),
+        (b"\x00\x01\x81\x80\x00\x01\x00\x01", "Malformed DNS response"),
+        (
+            b"\x00\x01\x81\x80\x00\x00\x00\x01\x00\x00\x00\x00\x03abc",
+            "Malformed DNS response",
+        ),
+    ],
+)
+def test_parse_response_errors(response, message):
+    with pytest.raises(SudException) as raised:
+        dns.parse_response(response, 1, "A")
+
+    assert raised.value.message.startswith(message)
+
+
+@pytest.mark.asyncio()
+async def test_query(udp_server):
+    port, server = await udp_server(
+        lambda request: [
+            # A stray packet with a wrong id must be ignored.
+            b"\xff\xff" + request[2:],
+            build_response(request, [(dns.QTYPES["A"], bytes([5, 6, 7, 8]))]),
+        ],
+    )
+
+    answers = await dns.query("127.0.0.1", "myip.opendns.com", port=port)
+
+    assert answers == ["5.6.7.8"]
+    assert len(server.requests) == 1
+
+
+@pytest.mark.asyncio()
+async def test_query_retries(udp_server):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) < 2:
+            return []
+        return [build_response(request, [(dns.QTYPES["A"], bytes([5, 6, 7, 8]))])]
+
+    port, _ = await udp_server(handler)
+
+    answers = await dns.query(
+        "127.0.0.1",
+        "myip.opendns.com",
+        port=port,
+        timeout=0.05,
+        retries=2,
+    )
+
+    assert answers == ["5.6.7.8"]
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio()
+async def test_query_timeout(udp_server):
+    port, server = await udp_server(lambda request: [])
+
+    with pytest.raises(SudException) as raised:
+        await dns.query(
+            "127.0.0.1",
+            "myip.opendns.com",
+            port=port,
+            timeout=0.01,
+            retries=1,
+        )
+
+    assert raised.value.message == (
+        "DNS query for myip.opendns.com to 127.0.0.1 timed out"
+    )
+    assert len(server.requests) == 2
+
+
+@pytest.mark.asyncio()
+async def test_query_socket_error(mocker):
+    loop = asyncio.get_running_loop()
+    mocker.patch.object(
+        loop,
+        "create_datagram_endpoint",
+        side_effect=OSError("unreachable"),
+    )
+
+    with pytest.raises(SudException) as raised:
+        await dns.query("127.0.0.1", "myip.opendns.com")
+
+    assert raised.value.message == "DNS query to 127.0.0.1 failed: unreachable"
+
+
+@pytest.mark.asyncio()
+async def test_query_connection_refused():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    with pytest.raises(SudException) as raised:
+        await dns.query("127.0.0.1", "myip.opendns.com", port=port, timeout=1)
+
+    assert raised.value.message.startswith("DNS query to 127.0.0.1 failed:")
+
+
+@pytest.mark.asyncio()
+async def test_dns_provider(udp_server):
+    port, _ = await udp_server(
+        lambda request: [
+            build_response(request, [(dns.QTYPES["TXT"], b"\x071.2.3.4")]),
+        ],
+    )
+    provider = DNSProvider(
+        "127.0.0.1",
+        "o-o.myaddr.l.google.com",
+        qtype="TXT",
+        port=port,
+    )
+
+    assert provider.name == f"dns://127.0.0.1:{port}/o-o.myaddr.l.google.com"
+    assert await provider.query() == "1.2.3.4"
+
+
+@pytest.mark.asyncio()
+async def test_dns_provider_no_answer(udp_server):
+    port, _ = await udp_server(lambda request: [build_response(request, [])])
+    provider = DNSProvider("127.0.0.1", port=port, name="opendns")
+
+    with pytest.raises(SudException) as raised:
+        await provider.query()
+
+    assert raised.value.message == "opendns: No A answer for myip.opendns.com"
+
+
+@pytest.mark.parametrize("qtype", ["MX", "CNAME"])
+def test_dns_provider_invalid_qtype(qtype):
+    with pytest.raises(SudException) as raised:
+        DNSProvider(qtype=qtype)
+
+    assert raised.value.message == f"Invalid DNS query type: {qtype}"
@@ -0,0 +1,421 @@
+import pytest
+import requests
+
+from sud.exceptions import RetryLaterException
+from sud.fake import FakeScalewayAPI
+from sud.updater import Updater
+
+HEADERS = {"X-Auth-Token": "my-secret-key"}
+
+
+def _records_url(api, zone="example.com"):
+    return f"{api.api_url}dns-zones/{zone}/records"
+
+
+def test_checkip(fake_api):
+    resp = requests.get(fake_api.checkip_url)
+
+    assert resp.status_code == 200
+    assert resp.text == "203.0.113.1\n"
+
+    fake_api.address = "203.0.113.2"
+    assert requests.get(fake_api.checkip_url).text == "203.0.113.2\n"
+    assert requests.get(fake_api.checkip6_url).text == "2001:db8::1\n"
+
+
+def test_list_records(fake_api):
+    fake_api.add_zone(
+        "example.com",
+        [{"name": f"host{i}", "type": "A", "data": f"10.0.0.{i}"} for i in range(5)]
+        + [{"name": "host0", "type": "TXT", "data": "hello"}],
+    )
+
+    resp = requests.get(
+        _records_url(fake_api),
+        headers=HEADERS,
+        params={"type": "A", "page": 2, "page_size": 2},
+    )
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["total_count"] == 5
+    assert [r["name"] for r in data["records"]] == ["host2", "host3"]
+
+    resp = requests.get(
+        _records_url(fake_api),
+        headers=HEADERS,
+        params={"name": "host0"},
+    )
+    assert [r["type"] for r in resp.json()["records"]] == ["A", "TXT"]
+
+
+def test_patch_records(fake_api):
+    fake_api.add_zone(
+        "example.com",
+        [{"name": "old", "type": "A", "data": "10.0.0.1"}],
+    )
+
+    resp = requests.patch(
+        _records_url(fake_api),
+        headers=HEADERS,
+        json={
+            "changes": [
+                {
+                    "add": {
+                        "records": [
+                            {
+                                "name": "new.example.com.",
+                                "type": "A",
+                                "ttl": 60,
+                                "data": "10.0.0.2",
+                            },
+                        ],
+                    },
+                },
+                {
+                    "set": {
+                        "id_fields": {"name": "old.example.com.", "type": "A"},
+                        "records": [
+                            {
+                                "name": "old.example.com.",
+                                "type": "A",
+                                "ttl": 300,
+                                "data": "10.0.0.3",
+                            },
+                        ],
+                    },
+                },
+            ],
+        },
+    )
+
+    assert resp.status_code == 200
+    assert [(r["name"], r["data"]) for r in resp.json()["records"]] == [
+        ("new", "10.0.0.2"),
+        ("old", "10.0.0.3"),
+    ]
+    assert [(r["name"], r["ttl"]) for r in fake_api.get_records("example.com")] == [
+        ("new", 60),
+        ("old", 300),
+    ]
+
+    resp = requests.patch(
+        _records_url(fake_api),
+        headers=HEADERS,
+        json={
+            "changes": [{"delete": {"id_fields": {"name": "new", "type": "A"}}}],
+            "return_all_records": True,
+        },
+    )
+    assert [r["name"] for r in resp.json()["records"]] == ["old"]
+
+
+@pytest.mark.parametrize(
+    ("headers", "zone", "status"),
+    [
+        ({}, "example.com", 401),
+        ({"X-Auth-Token": "wrong"}, "example.com", 401),
+        (HEADERS, "unknown.com", 404),
+    ],
+)
+def test_rejected_requests(fake_api, headers, zone, status):
+    fake_api.add_zone("example.com")
+
+    resp = requests.get(_records_url(fake_api, zone), headers=headers)
+
+    assert resp.status_code == status
+
+
+def test_inject(fake_api):
+    fake_api.add_zone("example.com")
+    fake_api.inject(429, retry_after=2)
+    fake_api.inject(500)
+
+    first = requests.get(_records_url(fake_api), headers=HEADERS)
+    second = requests.get(_records_url(fake_api), headers=HEADERS)
+    third = requests.get(_records_url(fake_api), headers=HEADERS)
+
+    assert first.status_code == 429
+    assert first.headers["Retry-After"] == "2"
+    assert second.status_code == 500
+    assert "Retry-After" not in second.headers
+    assert third.status_code == 200
+    assert fake_api.requests["GET"] == 3
+
+
+def test_error_rate():
+    with FakeScalewayAPI(error_rate=0.5, seed=1) as api:
+        api.add_zone("example.com")
+        statuses = {requests.get(_records_url(api)).status_code for _ in range(20)}
+
+    assert statuses == {200, 500}
+
+
+def test_rate_limit():
+    with FakeScalewayAPI(rate_limit=2) as api:
+        api.add_zone("example.com")
+        with requests.Session() as session:
+            statuses = [session.get(_records_url(api)).status_code for _ in range(3)]
+
+    # The three requests may straddle a second boundary.
+    assert statuses[:2] == [200, 200]
+    assert statuses[2] in (200, 429)
+
+
+def test_latency(mocker):
+    m_sleep = mocker.patch("sud.fake.time.sleep")
+    with FakeScalewayAPI(latency=0.25) as api:
+        requests.get(api.checkip_url)
+
+    m_sleep.assert_called_once_with(0.25)
+
+
+@pytest.mark.asyncio()
+async def test_update_end_to_end(fake_api, fake_api_config):
+    fake_api_config.hostnames = [
+        "existing.example.com",
+        "new.example.com",
+        "example.org",
+    ]
+    fake_api.add_zone(
+        "example.com",
+        [{"name": "existing", "type": "A", "data": "198.51.100.1"}],
+    )
+    fake_api.add_zone("example.org")
+    updater = Updater(fake_api_config)
+
+    result = await updater.update()
+
+    assert sorted(result.changed) == [
+        "example.org",
+        "existing.example.com",
+        "new.example.com",
+    ]
+    assert not result.failed
+    assert {(r["name"], r["data"]) for r in fake_api.get_records("example.com")} == {
+        ("existing", "203.0.113.1"),
+        ("new", "203.0.113.1"),
+    }
+    assert [r["data"] for r in fake_api.get_records("example.org")] == [
+        "203.0.113.1",
+    ]
+
+    fake_api.reset_stats()
+    fake_api.address = "203.0.113.2"
+    result = await updater.update()
+
+    assert len(result.changed) == 3
+    # The records are known from the state, only the writes hit the API.
+    assert fake_api.requests == {"GET": 1, "PATCH": 2}
+    updater.close()
+
+
+@pytest.mark.asyncio()
+async def test_update_rate_limited(fake_api, fake_api_config):
+    fake_api_config.hostnames = ["host.example.com"]
+    fake_api.add_zone("example.com")
+    updater = Updater(fake_api_config)
+    await updater.resolve_zones()
+    fake_api.inject(429, retry_after=30)
+
+    result = await updater.update()
+
+    assert result.changed == []
+    error = result.failed["host.example.com"]
+    assert isinstance(error, RetryLaterException)
+    assert error.retry_after == 30
+    assert error.status == 429
+
+
+def test_list_zones(fake_api):
+    for zone in ("example.com", "sub.example.com", "example.co.uk"):
+        fake_api.add_zone(zone)
+
+    resp = requests.get(f"{fake_api.api_url}dns-zones", headers=HEADERS)
+
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "dns_zones": [
+            {"domain": "example.co.uk", "subdomain": ""},
+            {"domain": "example.com", "subdomain": ""},
+            {"domain": "example.com", "subdomain": "sub"},
+        ],
+        "total_count": 3,
+    }
+
+
+@pytest.mark.asyncio()
+async def test_update_nested_zones_end_to_end(fake_api, fake_api_config):
+    fake_api_config.hostnames = [
+        "host.example.co.uk",
+        "host.example.com",
+        "host.sub.example.com",
+    ]
+    for zone in ("example.co.uk", "example.com", "sub.example.com"):
+        fake_api.add_zone(zone)
+    updater = Updater(fake_api_config)
+
+    result = await updater.update()
+
+    assert sorted(result.changed) == fake_api_config.hostnames
+    for zone in ("example.co.uk", "example.com", "sub.example.com"):
+        assert [r["name"] for r in fake_api.get_records(zone)] == ["host"]
+    # The zones are listed once per `zones_ttl`.
+    fake_api.reset_stats()
+    await updater.update()
+    assert fake_api.requests == {"GET": 1}
+    updater.close()
+
+
+def test_patch_records_cname_conflict(fake_api):
+    fake_api.add_zone(
+        "example.com",
+        [{"name": "www", "type": "CNAME", "data": "example.com."}],
+    )
+
+    resp = requests.patch(
+        _records_url(fake_api),
+        headers=HEADERS,
+        json={
+            "changes": [
+                {"add": {"records": [{"name": "a", "type": "A", "data": "1.1.1.1"}]}},
+                {
+                    "add": {
+                        "records": [
+                            {
+                                "name": "www.example.com.",
+                                "type": "A",
+                                "data": "1.1.1.1",
+                            },
+                        ],
+                    },
+                },
+            ],
+        },
+    )
+
+    assert resp.status_code == 400
+    # Nothing is applied.
+    assert [r["name"] for r in fake_api.get_records("example.com")] == ["www"]
+
+
+@pytest.mark.asyncio()
+async def test_update_rejected_record_end_to_end(fake_api, fake_api_config):
+    fake_api_config.hostnames = [f"host{i}.example.com" for i in range(6)]
+    fake_api.add_zone(
+        "example.com",
+        [{"name": "host4", "type": "CNAME", "data": "example.com."}],
+    )
+    updater = Updater(fake_api_config)
+
+    result = await updater.update()
+
+    assert result.status == "partial"
+    assert list(result.failed) == ["host4.example.com"]
+    assert sorted(
+        r["name"] for r in fake_api.get_records("example.com") if r["type"] == "A"
+    ) == ["host0", "host1", "host2", "host3", "host5"]
+    updater.close()
+
+
+def test_sync_end_to_end(fake_api, fake_api_config):
+    fake_api_config.hostnames = ["a.example.com", "b.example.org"]
+    fake_api.add_zone("example.com")
+
+    result = Updater(fake_api_config).sync()
+
+    assert result.to_dict() == {
+        "status": "partial",
+        "changed": ["a.example.com"],
+        "unchanged": [],
+        "failed": {
+            "b.example.org": "No DNS zone of the account contains b.example.org",
+        },
+    }
+
+
+def test_sync_unchanged_end_to_end(tmp_path, fake_api, fake_api_config):
+    fake_api_config._config["state_file"] = str(tmp_path / "state.json")
+    fake_api.add_zone("example.com")
+    fake_api_config.hostnames = ["a.example.com"]
+    Updater(fake_api_config).sync()
+    fake_api.reset_stats()
+
+    result = Updater(fake_api_config).sync()
+
+    assert result.status == "unchanged"
+    # Only the public IP is checked: the zones are known from the state.
+    assert fake_api.requests == {"GET": 1}
+
+
+@pytest.mark.asyncio()
+async def test_update_dual_stack_end_to_end(fake_api, fake_api_config):
+    fake_api_config.hostnames = [
+        {"name": "a.example.com", "record_types": ["A", "AAAA"]},
+        {"name": "b.example.com", "record_types": ["AAAA"]},
+    ]
+    fake_api.add_zone(
+        "example.com",
+        [{"name": "a", "type": "AAAA", "data": "2001:DB8:0::ff"}],
+    )
+    updater = Updater(fake_api_config)
+
+    result = await updater.update()
+
+    assert result.changed == ["a.example.com", "b.example.com"]
+    assert sorted(
+        (r["name"], r["type"], r["data"]) for r in fake_api.get_records("example.com")
+    ) == [
+        ("a", "A", "203.0.113.1"),
+        ("a", "AAAA", "2001:db8::1"),
+        ("b", "AAAA", "2001:db8::1"),
+    ]
+    # The zones, both discoveries, one lookup and a single write for the zone.
+    assert fake_api.requests == {"GET": 4, "PATCH": 1}
+
+    fake_api.reset_stats()
+    fake_api.address6 = "2001:db8::2"
+    result = await updater.update()
+
+    assert result.changed == ["a.example.com", "b.example.com"]
+    assert fake_api.requests == {"GET": 2, "PATCH": 1}
+    updater.close()
+
+
+@pytest.mark.asyncio()
+async def test_update_prefix_delegation_end_to_end(fake_api, fake_api_config):
+    fake_api_config.hostnames = [
+        {"name": "nas.example.com", "record_types": ["AAAA"], "ipv6_suffix": "::5"},
+        {
+            "name": "tv.example.com",
+            "record_types": ["AAAA"],
+            "ipv6_suffix": "::12:0:0:0:6",
+        },
+        {"name": "router.example.com", "record_types": ["AAAA"]},
+    ]
+    fake_api_config._config["ipv6_prefix_length"] = 56
+    fake_api.add_zone("example.com")
+    fake_api.address6 = "2001:db8:aa00:1::1"
+    updater = Updater(fake_api_config)
+
+    await updater.update()
+
+    fake_api.reset_stats()
+    fake_api.address6 = "2001:db8:bb00:1::1"
+    result = await updater.update()
+
+    assert sorted(result.changed) == [
+        "nas.example.com",
+        "router.example.com",
+        "tv.example.com",
+    ]
+    assert sorted(
+        (r["name"], r["data"]) for r in fake_api.get_records("example.com")
+    ) == [
+        ("nas", "2001:db8:bb00::5"),
+        ("router", "2001:db8:bb00:1::1"),
+        ("tv", "2001:db8:bb00:12::6"),
+    ]
+    # One discovery and one write for the whole zone.
+    assert fake_api.requests == {"GET": 1, "PATCH": 1}
+    updater.close()
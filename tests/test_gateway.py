@@ -0,0 +1,254 @@
+import asyncio
+import base64
+
+import pytest
+
+from sud.bench import send_update
+from sud.config import Config
+from sud.exceptions import SudException
+from sud.gateway import UpdateGateway, get_addresses, serve
+from sud.updater import Updater
+
+
+def _authorization(username="router", password="secret"):
+    credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return f"Basic {credentials}"
+
+
+SERVE = {
+    "host": "127.0.0.1",
+    "port": 0,
+    "users": {
+        "router": {"password": "secret"},
+        "nas": {"password": "nas-secret", "hostnames": ["b.example.com"]},
+    },
+}
+
+
+@pytest.fixture()
+def gateway_config(fake_api_config):
+    fake_api_config.hostnames = ["a.example.com", "b.example.com", "c.example.org"]
+    fake_api_config._config["serve"] = SERVE
+    return fake_api_config
+
+
+@pytest.mark.parametrize(
+    ("myip", "peer", "expected"),
+    [
+        ("1.2.3.4", "5.6.7.8", {"A": "1.2.3.4"}),
+        ("1.2.3.4,2001:DB8::1", None, {"A": "1.2.3.4", "AAAA": "2001:db8::1"}),
+        ("", "5.6.7.8", {"A": "5.6.7.8"}),
+        ("not-an-ip", "::ffff:5.6.7.8", {"A": "5.6.7.8"}),
+        ("", "2001:db8::2", {"AAAA": "2001:db8::2"}),
+        ("", None, {}),
+    ],
+)
+def test_get_addresses(myip, peer, expected):
+    assert get_addresses(myip, peer) == expected
+
+
+@pytest.mark.parametrize(
+    ("method", "target", "authorization", "status", "body"),
+    [
+        ("GET", "/other", None, "404 Not Found", "Not Found"),
+        ("POST", "/nic/update", None, "405 Method Not Allowed", "Method Not Allowed"),
+        (
+            "GET",
+            "/nic/update?hostname=a.example.com",
+            None,
+            "401 Unauthorized",
+            "badauth",
+        ),
+        (
+            "GET",
+            "/nic/update?hostname=a.example.com",
+            _authorization(password="wrong"),
+            "401 Unauthorized",
+            "badauth",
+        ),
+        ("GET", "/nic/update", "Basic !!!", "401 Unauthorized", "badauth"),
+        ("GET", "/nic/update", _authorization(), "200 OK", "notfqdn"),
+        (
+            "GET",
+            "/nic/update?hostname=localhost",
+            _authorization(),
+            "200 OK",
+            "notfqdn",
+        ),
+        (
+            "GET",
+            "/nic/update?hostname=a.example.com",
+            _authorization("nas", "nas-secret"),
+            "200 OK",
+            "nohost",
+        ),
+        (
+            "GET",
+            "/nic/update?hostname=" + ",".join(f"h{i}.example.com" for i in range(21)),
+            _authorization(),
+            "200 OK",
+            "numhost",
+        ),
+    ],
+)
+@pytest.mark.asyncio()
+async def test_respond_rejected(config, method, target, authorization, status, body):
+    config.hostnames = ["a.example.com", "b.example.com"]
+    config._config["serve"] = SERVE
+    gateway = UpdateGateway(Updater(config), config)
+    headers = {"authorization": authorization} if authorization else {}
+
+    assert await gateway.respond(method, target, headers, "1.2.3.4") == (status, body)
+
+
+@pytest.mark.asyncio()
+async def test_respond_api_error(mocker, fake_api, gateway_config):
+    fake_api.add_zone("example.com")
+    gateway = UpdateGateway(Updater(gateway_config), gateway_config)
+    mocker.patch.object(
+        UpdateGateway,
+        "load_zone",
+        side_effect=SudException("Cannot retrieve records"),
+    )
+
+    assert await gateway.respond(
+        "GET",
+        "/nic/update?hostname=a.example.com&myip=1.2.3.4",
+        {"authorization": _authorization()},
+    ) == ("200 OK", "911")
+
+
+@pytest.mark.asyncio()
+async def test_gateway_end_to_end(fake_api, gateway_config):
+    fake_api.add_zone("example.com", [{"name": "a", "type": "A", "data": "1.1.1.1"}])
+    fake_api.add_zone("example.org")
+    updater = Updater(gateway_config)
+    gateway = UpdateGateway(updater, gateway_config)
+    await gateway.start()
+
+    async def update(hostname, address, authorization=_authorization()):
+        return await send_update(
+            gateway.host,
+            gateway.port,
+            hostname,
+            address,
+            authorization,
+        )
+
+    try:
+        answers = await asyncio.gather(
+            update("a.example.com", "1.1.1.1"),
+            update("b.example.com", "2.2.2.2", _authorization("nas", "nas-secret")),
+            update("c.example.org", "2001:db8::3"),
+        )
+
+        assert answers == ["nochg 1.1.1.1", "good 2.2.2.2", "good 2001:db8::3"]
+        assert await update("a.example.com,c.example.org", "4.4.4.4") == (
+            "good 4.4.4.4\ngood 4.4.4.4"
+        )
+        assert sorted(
+            (r["name"], r["type"], r["data"])
+            for r in fake_api.get_records("example.com")
+        ) == [("a", "A", "4.4.4.4"), ("b", "A", "2.2.2.2")]
+        assert sorted(
+            (r["type"], r["data"]) for r in fake_api.get_records("example.org")
+        ) == [("A", "4.4.4.4"), ("AAAA", "2001:db8::3")]
+
+        fake_api.reset_stats()
+        assert await update("b.example.com", "2.2.2.2") == "nochg 2.2.2.2"
+        # Unchanged addresses are answered from the index.
+        assert fake_api.requests == {}
+    finally:
+        await gateway.stop()
+        updater.close()
+
+
+@pytest.mark.asyncio()
+async def test_gateway_batches_zone_writes(fake_api, gateway_config):
+    gateway_config.hostnames = [f"host{i}.example.com" for i in range(50)]
+    fake_api.add_zone("example.com")
+    fake_api.latency = 0.01
+    updater = Updater(gateway_config)
+    gateway = UpdateGateway(updater, gateway_config)
+    await gateway.start()
+
+    try:
+        answers = await asyncio.gather(
+            *(
+                send_update(
+                    gateway.host,
+                    gateway.port,
+                    f"host{i}.example.com",
+                    f"10.0.0.{i}",
+                    _authorization(),
+                )
+                for i in range(50)
+            ),
+        )
+    finally:
+        await gateway.stop()
+        updater.close()
+
+    assert answers == [f"good 10.0.0.{i}" for i in range(50)]
+    assert len(fake_api.get_records("example.com")) == 50
+    assert fake_api.requests["PATCH"] < 50
+
+
+@pytest.mark.asyncio()
+async def test_gateway_updates_record_in_flight(fake_api, gateway_config):
+    fake_api.add_zone("example.com")
+    updater = Updater(gateway_config)
+    gateway = UpdateGateway(updater, gateway_config)
+    await updater.resolve_zones()
+    await gateway.load_zone("example.com")
+    await gateway.start()
+    fake_api.latency = 0.3
+
+    async def update(address, delay):
+        await asyncio.sleep(delay)
+        return await send_update(
+            gateway.host,
+            gateway.port,
+            "a.example.com",
+            address,
+            _authorization(),
+        )
+
+    try:
+        # The second update arrives while the record is being added.
+        answers = await asyncio.gather(
+            update("1.1.1.1", 0),
+            update("2.2.2.2", 0.15),
+        )
+    finally:
+        await gateway.stop()
+        updater.close()
+
+    assert answers == ["good 1.1.1.1", "good 2.2.2.2"]
+    assert [
+        (r["name"], r["type"], r["data"]) for r in fake_api.get_records("example.com")
+    ] == [("a", "A", "2.2.2.2")]
+
+
+def test_gateway_users_hostnames_only(mocker):
+    # Only the users list their hostnames.
+    config = Config(
+        mocker.MagicMock(),
+        {
+            "serve": {
+                "users": {"nas": {"password": "secret", "hostnames": ["nas.lan"]}},
+            },
+        },
+    )
+    gateway = UpdateGateway(Updater(config), config)
+
+    assert gateway.authenticate(_authorization("nas", "secret")) == {"nas.lan"}
+
+
+def test_serve_without_users(mocker):
+    config = Config(mocker.MagicMock(), {"hostnames": ["a.example.com"]})
+
+    with pytest.raises(SudException) as raised:
+        serve(config)
+
+    assert raised.value.message == "No users are configured for the update gateway"
@@ -0,0 +1,74 @@
+import subprocess
+import sys
+
+import pytest
+
+import sud
+
+HEAVY_MODULES = ("humanize", "requests", "sud.updater", "telegram")
+
+
+def test_import_is_lazy():
+    # Importing the CLI must neither spawn git nor load the modules that
+    # only the run and bench commands need.
+    code = "\n".join(
+        [
+            "import subprocess, sys",
+            "def fail(*args, **kwargs):",
+            "    raise AssertionError('subprocess spawned at import time')",
+            "subprocess.check_output = subprocess.Popen = fail",
+            "import sud.cli",
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+        ],
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_get_version(mocker):
+    mocker.patch("sud.get_package_version", return_value="1.2.3")
+    m_revision = mocker.patch("sud.get_revision", return_value="abcdef")
+
+    assert sud.get_version() == "1.2.3.abcdef"
+    assert sud.__semantic_version__ == "1.2.3+abcdef"
+    assert sud.__build__ == "abcdef"
+
+    m_revision.return_value = None
+    assert sud.get_version() == "1.2.3"
+    assert sud.__semantic_version__ == "1.2.3"
+    assert sud.__version__ == "1.2.3"
+
+
+def test_get_revision(mocker):
+    sud.get_revision.cache_clear()
+    m_git = mocker.patch("sud._get_git_revision", return_value="abcdef")
+
+    assert sud.get_revision() == "abcdef"
+    assert sud.get_revision() == "abcdef"
+    m_git.assert_called_once()
+    sud.get_revision.cache_clear()
+
+
+def test_get_git_revision(mocker, tmp_path):
+    assert sud._get_git_revision(str(tmp_path)) is None
+
+    (tmp_path / ".git").mkdir()
+    m_check_output = mocker.patch("subprocess.check_output", return_value=b"abc\n")
+    assert sud._get_git_revision(str(tmp_path)) == "abc"
+    m_check_output.assert_called_once()
+
+    m_check_output.side_effect = OSError
+    assert sud._get_git_revision(str(tmp_path)) is None
+
+
+def test_missing_attribute():
+    with pytest.raises(AttributeError, match="missing"):
+        sud.missing  # noqa: B018
@@ -0,0 +1,150 @@
+import asyncio
+import math
+
+import pytest
+
+from sud.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Metrics,
+    MetricsServer,
+    format_labels,
+    format_value,
+)
+
+
+def test_format_labels():
+    assert format_labels({}) == ""
+    assert format_labels({"b": "2", "a": 1}) == '{a="1",b="2"}'
+    assert format_labels({"a": 'x"y\\z\n'}) == '{a="x\\"y\\\\z\\n"}'
+
+
+def test_format_value():
+    assert format_value(1) == "1.0"
+    assert format_value(0.25) == "0.25"
+    assert format_value(math.inf) == "+Inf"
+
+
+def test_counter():
+    counter = Counter("test_total", "A counter.")
+    counter.inc(phase="a")
+    counter.inc(2, phase="a")
+    counter.inc()
+
+    assert counter.get(phase="a") == 3
+    assert counter.get(phase="b") == 0
+    assert counter.render() == (
+        "# HELP test_total A counter.\n"
+        "# TYPE test_total counter\n"
+        "test_total 1.0\n"
+        'test_total{phase="a"} 3.0\n'
+    )
+
+
+def test_gauge():
+    gauge = Gauge("test_gauge", "A gauge.")
+    gauge.set(5, hostname="a")
+    gauge.set(2, hostname="a")
+
+    assert gauge.get(hostname="a") == 2
+    assert 'test_gauge{hostname="a"} 2.0' in gauge.render()
+    assert "# TYPE test_gauge gauge" in gauge.render()
+
+
+def test_histogram():
+    histogram = Histogram("test_seconds", "A histogram.", buckets=(0.1, 1, math.inf))
+    histogram.observe(0.05, phase="a")
+    histogram.observe(0.5, phase="a")
+    histogram.observe(5, phase="a")
+
+    assert histogram.get(phase="a") == 3
+    assert histogram.get(phase="b") == 0
+    assert histogram.render() == (
+        "# HELP test_seconds A histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="0.1",phase="a"} 1\n'
+        'test_seconds_bucket{le="1.0",phase="a"} 2\n'
+        'test_seconds_bucket{le="+Inf",phase="a"} 3\n'
+        'test_seconds_sum{phase="a"} 5.55\n'
+        'test_seconds_count{phase="a"} 3\n'
+    )
+
+
+def test_metrics_time(mocker):
+    mocker.patch("sud.metrics.time.monotonic", side_effect=[10.0, 10.5])
+    metrics = Metrics()
+
+    with metrics.time("discovery"):
+        pass
+
+    assert metrics.phase_seconds.get(phase="discovery") == 1
+    assert 'sud_phase_duration_seconds_sum{phase="discovery"} 0.5' in (metrics.render())
+
+
+def test_metrics_time_error():
+    metrics = Metrics()
+
+    with pytest.raises(ValueError), metrics.time("write"):
+        raise ValueError()
+
+    assert metrics.phase_seconds.get(phase="write") == 1
+
+
+def test_metrics_render():
+    text = Metrics().render()
+    for name in (
+        "sud_phase_duration_seconds",
+        "sud_cycles_total",
+        "sud_record_changes_total",
+        "sud_errors_total",
+        "sud_last_success_timestamp_seconds",
+        "sud_consecutive_failures",
+        "sud_next_check_delay_seconds",
+    ):
+        assert f"# TYPE {name} " in text
+
+
+async def http_get(port, request):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.decode()
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize(
+    ("request_line", "status"),
+    [
+        (b"GET /metrics HTTP/1.1", "200 OK"),
+        (b"GET /metrics?x=1 HTTP/1.1", "200 OK"),
+        (b"GET / HTTP/1.1", "404 Not Found"),
+        (b"POST /metrics HTTP/1.1", "405 Method Not Allowed"),
+    ],
+)
+async def test_metrics_server(request_line, status):
+    metrics = Metrics()
+    metrics.cycles.inc(result="success")
+    server = MetricsServer(metrics, "127.0.0.1", 0)
+    await server.start()
+    try:
+        response = await http_get(
+            server.port,
+            request_line + b"\r\nHost: localhost\r\nAccept: */*\r\n\r\n",
+        )
+    finally:
+        await server.stop()
+
+    head, body = response.split("\r\n\r\n", 1)
+    assert head.startswith(f"HTTP/1.1 {status}\r\n")
+    assert f"Content-Length: {len(body.encode())}" in head
+    if status == "200 OK":
+        assert "text/plain; version=0.0.4" in head
+        assert 'sud_cycles_total{result="success"} 1.0' in body
+
+
+@pytest.mark.asyncio()
+async def test_metrics_server_stop_not_started():
+    await MetricsServer(Metrics(), "127.0.0.1", 0).stop()
@@ -0,0 +1,171 @@
+import struct
+
+import pytest
+
+from sud import natpmp
+from sud.discovery import NATPMPProvider, create_provider
+from sud.exceptions import SudException
+
+ROUTES = """Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask
+eth0\t0000A8C0\t00000000\t0001\t0\t0\t0\t00FFFFFF
+eth0\t00000000\t0100A8C0\t0003\t0\t0\t100\t00000000
+"""
+
+
+def external_address_response(address, result=0):
+    return struct.pack("!BBHI4s", 0, 128, result, 1234, bytes(address))
+
+
+def test_get_default_gateway(tmp_path):
+    route_file = tmp_path / "route"
+    route_file.write_text(ROUTES)
+
+    assert natpmp.get_default_gateway(str(route_file)) == "192.168.0.1"
+
+
+def test_get_default_gateway_not_found(tmp_path):
+    route_file = tmp_path / "route"
+    route_file.write_text(ROUTES.splitlines()[0] + "\n" + ROUTES.splitlines()[1])
+
+    assert natpmp.get_default_gateway(str(route_file)) is None
+    assert natpmp.get_default_gateway(str(tmp_path / "missing")) is None
+
+
+def test_get_default_gateway_no_gateway_flag(tmp_path):
+    route_file = tmp_path / "route"
+    route_file.write_text(ROUTES.replace("\t0003\t", "\t0001\t"))
+
+    assert natpmp.get_default_gateway(str(route_file)) is None
+
+
+def test_parse_response():
+    assert natpmp.parse_response(external_address_response([1, 2, 3, 4])) == ("1.2.3.4")
+
+
+@pytest.mark.parametrize(
+    ("response", "message"),
+    [
+        (b"\x00\x80", "Malformed NAT-PMP response"),
+        (b"\x02\x80" + b"\x00" * 10, "Unexpected NAT-PMP response"),
+        (
+            external_address_response([0, 0, 0, 0], result=3),
+            "NAT-PMP request failed: network failure",
+        ),
+        (
+            external_address_response([0, 0, 0, 0], result=42),
+            "NAT-PMP request failed: result code 42",
+        ),
+    ],
+)
+def test_parse_response_errors(response, message):
+    with pytest.raises(SudException) as raised:
+        natpmp.parse_response(response)
+
+    assert raised.value.message.startswith(message)
+
+
+@pytest.mark.asyncio()
+async def test_external_address(udp_server):
+    port, gateway = await udp_server(
+        lambda request: [external_address_response([8, 8, 4, 4])],
+    )
+
+    address = await natpmp.external_address("127.0.0.1", port=port)
+
+    assert address == "8.8.4.4"
+    assert gateway.requests == [b"\x00\x00"]
+
+
+@pytest.mark.asyncio()
+async def test_external_address_timeout(udp_server):
+    port, gateway = await udp_server(lambda request: [])
+
+    with pytest.raises(SudException) as raised:
+        await natpmp.external_address(
+            "127.0.0.1",
+            port=port,
+            timeout=0.01,
+            retries=2,
+        )
+
+    assert raised.value.message == "No NAT-PMP answer from gateway 127.0.0.1"
+    assert len(gateway.requests) == 3
+
+
+@pytest.mark.asyncio()
+async def test_external_address_socket_error(mocker):
+    mocker.patch("sud.natpmp.udp.request", side_effect=OSError("unreachable"))
+
+    with pytest.raises(SudException) as raised:
+        await natpmp.external_address("127.0.0.1")
+
+    assert raised.value.message == "NAT-PMP request to 127.0.0.1 failed: unreachable"
+
+
+@pytest.mark.asyncio()
+async def test_natpmp_provider(udp_server):
+    port, _ = await udp_server(
+        lambda request: [external_address_response([8, 8, 4, 4])],
+    )
+    provider = NATPMPProvider("127.0.0.1", port=port)
+
+    assert provider.name == "natpmp://127.0.0.1"
+    assert await provider.query() == "8.8.4.4"
+
+
+@pytest.mark.asyncio()
+async def test_natpmp_provider_default_gateway(mocker):
+    mocker.patch("sud.natpmp.get_default_gateway", return_value="192.168.0.1")
+    m_external = mocker.patch(
+        "sud.natpmp.external_address",
+        return_value="8.8.4.4",
+    )
+    provider = NATPMPProvider()
+
+    assert provider.name == "natpmp://default-gateway"
+    assert await provider.query() == "8.8.4.4"
+    m_external.assert_awaited_once_with(
+        "192.168.0.1",
+        port=5351,
+        timeout=0.25,
+        retries=3,
+    )
+
+
+@pytest.mark.asyncio()
+async def test_natpmp_provider_no_gateway(mocker):
+    mocker.patch("sud.natpmp.get_default_gateway", return_value=None)
+    provider = NATPMPProvider(name="gw")
+
+    with pytest.raises(SudException) as raised:
+        await provider.query()
+
+    assert raised.value.message == "gw: Cannot find the default gateway"
+
+
+@pytest.mark.asyncio()
+async def test_natpmp_provider_private_address(udp_server):
+    port, _ = await udp_server(
+        lambda request: [external_address_response([100, 64, 0, 1])],
+    )
+    provider = NATPMPProvider("127.0.0.1", port=port, name="gw")
+
+    with pytest.raises(SudException) as raised:
+        await provider.query()
+
+    assert raised.value.message == (
+        "gw: Gateway external address 100.64.0.1 is not public"
+    )
+
+
+def test_create_natpmp_provider(mocker):
+    provider = create_provider(
+        {"type": "natpmp", "gateway": "10.0.0.1", "timeout": 0.1, "retries": 1},
+        mocker.AsyncMock(),
+    )
+
+    assert isinstance(provider, NATPMPProvider)
+    assert provider.gateway == "10.0.0.1"
+    assert provider.port == 5351
+    assert provider.timeout == 0.1
+    assert provider.retries == 1
@@ -0,0 +1,155 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from sud import netlink
+from sud.exceptions import SudException
+
+
+def nlmsg(msg_type, payload=b""):
+    length = netlink.NLMSGHDR.size + len(payload)
+    data = netlink.NLMSGHDR.pack(length, msg_type, 0, 0, 0) + payload
+    return data + b"\x00" * ((4 - len(data) % 4) % 4)
+
+
+def rtmsg(dst_len):
+    return netlink.RTMSG.pack(2, dst_len, 0, 0, 254, 4, 0, 1, 0)
+
+
+def test_is_relevant_address():
+    assert netlink.is_relevant(nlmsg(netlink.RTM_NEWADDR, b"\x02" * 8)) is True
+    assert netlink.is_relevant(nlmsg(netlink.RTM_DELADDR)) is True
+
+
+def test_is_relevant_default_route():
+    assert netlink.is_relevant(nlmsg(netlink.RTM_NEWROUTE, rtmsg(0))) is True
+    assert netlink.is_relevant(nlmsg(netlink.RTM_DELROUTE, rtmsg(0))) is True
+
+
+def test_is_relevant_other_route():
+    assert netlink.is_relevant(nlmsg(netlink.RTM_NEWROUTE, rtmsg(24))) is False
+
+
+def test_is_relevant_other_message():
+    assert netlink.is_relevant(nlmsg(16)) is False
+
+
+def test_is_relevant_multi_message():
+    data = (
+        nlmsg(netlink.RTM_NEWROUTE, rtmsg(24))
+        + nlmsg(16, b"\x01\x02\x03")
+        + nlmsg(netlink.RTM_NEWADDR)
+    )
+    assert netlink.is_relevant(data) is True
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        nlmsg(netlink.RTM_NEWADDR)[:8],
+        # Route message cut before the rtmsg payload.
+        struct.pack("=IHHII", 28, netlink.RTM_NEWROUTE, 0, 0, 0),
+        # Invalid length.
+        struct.pack("=IHHII", 4, netlink.RTM_NEWADDR, 0, 0, 0),
+    ],
+)
+def test_is_relevant_truncated(data):
+    assert netlink.is_relevant(data) is False
+
+
+@pytest.fixture()
+def sockpair():
+    reader, writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    yield reader, writer
+    reader.close()
+    writer.close()
+
+
+@pytest.mark.asyncio()
+async def test_monitor_debounce(mocker, sockpair):
+    reader, writer = sockpair
+    callback = mocker.MagicMock()
+    monitor = netlink.NetlinkMonitor(callback, debounce=0.05, sock=reader)
+    monitor.start()
+
+    for _ in range(3):
+        writer.send(nlmsg(netlink.RTM_NEWADDR))
+        await asyncio.sleep(0.01)
+    writer.send(nlmsg(netlink.RTM_NEWROUTE, rtmsg(24)))
+
+    await asyncio.sleep(0.02)
+    callback.assert_not_called()
+
+    await asyncio.sleep(0.1)
+    callback.assert_called_once()
+    monitor.stop()
+
+
+@pytest.mark.asyncio()
+async def test_monitor_ignores_irrelevant(mocker, sockpair):
+    reader, writer = sockpair
+    callback = mocker.MagicMock()
+    monitor = netlink.NetlinkMonitor(callback, debounce=0.01, sock=reader)
+    monitor.start()
+
+    writer.send(nlmsg(netlink.RTM_NEWROUTE, rtmsg(24)))
+    await asyncio.sleep(0.05)
+
+    callback.assert_not_called()
+    monitor.stop()
+
+
+@pytest.mark.asyncio()
+async def test_monitor_read_error(mocker, caplog):
+    sock = mocker.MagicMock()
+    sock.recv.side_effect = OSError("No buffer space available")
+    callback = mocker.MagicMock()
+    monitor = netlink.NetlinkMonitor(callback, debounce=0.01, sock=sock)
+    monitor._loop = asyncio.get_running_loop()
+
+    monitor._on_readable()
+    await asyncio.sleep(0.05)
+
+    callback.assert_called_once()
+    assert "Error reading netlink notifications" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_monitor_stop(mocker, sockpair):
+    reader, writer = sockpair
+    callback = mocker.MagicMock()
+    monitor = netlink.NetlinkMonitor(callback, debounce=0.05, sock=reader)
+    monitor.start()
+
+    writer.send(nlmsg(netlink.RTM_NEWADDR))
+    await asyncio.sleep(0.01)
+    monitor.stop()
+    await asyncio.sleep(0.1)
+
+    callback.assert_not_called()
+    assert reader.fileno() == -1
+    monitor.stop()
+
+
+def test_monitor_not_supported(mocker):
+    mocker.patch.object(netlink, "socket", mocker.MagicMock(spec=[]))
+    monitor = netlink.NetlinkMonitor(mocker.MagicMock())
+
+    with pytest.raises(SudException) as raised:
+        monitor.start()
+
+    assert raised.value.message == "Netlink is not supported on this platform"
+
+
+def test_monitor_socket_error(mocker):
+    m_socket = mocker.patch("sud.netlink.socket.socket")
+    m_socket.return_value.bind.side_effect = OSError("denied")
+    monitor = netlink.NetlinkMonitor(mocker.MagicMock())
+
+    with pytest.raises(SudException) as raised:
+        monitor.start()
+
+    assert raised.value.message == "Cannot subscribe to netlink: denied"
@@ -0,0 +1,661 @@
+import asyncio
+import json
+import logging
+import smtplib
+
+import pytest
+import requests
+import telegram
+
+from sud.config import Config, TelegramConfig, TimeoutConfig
+from sud.constants import (
+    TG_CREATED_MSG,
+    TG_DIGEST_CREATED,
+    TG_DIGEST_FLAPPED,
+    TG_DIGEST_MSG,
+    TG_DIGEST_UPDATED,
+    TG_UPDATED_MSG,
+)
+from sud.exceptions import RetryLaterException, SudException
+from sud.metrics import Metrics
+from sud.notifications import (
+    FileNotifier,
+    Notification,
+    NotificationDispatcher,
+    NotificationQueue,
+    Notifier,
+    SMTPNotifier,
+    SyslogNotifier,
+    TelegramNotifier,
+    WebhookNotifier,
+    coalesce,
+    create_dispatcher,
+    create_notifier,
+    get_subject,
+)
+
+
+class FakeNotifier(Notifier):
+    def __init__(self, errors=None, delay=0, timeout=None):
+        super().__init__("fake", timeout)
+        self.sent = []
+        self.errors = list(errors or [])
+        self.delay = delay
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    async def send(self, notifications):
+        await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(notifications)
+
+
+@pytest.fixture()
+def telegram_bot(mocker):
+    bot = mocker.AsyncMock()
+    mocker.patch("telegram.Bot", return_value=bot)
+    return bot
+
+
+def test_coalesce():
+    assert coalesce(
+        [
+            Notification("a.example.com", "1.1.1.1", None),
+            Notification("b.example.com", "2.2.2.2", "1.1.1.1"),
+            Notification("a.example.com", "2.2.2.2", "1.1.1.1"),
+            Notification("b.example.com", "1.1.1.1", "2.2.2.2"),
+            Notification("c.example.com", "3.3.3.3", "1.1.1.1"),
+        ],
+    ) == [
+        Notification("a.example.com", "2.2.2.2", None, changes=2),
+        Notification("b.example.com", "1.1.1.1", "1.1.1.1", changes=2),
+        Notification("c.example.com", "3.3.3.3", "1.1.1.1"),
+    ]
+
+
+def test_coalesce_record_types():
+    assert coalesce(
+        [
+            Notification("a.example.com", "1.1.1.1", None),
+            Notification("a.example.com", "2001:db8::1", None, record_type="AAAA"),
+            Notification("a.example.com", "2.2.2.2", "1.1.1.1"),
+        ],
+    ) == [
+        Notification("a.example.com", "2.2.2.2", None, changes=2),
+        Notification("a.example.com", "2001:db8::1", None, record_type="AAAA"),
+    ]
+
+
+def test_notification_record_type():
+    notification = Notification("a.example.com", "2001:db8::2", "2001:db8::1")
+    notification.record_type = "AAAA"
+
+    assert str(notification) == "a.example.com (AAAA): 2001:db8::1 -> 2001:db8::2"
+    assert get_subject([notification]) == (
+        "SUD: DNS record (AAAA) of a.example.com changed"
+    )
+    assert get_subject([notification, Notification("a.example.com", "1.2.3.4")]) == (
+        "SUD: 2 DNS records (A, AAAA) changed"
+    )
+    assert TelegramNotifier.format([notification]) == TG_UPDATED_MSG.format(
+        name="a.example.com",
+        address="2001:db8::2",
+        previous="2001:db8::1",
+        type="AAAA",
+    )
+
+
+def test_notification_flapped():
+    assert not Notification("a.example.com", "1.1.1.1", "2.2.2.2").flapped
+    assert not Notification("a.example.com", "1.1.1.1", "2.2.2.2", 3).flapped
+    assert Notification("a.example.com", "1.1.1.1", "1.1.1.1", 2).flapped
+
+
+def test_telegram_format():
+    assert TelegramNotifier.format(
+        [Notification("a.example.com", "1.2.3.4")],
+    ) == TG_CREATED_MSG.format(name="a.example.com", address="1.2.3.4", type="A")
+    assert TelegramNotifier.format(
+        [Notification("a.example.com", "1.2.3.4", "5.6.7.8")],
+    ) == TG_UPDATED_MSG.format(
+        name="a.example.com",
+        address="1.2.3.4",
+        previous="5.6.7.8",
+        type="A",
+    )
+
+
+def test_telegram_format_digest():
+    assert TelegramNotifier.format(
+        [
+            Notification("a.example.com", "1.2.3.4"),
+            Notification("b.example.com", "1.2.3.4", "5.6.7.8"),
+            Notification("c.example.com", "1.2.3.4", "1.2.3.4", 2),
+        ],
+    ) == TG_DIGEST_MSG.format(
+        count=3,
+        types="A",
+        entries="\n".join(
+            [
+                TG_DIGEST_CREATED.format(name="a.example.com", address="1.2.3.4"),
+                TG_DIGEST_UPDATED.format(
+                    name="b.example.com",
+                    address="1.2.3.4",
+                    previous="5.6.7.8",
+                ),
+                TG_DIGEST_FLAPPED.format(
+                    name="c.example.com",
+                    address="1.2.3.4",
+                    changes=2,
+                ),
+            ],
+        ),
+    )
+    assert "changed 2 times" in TelegramNotifier.format(
+        [Notification("c.example.com", "1.2.3.4", "1.2.3.4", 2)],
+    )
+
+
+@pytest.mark.asyncio()
+async def test_telegram_send(mocker, telegram_bot):
+    notifier = TelegramNotifier(TelegramConfig(1234, "token"), TimeoutConfig())
+    await notifier.send([Notification("a.example.com", "1.2.3.4")])
+    await notifier.close()
+
+    telegram_bot.initialize.assert_awaited_once()
+    telegram_bot.send_message.assert_awaited_once_with(
+        1234,
+        TG_CREATED_MSG.format(name="a.example.com", address="1.2.3.4", type="A"),
+        parse_mode=telegram.constants.ParseMode.HTML,
+        connect_timeout=5.0,
+        read_timeout=30.0,
+        write_timeout=30.0,
+        pool_timeout=5.0,
+    )
+    telegram_bot.shutdown.assert_awaited_once()
+
+
+@pytest.mark.asyncio()
+async def test_telegram_send_flood_limit(mocker, telegram_bot):
+    mocker.patch.object(TelegramNotifier, "GROUP_MIN_INTERVAL", 0.1)
+    notifier = TelegramNotifier(TelegramConfig(-1234, "token"), TimeoutConfig())
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await notifier.send([Notification("a.example.com", "1.2.3.4")])
+    await notifier.send([Notification("b.example.com", "1.2.3.4")])
+
+    assert loop.time() - start >= 0.1
+    assert telegram_bot.send_message.await_count == 2
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize(
+    ("error", "retry_after"),
+    [
+        (telegram.error.RetryAfter(7), 7),
+        (telegram.error.NetworkError("down"), None),
+    ],
+)
+async def test_telegram_send_error(telegram_bot, error, retry_after):
+    telegram_bot.send_message.side_effect = error
+    notifier = TelegramNotifier(TelegramConfig(1234, "token"), TimeoutConfig())
+
+    with pytest.raises(SudException) as raised:
+        await notifier.send([Notification("a.example.com", "1.2.3.4")])
+
+    assert raised.value.message == str(error)
+    assert getattr(raised.value, "retry_after", None) == retry_after
+
+
+@pytest.mark.asyncio()
+async def test_queue_delivery():
+    notifier = FakeNotifier()
+    queue = NotificationQueue(notifier, TimeoutConfig())
+    await queue.start()
+
+    queue.put(Notification("a.example.com", "1.2.3.4"))
+    queue.put(Notification("b.example.com", "1.2.3.4"))
+    await queue.close(1)
+
+    assert notifier.sent == [
+        [
+            Notification("a.example.com", "1.2.3.4"),
+            Notification("b.example.com", "1.2.3.4"),
+        ],
+    ]
+    assert notifier.closed
+
+
+@pytest.mark.asyncio()
+async def test_queue_window():
+    notifier = FakeNotifier()
+    queue = NotificationQueue(notifier, TimeoutConfig(), window=0.05)
+    await queue.start()
+
+    queue.put(Notification("a.example.com", "2.2.2.2", "1.1.1.1"))
+    await asyncio.sleep(0)
+    queue.put(Notification("b.example.com", "2.2.2.2", "1.1.1.1"))
+    queue.put(Notification("a.example.com", "1.1.1.1", "2.2.2.2"))
+    await asyncio.sleep(0.1)
+    queue.put(Notification("c.example.com", "2.2.2.2", "1.1.1.1"))
+    await queue.close(1)
+
+    assert notifier.sent == [
+        [
+            Notification("a.example.com", "1.1.1.1", "1.1.1.1", 2),
+            Notification("b.example.com", "2.2.2.2", "1.1.1.1"),
+        ],
+        [Notification("c.example.com", "2.2.2.2", "1.1.1.1")],
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_queue_close_skips_window():
+    notifier = FakeNotifier()
+    queue = NotificationQueue(notifier, TimeoutConfig(), window=10)
+    await queue.start()
+    queue.put(Notification("a.example.com", "1.2.3.4"))
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await queue.close(1)
+
+    assert loop.time() - start < 1
+    assert len(notifier.sent) == 1
+
+
+@pytest.mark.asyncio()
+async def test_queue_unexpected_error(caplog):
+    notifier = FakeNotifier(errors=[RuntimeError("bug")])
+    queue = NotificationQueue(notifier, TimeoutConfig())
+    await queue.start()
+
+    queue.put(Notification("a.example.com", "1.2.3.4"))
+    await asyncio.sleep(0.01)
+    queue.put(Notification("b.example.com", "1.2.3.4"))
+    await queue.close(1)
+
+    assert notifier.sent == [[Notification("b.example.com", "1.2.3.4")]]
+    assert "Unexpected error while sending a notification" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_queue_deliver_metrics():
+    metrics = Metrics()
+    queue = NotificationQueue(FakeNotifier(), TimeoutConfig(), metrics=metrics)
+
+    await queue.deliver([Notification("a.example.com", "1.2.3.4")])
+
+    assert metrics.phase_seconds.get(phase="notify") == 1
+
+
+@pytest.mark.asyncio()
+async def test_queue_full(mocker, caplog):
+    mocker.patch.object(NotificationQueue, "MAX_SIZE", 2)
+    queue = NotificationQueue(FakeNotifier(), TimeoutConfig())
+
+    with caplog.at_level(logging.WARNING):
+        for name in ("a", "b", "c"):
+            queue.put(Notification(f"{name}.example.com", "1.2.3.4"))
+
+    assert queue._queue.qsize() == 2
+    assert caplog.records[0].message == (
+        "Notification queue full, dropping notification for a.example.com"
+    )
+
+
+@pytest.mark.asyncio()
+async def test_queue_retry(mocker):
+    mocker.patch.object(NotificationQueue, "BACKOFF", 0.01)
+    m_sleep = mocker.spy(asyncio, "sleep")
+    notifier = FakeNotifier(
+        errors=[SudException("down"), RetryLaterException("flood", 0)],
+    )
+    queue = NotificationQueue(notifier, TimeoutConfig())
+
+    assert await queue.deliver([Notification("a.example.com", "1.2.3.4")])
+    assert len(notifier.sent) == 1
+    assert [call.args[0] for call in m_sleep.mock_calls if call.args[0]] == [0.01]
+
+
+@pytest.mark.asyncio()
+async def test_queue_retry_exhausted(mocker, caplog):
+    mocker.patch.object(NotificationQueue, "BACKOFF", 0)
+    mocker.patch.object(NotificationQueue, "RETRIES", 1)
+    notifier = FakeNotifier(
+        errors=[SudException("down")] * 2,
+    )
+    queue = NotificationQueue(notifier, TimeoutConfig())
+
+    with caplog.at_level(logging.WARNING):
+        assert not await queue.deliver([Notification("a.example.com", "1.2.3.4")])
+
+    assert caplog.records[0].message == (
+        "Cannot notify the change of a.example.com via fake: down"
+    )
+
+
+@pytest.mark.asyncio()
+async def test_queue_deliver_timeout(mocker, caplog):
+    mocker.patch.object(NotificationQueue, "RETRIES", 0)
+    queue = NotificationQueue(FakeNotifier(delay=10), TimeoutConfig(notify=0.05))
+
+    with caplog.at_level(logging.WARNING):
+        assert not await queue.deliver([Notification("a.example.com", "1.2.3.4")])
+
+    assert caplog.records[0].message == (
+        "Cannot notify the change of a.example.com via fake: "
+        "The notify phase exceeded its budget of 0.05s"
+    )
+
+
+@pytest.mark.asyncio()
+async def test_queue_close_timeout(caplog):
+    queue = NotificationQueue(FakeNotifier(delay=10), TimeoutConfig())
+    await queue.start()
+    queue.put(Notification("a.example.com", "1.2.3.4"))
+    queue.put(Notification("b.example.com", "1.2.3.4"))
+
+    with caplog.at_level(logging.WARNING):
+        await queue.close(0.05)
+
+    assert caplog.records[0].message == "2 notification(s) not sent before exiting"
+
+
+@pytest.mark.asyncio()
+async def test_queue_close_not_started():
+    notifier = FakeNotifier()
+    queue = NotificationQueue(notifier, TimeoutConfig())
+    await queue.close(1)
+    assert not notifier.closed
+
+
+def test_notification_str():
+    assert str(Notification("a.example.com", "1.2.3.4")) == (
+        "a.example.com: created 1.2.3.4"
+    )
+    assert str(Notification("a.example.com", "1.2.3.4", "5.6.7.8")) == (
+        "a.example.com: 5.6.7.8 -> 1.2.3.4"
+    )
+    assert str(Notification("a.example.com", "1.2.3.4", "1.2.3.4", 3)) == (
+        "a.example.com: changed 3 times, back to 1.2.3.4"
+    )
+
+
+def test_get_subject():
+    assert get_subject([Notification("a.example.com", "1.2.3.4")]) == (
+        "SUD: DNS record (A) of a.example.com changed"
+    )
+    assert get_subject(
+        [
+            Notification("a.example.com", "1.2.3.4"),
+            Notification("b.example.com", "1.2.3.4"),
+        ],
+    ) == ("SUD: 2 DNS records (A) changed")
+
+
+@pytest.mark.asyncio()
+async def test_notifier_interface():
+    notifier = Notifier("test", timeout=3)
+    assert str(notifier) == "test"
+    assert notifier.timeout == 3
+    with pytest.raises(NotImplementedError):
+        await notifier.send([])
+    await notifier.close()
+
+
+@pytest.mark.asyncio()
+async def test_webhook_send(mocker):
+    resp = mocker.MagicMock()
+    request = mocker.AsyncMock(return_value=resp)
+    notifier = WebhookNotifier(
+        "https://hooks.example.com/sud",
+        request,
+        headers={"Authorization": "Bearer x"},
+    )
+
+    await notifier.send([Notification("a.example.com", "1.2.3.4", "5.6.7.8")])
+
+    assert str(notifier) == "webhook https://hooks.example.com/sud"
+    request.assert_awaited_once_with(
+        "POST",
+        "https://hooks.example.com/sud",
+        headers={"Authorization": "Bearer x"},
+        json={
+            "changes": [
+                {
+                    "hostname": "a.example.com",
+                    "address": "1.2.3.4",
+                    "previous": "5.6.7.8",
+                    "changes": 1,
+                    "record_type": "A",
+                },
+            ],
+        },
+    )
+    resp.raise_for_status.assert_called_once()
+
+
+@pytest.mark.asyncio()
+async def test_webhook_send_error(mocker):
+    request = mocker.AsyncMock(side_effect=requests.ConnectionError("refused"))
+    notifier = WebhookNotifier("https://hooks.example.com/sud", request)
+
+    with pytest.raises(SudException) as raised:
+        await notifier.send([Notification("a.example.com", "1.2.3.4")])
+
+    assert raised.value.message == "refused"
+
+
+@pytest.mark.asyncio()
+async def test_smtp_send(mocker):
+    m_smtp = mocker.patch("sud.notifications.smtplib.SMTP")
+    smtp = m_smtp.return_value.__enter__.return_value
+    notifier = SMTPNotifier(
+        "mail.example.com",
+        "sud@example.com",
+        ["admin@example.com", "ops@example.com"],
+        TimeoutConfig(read=12),
+        port=587,
+        starttls=True,
+        username="sud",
+        password="secret",
+    )
+
+    await notifier.send([Notification("a.example.com", "1.2.3.4")])
+
+    m_smtp.assert_called_once_with("mail.example.com", 587, timeout=12)
+    smtp.starttls.assert_called_once()
+    smtp.login.assert_called_once_with("sud", "secret")
+    message = smtp.send_message.mock_calls[0].args[0]
+    assert message["Subject"] == "SUD: DNS record (A) of a.example.com changed"
+    assert message["From"] == "sud@example.com"
+    assert message["To"] == "admin@example.com, ops@example.com"
+    assert message.get_content() == "a.example.com: created 1.2.3.4\n"
+
+
+@pytest.mark.asyncio()
+async def test_smtp_send_error(mocker):
+    m_smtp = mocker.patch("sud.notifications.smtplib.SMTP")
+    m_smtp.side_effect = smtplib.SMTPConnectError(421, "busy")
+    notifier = SMTPNotifier(
+        "mail.example.com",
+        "sud@example.com",
+        ["admin@example.com"],
+        TimeoutConfig(),
+    )
+
+    with pytest.raises(SudException):
+        await notifier.send([Notification("a.example.com", "1.2.3.4")])
+
+    m_smtp.return_value.__enter__.return_value.login.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_file_send(tmp_path):
+    path = tmp_path / "changes.jsonl"
+    notifier = FileNotifier(str(path))
+
+    await notifier.send([Notification("a.example.com", "1.2.3.4")])
+    await notifier.send([Notification("a.example.com", "5.6.7.8", "1.2.3.4")])
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["address"] for line in lines] == ["1.2.3.4", "5.6.7.8"]
+    assert lines[1]["previous"] == "1.2.3.4"
+    assert "time" in lines[0]
+
+
+@pytest.mark.asyncio()
+async def test_file_send_error(tmp_path):
+    notifier = FileNotifier(str(tmp_path / "missing" / "changes.jsonl"))
+
+    with pytest.raises(SudException):
+        await notifier.send([Notification("a.example.com", "1.2.3.4")])
+
+
+@pytest.mark.asyncio()
+async def test_syslog_send(mocker):
+    m_handler = mocker.patch("sud.notifications.logging.handlers.SysLogHandler")
+    notifier = SyslogNotifier(("127.0.0.1", 514), facility="daemon")
+
+    await notifier.send(
+        [
+            Notification("a.example.com", "1.2.3.4"),
+            Notification("b.example.com", "1.2.3.4", "5.6.7.8"),
+        ],
+    )
+    await notifier.close()
+
+    m_handler.assert_called_once_with(address=("127.0.0.1", 514), facility="daemon")
+    handler = m_handler.return_value
+    assert [call.args[0].getMessage() for call in handler.emit.mock_calls] == [
+        "a.example.com: created 1.2.3.4",
+        "b.example.com: 5.6.7.8 -> 1.2.3.4",
+    ]
+    handler.close.assert_called_once()
+
+
+@pytest.mark.asyncio()
+async def test_syslog_send_error(mocker):
+    mocker.patch(
+        "sud.notifications.logging.handlers.SysLogHandler",
+        side_effect=FileNotFoundError("/dev/log"),
+    )
+    notifier = SyslogNotifier()
+
+    with pytest.raises(SudException):
+        await notifier.send([Notification("a.example.com", "1.2.3.4")])
+
+
+@pytest.mark.asyncio()
+async def test_queue_sink_timeout(mocker, caplog):
+    mocker.patch.object(NotificationQueue, "RETRIES", 0)
+    queue = NotificationQueue(
+        FakeNotifier(delay=10, timeout=0.05),
+        TimeoutConfig(notify=60),
+    )
+
+    assert not await queue.deliver([Notification("a.example.com", "1.2.3.4")])
+    assert "exceeded its budget of 0.05s" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_dispatcher_isolates_sinks(mocker):
+    mocker.patch.object(NotificationQueue, "RETRIES", 0)
+    broken = FakeNotifier(delay=10, timeout=0.5)
+    working = FakeNotifier()
+    dispatcher = NotificationDispatcher(
+        [
+            NotificationQueue(broken, TimeoutConfig()),
+            NotificationQueue(working, TimeoutConfig()),
+        ],
+    )
+    await dispatcher.start()
+
+    dispatcher.put(Notification("a.example.com", "1.2.3.4"))
+    await asyncio.sleep(0.05)
+
+    assert working.sent == [[Notification("a.example.com", "1.2.3.4")]]
+    assert broken.sent == []
+
+    await dispatcher.close(0.01)
+    assert broken.closed
+    assert working.closed
+
+
+@pytest.mark.parametrize(
+    ("spec", "cls", "name"),
+    [
+        (
+            {"type": "telegram", "chat_id": 1, "token": "t"},
+            TelegramNotifier,
+            "telegram",
+        ),
+        (
+            {"type": "webhook", "url": "https://hooks.example.com/"},
+            WebhookNotifier,
+            "webhook https://hooks.example.com/",
+        ),
+        (
+            {"type": "smtp", "host": "mx", "from": "a@b.c", "to": "d@e.f"},
+            SMTPNotifier,
+            "smtp mx:25",
+        ),
+        (
+            {"type": "file", "path": "/tmp/sud.jsonl"},
+            FileNotifier,
+            "file /tmp/sud.jsonl",
+        ),
+        ({"type": "syslog", "address": ["10.0.0.1", 514]}, SyslogNotifier, "syslog"),
+    ],
+)
+def test_create_notifier(mocker, spec, cls, name):
+    notifier = create_notifier(
+        {**spec, "timeout": 3}, mocker.AsyncMock(), TimeoutConfig()
+    )
+
+    assert isinstance(notifier, cls)
+    assert str(notifier) == name
+    assert notifier.timeout == 3
+
+
+def test_create_notifier_defaults(mocker):
+    smtp = create_notifier(
+        {"type": "smtp", "host": "mx", "from": "a@b.c", "to": ["d@e.f"]},
+        mocker.AsyncMock(),
+        TimeoutConfig(),
+    )
+    assert smtp.recipients == ["d@e.f"]
+    assert smtp.timeout is None
+
+    syslog = create_notifier({"type": "syslog"}, mocker.AsyncMock(), TimeoutConfig())
+    assert syslog.address == "/dev/log"
+    assert syslog.facility == "user"
+
+
+def test_create_notifier_invalid(mocker):
+    with pytest.raises(SudException) as raised:
+        create_notifier({"type": "pigeon"}, mocker.AsyncMock(), TimeoutConfig())
+
+    assert raised.value.message == "Invalid notification sink type: pigeon"
+
+
+def test_create_dispatcher(mocker, config_file_factory):
+    c = Config("config.yml")
+    c._config = config_file_factory()
+    assert create_dispatcher(c, mocker.AsyncMock()) is None
+
+    c._config["notifications"] = {
+        "window": 0,
+        "webhook": {"url": "https://hooks.example.com/"},
+        "file": {"path": "/tmp/sud.jsonl"},
+    }
+    dispatcher = create_dispatcher(c, mocker.AsyncMock())
+    assert [str(queue._notifier) for queue in dispatcher._queues] == [
+        "webhook https://hooks.example.com/",
+        "file /tmp/sud.jsonl",
+    ]
@@ -0,0 +1,112 @@
+import pytest
+
+from sud.exceptions import SudException
+from sud.records import (
+    ARecordInfo,
+    ZoneRecordIndex,
+    ZoneSuffixTrie,
+    normalize_address,
+)
+
+
+def test_zone_record_index_load():
+    index = ZoneRecordIndex("example.com")
+    index.load(
+        [
+            {"name": "", "type": "A", "ttl": 300, "data": "1.2.3.4"},
+            {"name": "www", "type": "A", "ttl": 60, "data": "5.6.7.8"},
+            {"name": "www", "type": "CNAME", "ttl": 60, "data": "other."},
+        ],
+    )
+
+    assert len(index) == 2
+    assert index.get("") == ARecordInfo("", "example.com", 300, "1.2.3.4")
+    assert index.get("www") == ARecordInfo("www", "example.com", 60, "5.6.7.8")
+    assert index.get("www", "CNAME") is None
+    assert index.get("missing") is None
+
+    index.load([{"name": "mail", "type": "A", "ttl": 300, "data": "9.9.9.9"}])
+    assert len(index) == 1
+    assert index.get("www") is None
+
+
+def test_zone_record_index_update():
+    index = ZoneRecordIndex("example.com")
+    index.load([{"name": "www", "type": "A", "ttl": 60, "data": "5.6.7.8"}])
+
+    updated = index.update(
+        [
+            {"name": "www", "type": "A", "ttl": 60, "data": "1.1.1.1"},
+            {"name": "new", "type": "A", "ttl": 300, "data": "2.2.2.2"},
+            {"name": "", "type": "MX", "ttl": 300, "data": "10 mx."},
+        ],
+    )
+
+    assert updated == [
+        ARecordInfo("www", "example.com", 60, "1.1.1.1"),
+        ARecordInfo("new", "example.com", 300, "2.2.2.2"),
+    ]
+    assert len(index) == 2
+    assert index.get("www").address == "1.1.1.1"
+
+
+def test_zone_record_index_aaaa():
+    index = ZoneRecordIndex("example.com")
+    index.load(
+        [
+            {"name": "www", "type": "A", "ttl": 60, "data": "5.6.7.8"},
+            {"name": "www", "type": "AAAA", "ttl": 60, "data": "2001:DB8:0::1"},
+        ],
+    )
+
+    assert len(index) == 2
+    assert index.get("www").address == "5.6.7.8"
+    assert index.get("www", "AAAA") == ARecordInfo(
+        "www",
+        "example.com",
+        60,
+        "2001:db8::1",
+        "AAAA",
+    )
+
+
+def test_normalize_address():
+    assert normalize_address("2001:0DB8::0:1") == "2001:db8::1"
+    assert normalize_address("1.2.3.4") == "1.2.3.4"
+    assert normalize_address("not-an-ip") == "not-an-ip"
+
+
+def test_from_hostname_record_type():
+    info = ARecordInfo.from_hostname("www.example.com", "AAAA")
+
+    assert info.record_type == "AAAA"
+    assert ARecordInfo.from_hostname("www.example.com").record_type == "A"
+
+
+def test_from_hostname_zone():
+    info = ARecordInfo.from_hostname("www.example.co.uk", zone="example.co.uk")
+    assert (info.name, info.domain) == ("www", "example.co.uk")
+
+    apex = ARecordInfo.from_hostname("Example.co.uk", zone="example.co.uk")
+    assert (apex.name, apex.domain) == ("", "example.co.uk")
+
+    with pytest.raises(SudException) as raised:
+        ARecordInfo.from_hostname("www.example.com", zone="example.co.uk")
+
+    assert (
+        raised.value.message == "Hostname www.example.com is not in zone example.co.uk"
+    )
+
+
+def test_zone_suffix_trie():
+    zones = ZoneSuffixTrie(["example.com", "sub.example.com", "example.co.uk"])
+    zones.add("example.com")
+
+    assert len(zones) == 3
+    assert sorted(zones) == ["example.co.uk", "example.com", "sub.example.com"]
+    assert zones.lookup("example.com") == "example.com"
+    assert zones.lookup("a.b.example.com") == "example.com"
+    assert zones.lookup("a.SUB.example.com") == "sub.example.com"
+    assert zones.lookup("host.example.co.uk") == "example.co.uk"
+    assert zones.lookup("co.uk") is None
+    assert zones.lookup("host.example.org") is None
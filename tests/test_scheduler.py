@@ -0,0 +1,112 @@
+import pytest
+
+from sud.scheduler import Scheduler, get_jitter
+
+
+def test_get_jitter():
+    assert get_jitter("a.example.com") == get_jitter("a.example.com")
+    assert get_jitter("a.example.com") != get_jitter("b.example.com")
+    for i in range(100):
+        assert -1 <= get_jitter(f"host{i}.example.com") < 1
+
+
+def test_pop_due():
+    scheduler = Scheduler({"a": 300, "b": 300, "c": 600}, jitter=0, now=100)
+
+    assert scheduler.next_run() == 100
+    assert scheduler.pop_due(100) == ["a", "b", "c"]
+    assert scheduler.pop_due(100) == []
+    assert scheduler.next_run() is None
+
+
+def test_pop_due_window():
+    scheduler = Scheduler({"a": 100, "b": 300}, jitter=0.1, now=0)
+    assert scheduler.window == 20
+    scheduler.pop_due(0)
+    scheduler.reschedule("a", 0)
+    scheduler.reschedule("b", 8)
+
+    a, b = scheduler["a"].next_run, scheduler["b"].next_run
+    assert scheduler.pop_due(min(a, b) - 21) == []
+    assert len(scheduler.pop_due(max(a, b) - 20)) == 2
+
+
+def test_pop_due_window_spans_jitter():
+    hostnames = [f"host{i}.example.com" for i in range(20)]
+    scheduler = Scheduler(dict.fromkeys(hostnames, 300), jitter=0.1, now=0)
+    scheduler.pop_due(0)
+    for hostname in hostnames:
+        scheduler.reschedule(hostname, 0)
+
+    # Checked at the same time, the hosts stay in a single group.
+    assert sorted(scheduler.pop_due(scheduler.next_run())) == sorted(hostnames)
+
+
+def test_reschedule_success():
+    scheduler = Scheduler({"a": 300}, jitter=0, now=0)
+    scheduler.pop_due(0)
+
+    assert scheduler.reschedule("a", 10) == 310
+    assert scheduler.next_run() == 310
+
+
+def test_reschedule_jitter():
+    scheduler = Scheduler({"a": 300}, jitter=0.1)
+    next_run = scheduler.reschedule("a", 0)
+
+    assert 270 <= next_run < 330
+    assert next_run == 300 * (1 + 0.1 * get_jitter("a"))
+
+
+def test_reschedule_backoff():
+    scheduler = Scheduler({"a": 300}, jitter=0, max_backoff=1000)
+
+    assert scheduler.reschedule("a", 0, success=False) == 300
+    assert scheduler.reschedule("a", 0, success=False) == 600
+    assert scheduler.reschedule("a", 0, success=False) == 1000
+    assert scheduler["a"].failures == 3
+
+    assert scheduler.reschedule("a", 0) == 300
+    assert scheduler["a"].failures == 0
+
+
+@pytest.mark.parametrize(
+    ("success", "retry_after", "expected"),
+    [
+        (False, 900, 900),
+        (False, 10, 300),
+        (True, 900, 900),
+    ],
+)
+def test_reschedule_retry_after(success, retry_after, expected):
+    scheduler = Scheduler({"a": 300}, jitter=0)
+
+    assert (
+        scheduler.reschedule("a", 0, success=success, retry_after=retry_after)
+        == expected
+    )
+
+
+def test_reschedule_boost():
+    scheduler = Scheduler(
+        {"a": 300},
+        jitter=0,
+        boost_interval=60,
+        boost_duration=120,
+    )
+
+    assert scheduler.reschedule("a", 0, changed=True) == 60
+    assert scheduler.reschedule("a", 60) == 120
+    assert scheduler.reschedule("a", 120) == 420
+
+
+def test_run_now():
+    scheduler = Scheduler({"a": 300, "b": 600}, jitter=0)
+    scheduler.pop_due(0)
+    scheduler.reschedule("a", 0)
+    scheduler.reschedule("b", 0)
+
+    scheduler.run_now(50)
+
+    assert scheduler["a"].next_run == 50
+    assert scheduler.pop_due(50) == ["a", "b"]
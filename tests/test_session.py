@@ -0,0 +1,165 @@
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from sud.constants import (
+    CHECK_IP_ADDRESS,
+    CHECK_IPV6_ADDRESS,
+    SCALEWAY_API_BASE_URL,
+)
+from sud.session import (
+    RETRY_STATUSES,
+    TracedHTTPAdapter,
+    TracedHTTPConnectionPool,
+    TracedHTTPSConnection,
+    TracedHTTPSConnectionPool,
+    create_adapter,
+    create_session,
+    get_base_url,
+    get_retry_after,
+)
+from sud.tracing import Tracer, set_tracer, span
+from tests.test_tracing import ListExporter
+
+
+def test_get_base_url():
+    assert get_base_url(SCALEWAY_API_BASE_URL) == "https://api.scaleway.com/"
+    assert get_base_url(CHECK_IP_ADDRESS) == "https://checkip.amazonaws.com/"
+
+
+def test_create_adapter():
+    adapter = create_adapter(5, 2)
+
+    assert adapter._pool_connections == 1
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.read == 2
+    assert adapter.max_retries.allowed_methods == frozenset(["GET"])
+    assert adapter.max_retries.status_forcelist == RETRY_STATUSES
+    assert adapter.max_retries.respect_retry_after_header is False
+
+
+def test_create_session():
+    session = create_session(8, 4)
+
+    checkip = session.get_adapter(CHECK_IP_ADDRESS)
+    scaleway = session.get_adapter(f"{SCALEWAY_API_BASE_URL}dns-zones/x/records")
+
+    assert checkip is not scaleway
+    assert session.get_adapter(CHECK_IPV6_ADDRESS)._pool_maxsize == 1
+    assert checkip._pool_maxsize == 1
+    assert scaleway._pool_maxsize == 8
+    assert scaleway.max_retries.total == 4
+    assert session.get_adapter("https://other.host/") is session.adapters["https://"]
+
+
+def test_create_session_api_url():
+    session = create_session(8, 4, "http://127.0.0.1:8080/domain/v2beta1/")
+
+    api = session.get_adapter("http://127.0.0.1:8080/domain/v2beta1/dns-zones/x")
+
+    assert api._pool_maxsize == 8
+    assert session.get_adapter(SCALEWAY_API_BASE_URL) is session.adapters["https://"]
+
+
+def _response(status, retry_after=None):
+    resp = requests.Response()
+    resp.status_code = status
+    if retry_after is not None:
+        resp.headers["Retry-After"] = retry_after
+    return resp
+
+
+@pytest.mark.parametrize(
+    ("response", "expected"),
+    [
+        (None, None),
+        (_response(429), None),
+        (_response(429, "120"), 120),
+        (_response(503, "0.5"), 0.5),
+        (_response(503, "-3"), 0),
+        (_response(500, "120"), None),
+        (_response(429, "soon"), None),
+    ],
+)
+def test_get_retry_after(response, expected):
+    assert get_retry_after(response) == expected
+
+
+def test_get_retry_after_http_date():
+    resp = _response(429, formatdate(time.time() + 60, usegmt=True))
+    assert 55 <= get_retry_after(resp) <= 60
+
+    resp = _response(429, formatdate(time.time() - 60, usegmt=True))
+    assert get_retry_after(resp) == 0
+
+
+@pytest.fixture()
+def spans():
+    exporter = ListExporter()
+    set_tracer(Tracer(exporter))
+    yield exporter.spans
+    set_tracer(None)
+
+
+@pytest.fixture()
+def http_server():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_traced_adapter():
+    adapter = create_adapter(5, 2)
+
+    assert isinstance(adapter, TracedHTTPAdapter)
+    assert adapter.poolmanager.pool_classes_by_scheme == {
+        "http": TracedHTTPConnectionPool,
+        "https": TracedHTTPSConnectionPool,
+    }
+
+
+def test_traced_connect(spans, http_server):
+    session = requests.Session()
+    session.mount("http://", create_adapter(1, 0))
+
+    with span("request"):
+        assert session.get(http_server, timeout=5).text == "ok"
+        assert session.get(http_server, timeout=5).text == "ok"
+
+    # The second request reuses the pooled connection.
+    connect, request = spans
+    assert connect.name == "connect"
+    assert connect.parent_id == request.span_id
+    assert connect.attributes["host"] == "127.0.0.1"
+
+
+def test_traced_tls(mocker, spans):
+    mocker.patch("sud.session.HTTPSConnection.connect")
+    conn = TracedHTTPSConnection("example.com", 443)
+    conn._connected_at = time.perf_counter() - 0.1
+
+    conn.connect()
+
+    assert spans[0].name == "tls"
+    assert spans[0].duration >= 0.1
+    assert spans[0].attributes == {"host": "example.com"}
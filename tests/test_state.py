@@ -0,0 +1,142 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+from sud.exceptions import SudException
+from sud.state import State
+
+
+def test_addresses():
+    state = State()
+    assert state.get_address("my.host.name") is None
+
+    state.set_address("my.host.name", "1.2.3.4")
+    assert state.get_address("my.host.name") == "1.2.3.4"
+    assert state.get_address("my.host.name", "AAAA") is None
+
+    state.invalidate("my.host.name")
+    assert state.get_address("my.host.name") is None
+    state.invalidate("other.host.name")
+
+
+def test_needs_reconciliation(mocker):
+    mocker.patch("sud.state.time.time", return_value=1000.0)
+    state = State()
+    assert state.needs_reconciliation("my.host.name", timedelta(hours=1)) is True
+
+    state.mark_reconciled("my.host.name")
+    assert state.get_reconciled_at("my.host.name") == 1000.0
+    assert state.needs_reconciliation("my.host.name", timedelta(hours=1)) is False
+    assert state.needs_reconciliation("other.host.name", timedelta(hours=1)) is True
+
+    mocker.patch("sud.state.time.time", return_value=1000.0 + 3600)
+    assert state.needs_reconciliation("my.host.name", timedelta(hours=1)) is True
+
+
+def test_invalidate_needs_reconciliation():
+    state = State()
+    state.set_address("my.host.name", "1.2.3.4")
+    state.mark_reconciled("my.host.name")
+
+    state.invalidate("my.host.name")
+
+    assert state.needs_reconciliation("my.host.name", timedelta(hours=1)) is True
+
+
+def test_zones(mocker):
+    mocker.patch("sud.state.time.time", return_value=1000.0)
+    state = State()
+    assert state.zones is None
+    assert state.get_zones_age() is None
+
+    state.set_zones(["example.com"])
+    mocker.patch("sud.state.time.time", return_value=1060.0)
+
+    assert state.zones == ["example.com"]
+    assert state.get_zones_age() == 60.0
+
+
+def test_store_and_load(tmp_path):
+    state_file = tmp_path / "state" / "sud.json"
+    state = State(str(state_file))
+    state.set_address("my.host.name", "1.2.3.4")
+    state.mark_reconciled("my.host.name")
+    state.set_zones(["host.name"])
+    state.store()
+
+    assert not (tmp_path / "state" / "sud.json.tmp").exists()
+
+    loaded = State(str(state_file))
+    loaded.load()
+    assert loaded.get_address("my.host.name") == "1.2.3.4"
+    assert loaded.zones == ["host.name"]
+    assert loaded.get_zones_age() is not None
+    assert loaded.get_reconciled_at("my.host.name") == state.get_reconciled_at(
+        "my.host.name",
+    )
+
+
+def test_load_version_1(tmp_path):
+    state_file = tmp_path / "state.json"
+    state_file.write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "reconciled_at": 1000.0,
+                "records": {"my.host.name": {"A": "1.2.3.4"}},
+            },
+        ),
+    )
+
+    state = State(str(state_file))
+    state.load()
+
+    assert state.get_address("my.host.name") == "1.2.3.4"
+    assert state.get_reconciled_at("my.host.name") is None
+
+
+def test_no_state_file(mocker):
+    m_open = mocker.patch("sud.state.open")
+    state = State()
+    state.load()
+    state.store()
+    m_open.assert_not_called()
+
+
+def test_load_missing_file(tmp_path):
+    state = State(str(tmp_path / "missing.json"))
+    state.load()
+    assert state.get_reconciled_at("my.host.name") is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "not json",
+        json.dumps({"version": 1}),
+        json.dumps([]),
+        json.dumps({"version": 999, "records": {}, "reconciled_at": 1}),
+    ],
+)
+def test_load_invalid_file(tmp_path, content):
+    state_file = tmp_path / "state.json"
+    state_file.write_text(content)
+
+    state = State(str(state_file))
+    state.load()
+
+    assert state.get_reconciled_at("my.host.name") is None
+    assert state.get_address("my.host.name") is None
+
+
+def test_store_exception(mocker):
+    mocker.patch("sud.state.os.path.exists", return_value=True)
+    mocker.patch("sud.state.open", side_effect=OSError("msg"))
+
+    state = State("/dir/state.json")
+
+    with pytest.raises(SudException) as raised:
+        state.store()
+
+    assert raised.value.message == "Cannot save the SUD state file: msg"
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from sud.exceptions import SudException
+from sud.tracing import (
+    Exporter,
+    JSONLExporter,
+    SpanStats,
+    Tracer,
+    create_tracer,
+    get_tracer,
+    percentile,
+    record_span,
+    set_tracer,
+    span,
+    summarize,
+)
+
+
+class ListExporter(Exporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+def exporter_factory():
+    return ListExporter()
+
+
+@pytest.fixture()
+def exporter():
+    exporter = ListExporter()
+    set_tracer(Tracer(exporter))
+    yield exporter
+    set_tracer(None)
+
+
+def test_span_disabled():
+    assert get_tracer() is None
+    with span("test") as current:
+        assert current is None
+
+
+def test_span(exporter):
+    with span("cycle", hosts=2) as cycle:
+        with span("lookup", zone="example.com"):
+            pass
+        record_span("tls", 100.0, 0.5, host="example.com")
+
+    lookup, tls, root = exporter.spans
+    assert root is cycle
+    assert root.name == "cycle"
+    assert root.parent_id is None
+    assert root.attributes == {"hosts": 2}
+    assert root.duration >= lookup.duration
+    assert lookup.trace_id == root.trace_id
+    assert lookup.parent_id == root.span_id
+    assert lookup.attributes == {"zone": "example.com"}
+    assert tls.parent_id == root.span_id
+    assert (tls.start, tls.duration) == (100.0, 0.5)
+
+
+def test_span_new_trace(exporter):
+    with span("a"):
+        pass
+    with span("b"):
+        pass
+
+    a, b = exporter.spans
+    assert a.trace_id != b.trace_id
+
+
+def test_span_error(exporter):
+    with pytest.raises(ValueError), span("write"):
+        raise ValueError("boom")
+
+    assert exporter.spans[0].error == "ValueError: boom"
+
+
+def test_span_thread(exporter):
+    def work():
+        with span("connect"):
+            pass
+
+    with span("request") as request:
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    # Plain threads don't inherit the context, unlike asyncio.to_thread.
+    assert exporter.spans[0].parent_id is None
+    assert exporter.spans[1] is request
+
+
+@pytest.mark.asyncio()
+async def test_span_to_thread(exporter):
+    def work():
+        with span("connect"):
+            pass
+
+    with span("request") as request:
+        await asyncio.to_thread(work)
+
+    assert exporter.spans[0].parent_id == request.span_id
+
+
+def test_tracer_export_error(mocker, caplog):
+    exporter = mocker.MagicMock()
+    exporter.export.side_effect = OSError("disk full")
+
+    Tracer(exporter).export(mocker.MagicMock(name="span"))
+
+    assert "disk full" in caplog.text
+
+
+def test_record_span_disabled():
+    record_span("tls", 0, 0)
+
+
+def test_jsonl_exporter(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = create_tracer(path=str(path))
+    set_tracer(tracer)
+    try:
+        with span("cycle"):
+            pass
+    finally:
+        set_tracer(None)
+        tracer.close()
+
+    data = json.loads(path.read_text())
+    assert data["name"] == "cycle"
+    assert set(data) == {
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "duration",
+        "attributes",
+        "error",
+    }
+
+
+def test_jsonl_exporter_error(tmp_path):
+    with pytest.raises(SudException) as raised:
+        JSONLExporter(str(tmp_path / "missing" / "trace.jsonl"))
+
+    assert raised.value.message.startswith("Cannot open the trace file: ")
+
+
+def test_create_tracer_exporter():
+    tracer = create_tracer(exporter="tests.test_tracing:exporter_factory")
+    assert isinstance(tracer.exporter, ListExporter)
+
+
+@pytest.mark.parametrize(
+    "exporter",
+    ["tests.missing:factory", "tests.test_tracing:missing", "tests.test_tracing"],
+)
+def test_create_tracer_invalid_exporter(exporter):
+    with pytest.raises(SudException) as raised:
+        create_tracer(exporter=exporter)
+
+    assert raised.value.message.startswith(
+        f"Cannot load the trace exporter {exporter}: ",
+    )
+
+
+def test_create_tracer_no_output():
+    with pytest.raises(SudException):
+        create_tracer()
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3
+    assert percentile([1.0, 2.0], 0) == 1
+
+
+def test_summarize():
+    lines = [
+        json.dumps({"name": "request", "duration": 0.2}),
+        "",
+        json.dumps({"name": "cycle", "duration": 1.0}),
+        json.dumps({"name": "request", "duration": 0.1, "error": "Timeout"}),
+    ]
+
+    assert summarize(lines) == {
+        "cycle": SpanStats(count=1, p50=1.0, p95=1.0, p99=1.0, max=1.0, errors=0),
+        "request": SpanStats(count=2, p50=0.1, p95=0.2, p99=0.2, max=0.2, errors=1),
+    }
+
+
+@pytest.mark.parametrize("line", ["not json", '{"name": "x"}', '{"duration": 1}'])
+def test_summarize_invalid(line):
+    with pytest.raises(SudException) as raised:
+        summarize([line])
+
+    assert raised.value.message.startswith("Invalid span at line 1: ")
@@ -1,8 +1,11 @@
+import asyncio
+import json
 import logging
+import threading
+import time
 from urllib.parse import urljoin
 
 import pytest
-import telegram
 from requests import RequestException
 from responses import matchers
 
@@ -10,11 +13,29 @@ from sud.config import Config
 from sud.constants import (
     CHECK_IP_ADDRESS,
     SCALEWAY_API_BASE_URL,
-    TG_CREATED_MSG,
-    TG_UPDATED_MSG,
 )
-from sud.exceptions import SudException
-from sud.updater import ARecordInfo, Updater
+from sud.deadline import deadline
+from sud.exceptions import (
+    APIException,
+    DeadlineExceeded,
+    RetryLaterException,
+    SudException,
+)
+from sud.notifications import Notification
+from sud.records import ZoneRecordIndex, ZoneSuffixTrie
+from sud.state import State
+from sud.tracing import Tracer, get_tracer, set_tracer
+from sud.updater import ARecordInfo, CycleResult, Updater
+from tests.test_tracing import ListExporter
+
+RESOLVE_ZONES = Updater.resolve_zones
+
+
+@pytest.fixture(autouse=True)
+def resolve_zones(mocker):
+    # Without a listing of the zones, hostnames fall in the zone of their
+    # last two labels.
+    return mocker.patch.object(Updater, "resolve_zones")
 
 
 def test_arecord_info_from_hostname():
@@ -47,32 +68,36 @@ def test_arecord_info_from_hostname():
 def test_get_dns_name():
     info = ARecordInfo.from_hostname("test.example.com")
     assert info.get_dns_name() == "test.example.com."
+    assert info.get_hostname() == "test.example.com"
 
     info2 = ARecordInfo.from_hostname("example.com")
     assert info2.get_dns_name() == "example.com."
+    assert info2.get_hostname() == "example.com"
 
 
-def test_discover_address(requests_mocker):
+@pytest.mark.asyncio()
+async def test_discover_address(requests_mocker, config):
     requests_mocker.get(
         CHECK_IP_ADDRESS,
         body="1.2.3.4",
     )
 
-    assert Updater.discover_address() == "1.2.3.4"
+    assert await Updater(config).discover_address() == "1.2.3.4"
 
 
-def test_discover_address_fail(requests_mocker):
+@pytest.mark.asyncio()
+async def test_discover_address_fail(requests_mocker, config):
     requests_mocker.get(
         CHECK_IP_ADDRESS,
         status=500,
     )
 
     with pytest.raises(SudException) as raised:
-        Updater.discover_address()
+        await Updater(config).discover_address()
 
     assert raised.value.message == (
         "Cannot determine current public ip address: "
-        "500 Server Error: Internal Server Error for "
+        "https://checkip.amazonaws.com/: 500 Server Error: Internal Server Error for "
         "url: https://checkip.amazonaws.com/."
     )
 
@@ -80,140 +105,418 @@ def test_discover_address_fail(requests_mocker):
 def test_init(config):
     upd = Updater(config)
     assert upd._config == config
+    assert upd._session.get_adapter(CHECK_IP_ADDRESS)._pool_maxsize == 1
+    assert upd._session.get_adapter(SCALEWAY_API_BASE_URL)._pool_maxsize == (
+        config.pool_size
+    )
 
 
-def test_get_record_found(requests_mocker, config):
-    info = ARecordInfo.from_hostname(config.hostname)
+def test_close(mocker, config):
+    upd = Updater(config)
+    m_close = mocker.patch.object(upd._session, "close")
+
+    upd.close()
+
+    m_close.assert_called_once()
+
+
+def test_close_after_interrupted_write(mocker, config):
+    async def write_zone(domain, pending):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(Updater, "write_zone", new=mocker.Mock(side_effect=write_zone))
+    upd = Updater(config)
+    m_close = mocker.patch.object(upd._session, "close")
+
+    async def main():
+        # A write in flight and a queued one when the loop stops.
+        for name in ("a", "b"):
+            asyncio.create_task(
+                upd.write(
+                    "example.com", [(ARecordInfo(name, "example.com"), "1.2.3.4", None)]
+                )
+            )
+            await asyncio.sleep(0)
 
+    asyncio.run(main())
+    upd.close()
+
+    m_close.assert_called_once()
+
+
+@pytest.mark.asyncio()
+async def test_fetch_records(requests_mocker, config):
+    url = urljoin(SCALEWAY_API_BASE_URL, "dns-zones/host.name/records")
     requests_mocker.get(
-        urljoin(
-            SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
-        ),
-        status=200,
+        url,
         match=[
             matchers.header_matcher({"X-Auth-Token": config.api_secret}),
-            matchers.query_param_matcher(
-                {
-                    "type": "A",
-                    "name": info.name,
-                },
-            ),
+            matchers.query_param_matcher({"page": "1", "page_size": "2"}),
         ],
         json={
+            "total_count": 3,
             "records": [
-                {
-                    "name": info.name,
-                    "ttl": 300,
-                    "data": "1.2.3.4",
-                },
+                {"name": "my", "type": "A", "ttl": 300, "data": "1.2.3.4"},
+                {"name": "my", "type": "MX", "ttl": 300, "data": "10 mx"},
             ],
         },
     )
+    requests_mocker.get(
+        url,
+        match=[
+            matchers.query_param_matcher({"page": "2", "page_size": "2"}),
+        ],
+        json={
+            "total_count": 3,
+            "records": [
+                {"name": "other", "type": "A", "ttl": 60, "data": "5.6.7.8"},
+            ],
+        },
+    )
+
+    upd = Updater(config)
+    upd.RECORDS_PAGE_SIZE = 2
+    index = await upd.fetch_records("host.name")
+
+    assert len(index) == 2
+    assert index.get("my") == ARecordInfo("my", "host.name", 300, "1.2.3.4")
+    assert index.get("other") == ARecordInfo("other", "host.name", 60, "5.6.7.8")
+    assert upd._indexes["host.name"] is index
+
+
+@pytest.mark.asyncio()
+async def test_fetch_zones(requests_mocker, config):
+    url = urljoin(SCALEWAY_API_BASE_URL, "dns-zones")
+    requests_mocker.get(
+        url,
+        match=[
+            matchers.header_matcher({"X-Auth-Token": config.api_secret}),
+            matchers.query_param_matcher({"page": "1", "page_size": "2"}),
+        ],
+        json={
+            "total_count": 3,
+            "dns_zones": [
+                {"domain": "example.com", "subdomain": ""},
+                {"domain": "example.com", "subdomain": "sub"},
+            ],
+        },
+    )
+    requests_mocker.get(
+        url,
+        match=[matchers.query_param_matcher({"page": "2", "page_size": "2"})],
+        json={
+            "total_count": 3,
+            "dns_zones": [{"domain": "example.co.uk", "subdomain": ""}],
+        },
+    )
+
+    upd = Updater(config)
+    upd.ZONES_PAGE_SIZE = 2
+    zones = await upd.fetch_zones()
+
+    assert len(zones) == 3
+    assert zones.lookup("host.sub.example.com") == "sub.example.com"
+    assert zones.lookup("host.example.co.uk") == "example.co.uk"
+
+
+@pytest.mark.asyncio()
+async def test_fetch_zones_http_error(requests_mocker, config):
+    requests_mocker.get(urljoin(SCALEWAY_API_BASE_URL, "dns-zones"), status=403)
+
+    upd = Updater(config)
+
+    with pytest.raises(APIException) as raised:
+        await upd.fetch_zones()
+
+    assert raised.value.status == 403
+    assert raised.value.message.startswith(
+        "Cannot list the DNS zones: 403 Client Error"
+    )
+
+
+@pytest.mark.asyncio()
+async def test_resolve_zones(mocker, config):
+    zones = ZoneSuffixTrie(["example.com"])
+    m_fetch = mocker.patch.object(Updater, "fetch_zones", return_value=zones)
+    upd = Updater(config)
+
+    await RESOLVE_ZONES(upd)
+    await RESOLVE_ZONES(upd)
+
+    assert upd._zones is zones
+    assert m_fetch.call_count == 1
+
+    assert upd._state.zones == ["example.com"]
+
+    # Once expired, a failed listing keeps the previous zones.
+    upd._zones_expiry = 0
+    mocker.patch.object(State, "get_zones_age", return_value=3600)
+    m_fetch.side_effect = SudException("Cannot list the DNS zones: boom")
+    await RESOLVE_ZONES(upd)
+
+    assert upd._zones is zones
+    assert m_fetch.call_count == 2
+
+
+@pytest.mark.asyncio()
+async def test_resolve_zones_from_state(mocker, config):
+    m_fetch = mocker.patch.object(Updater, "fetch_zones")
+    upd = Updater(config)
+    upd._state.set_zones(["example.com"])
+
+    await RESOLVE_ZONES(upd)
+
+    # Listed by a previous run.
+    m_fetch.assert_not_called()
+    assert upd.get_record_info("a.example.com").domain == "example.com"
+
+
+@pytest.mark.asyncio()
+async def test_resolve_zones_unavailable_from_state(mocker, caplog, config):
+    mocker.patch.object(
+        Updater,
+        "fetch_zones",
+        side_effect=SudException("Cannot list the DNS zones: 500"),
+    )
+    upd = Updater(config)
+    upd._state.set_zones(["example.com"])
+    mocker.patch.object(State, "get_zones_age", return_value=3600)
 
+    with caplog.at_level(logging.WARNING):
+        await RESOLVE_ZONES(upd)
+
+    assert list(upd._zones) == ["example.com"]
+    assert "Cannot list the DNS zones: 500, the previous zones are kept" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_resolve_zones_unavailable(mocker, caplog, config):
+    mocker.patch.object(
+        Updater,
+        "fetch_zones",
+        side_effect=SudException("Cannot list the DNS zones: 403"),
+    )
     upd = Updater(config)
-    result = upd.get_record()
 
-    assert isinstance(result, ARecordInfo)
-    assert result.name == "my"
-    assert result.domain == "host.name"
-    assert result.ttl == 300
-    assert result.address == "1.2.3.4"
+    with caplog.at_level(logging.WARNING):
+        await RESOLVE_ZONES(upd)
+
+    assert upd._zones is None
+    assert (
+        "Cannot list the DNS zones: 403, zones are guessed from the hostnames"
+        in caplog.text
+    )
 
 
 @pytest.mark.parametrize(
-    "records",
+    ("error", "delay"),
     [
-        [],
-        [{"name": "other"}],
+        (SudException("Cannot list the DNS zones: 500"), Updater.ZONES_RETRY_DELAY),
+        (RetryLaterException("Cannot list the DNS zones: 429", 300, 429), 300),
     ],
 )
-def test_get_record_not_found(requests_mocker, config, records):
-    info = ARecordInfo.from_hostname(config.hostname)
+@pytest.mark.asyncio()
+async def test_resolve_zones_retry_delay(mocker, config, error, delay):
+    m_fetch = mocker.patch.object(Updater, "fetch_zones", side_effect=error)
+    upd = Updater(config)
 
+    await RESOLVE_ZONES(upd)
+    await RESOLVE_ZONES(upd)
+
+    # Not listed again on every request until the delay is over.
+    assert m_fetch.call_count == 1
+    assert upd._zones_expiry - time.monotonic() == pytest.approx(delay, abs=1)
+
+
+@pytest.mark.asyncio()
+async def test_fetch_records_empty_page(requests_mocker, config):
     requests_mocker.get(
-        urljoin(
-            SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
-        ),
-        status=200,
-        json={"records": records},
+        urljoin(SCALEWAY_API_BASE_URL, "dns-zones/host.name/records"),
+        json={"total_count": 10, "records": []},
     )
 
     upd = Updater(config)
-    result = upd.get_record()
+    index = await upd.fetch_records("host.name")
 
-    assert result is None
+    assert len(index) == 0
 
 
-def test_get_record_http_error(requests_mocker, config):
-    info = ARecordInfo.from_hostname(config.hostname)
-
+@pytest.mark.asyncio()
+async def test_fetch_records_http_error(requests_mocker, config):
     requests_mocker.get(
-        urljoin(
-            SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
-        ),
+        urljoin(SCALEWAY_API_BASE_URL, "dns-zones/host.name/records"),
         status=500,
     )
 
     upd = Updater(config)
 
     with pytest.raises(SudException) as raised:
-        upd.get_record()
+        await upd.fetch_records("host.name")
 
     assert raised.value.message.startswith(
-        f"Cannot retrieve information for A record `{info.name}` "
-        f"from zone `{info.domain}`: 500 Server Error"
+        "Cannot retrieve records of zone `host.name`: 500 Server Error"
     )
 
 
-def test_get_record_request_exception(mocker, config):
-    mocker.patch(
-        "sud.updater.requests.get",
+@pytest.mark.asyncio()
+async def test_fetch_records_request_exception(mocker, config):
+    upd = Updater(config)
+    mocker.patch.object(
+        upd._session,
+        "request",
         side_effect=RequestException("msg"),
     )
 
+    with pytest.raises(SudException) as raised:
+        await upd.fetch_records("host.name")
+
+    assert raised.value.message == "Cannot retrieve records of zone `host.name`: msg"
+
+
+@pytest.mark.asyncio()
+async def test_get_record(mocker, config):
+    index = ZoneRecordIndex("host.name")
+    index.load([{"name": "my", "type": "A", "ttl": 300, "data": "1.2.3.4"}])
+    m_fetch = mocker.patch.object(Updater, "fetch_records", return_value=index)
     info = ARecordInfo.from_hostname(config.hostname)
 
     upd = Updater(config)
 
-    with pytest.raises(SudException) as raised:
-        upd.get_record()
+    assert await upd.get_record(info) == ARecordInfo("my", "host.name", 300, "1.2.3.4")
+    assert await upd.get_record(ARecordInfo("other", "host.name")) is None
+    assert m_fetch.call_count == 2
 
-    assert raised.value.message.startswith(
-        f"Cannot retrieve information for A record `{info.name}` "
-        f"from zone `{info.domain}`: msg"
+    upd._indexes["host.name"] = index
+    assert (await upd.get_record(info)).address == "1.2.3.4"
+    assert m_fetch.call_count == 2
+
+
+def test_get_zones(config):
+    config.hostnames = ["a.example.com", "b.example.com", "c.example.org"]
+    upd = Updater(config)
+
+    zones, failed = upd.get_zones()
+
+    assert list(zones.keys()) == ["example.com", "example.org"]
+    assert [info.name for info in zones["example.com"]] == ["a", "b"]
+    assert [info.name for info in zones["example.org"]] == ["c"]
+    assert failed == {}
+
+
+def test_get_zones_listed(config):
+    config.hostnames = [
+        "a.example.co.uk",
+        "b.sub.example.com",
+        "c.example.com",
+        "d.example.org",
+    ]
+    upd = Updater(config)
+    upd._zones = ZoneSuffixTrie(["example.co.uk", "example.com", "sub.example.com"])
+
+    zones, failed = upd.get_zones()
+
+    assert {
+        domain: [info.name for info in infos] for domain, infos in zones.items()
+    } == {
+        "example.co.uk": ["a"],
+        "sub.example.com": ["b"],
+        "example.com": ["c"],
+    }
+    assert [(hostname, str(error)) for hostname, error in failed.items()] == [
+        ("d.example.org", "No DNS zone of the account contains d.example.org"),
+    ]
+    assert upd.get_zones(["c.example.com"]) == (
+        {"example.com": [ARecordInfo("c", "example.com")]},
+        {},
     )
 
 
-def test_add_record(mocker, requests_mocker, config):
-    info = ARecordInfo.from_hostname(config.hostname)
+def test_get_zones_dual_stack(config):
+    config._config["hostnames"] = [
+        {"name": "a.example.com", "record_types": ["A", "AAAA"]},
+        {"name": "b.example.com", "record_types": ["AAAA"]},
+    ]
+    upd = Updater(config)
+
+    zones, _ = upd.get_zones()
+
+    assert [(info.name, info.record_type) for info in zones["example.com"]] == [
+        ("a", "A"),
+        ("a", "AAAA"),
+        ("b", "AAAA"),
+    ]
+    assert list(upd._discoverers) == ["A", "AAAA"]
+
+
+def test_aaaa_changes():
+    info = ARecordInfo.from_hostname("my.host.name", "AAAA")
+
+    assert Updater.add_change(info, "2001:db8::1")["add"]["records"][0]["type"] == (
+        "AAAA"
+    )
+    change = Updater.set_change(info, "2001:db8::1")["set"]
+    assert change["id_fields"] == {"name": "my.host.name.", "type": "AAAA"}
+    assert change["records"][0]["type"] == "AAAA"
+
+
+def test_add_change():
+    info = ARecordInfo.from_hostname("my.host.name")
+
+    assert Updater.add_change(info, "1.2.3.4") == {
+        "add": {
+            "records": [
+                {
+                    "name": "my.host.name.",
+                    "type": "A",
+                    "ttl": 300,
+                    "data": "1.2.3.4",
+                },
+            ],
+        },
+    }
+
+
+def test_set_change():
+    info = ARecordInfo.from_hostname("my.host.name")
+
+    assert Updater.set_change(info, "5.6.7.8") == {
+        "set": {
+            "id_fields": {
+                "name": "my.host.name.",
+                "type": "A",
+            },
+            "records": [
+                {
+                    "name": "my.host.name.",
+                    "type": "A",
+                    "ttl": 300,
+                    "data": "5.6.7.8",
+                },
+            ],
+        },
+    }
+
+
+@pytest.mark.asyncio()
+async def test_update_zone_batch(requests_mocker, config):
+    first = ARecordInfo.from_hostname("first.host.name")
+    second = ARecordInfo.from_hostname("second.host.name")
+    changes = [
+        Updater.add_change(first, "1.2.3.4"),
+        Updater.set_change(second, "1.2.3.4"),
+    ]
 
     requests_mocker.patch(
         urljoin(
             SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
+            "dns-zones/host.name/records",
         ),
         status=200,
         match=[
             matchers.header_matcher({"X-Auth-Token": config.api_secret}),
             matchers.json_params_matcher(
                 {
-                    "changes": [
-                        {
-                            "add": {
-                                "records": [
-                                    {
-                                        "name": info.get_dns_name(),
-                                        "type": "A",
-                                        "ttl": info.ttl,
-                                        "data": "1.2.3.4",
-                                    },
-                                ],
-                            },
-                        },
-                    ],
+                    "changes": changes,
                     "disallow_new_zone_creation": True,
                     "return_all_records": False,
                 },
@@ -222,7 +525,14 @@ def test_add_record(mocker, requests_mocker, config):
         json={
             "records": [
                 {
-                    "name": info.name,
+                    "name": "first",
+                    "type": "A",
+                    "ttl": 300,
+                    "data": "1.2.3.4",
+                },
+                {
+                    "name": "second",
+                    "type": "A",
                     "ttl": 300,
                     "data": "1.2.3.4",
                 },
@@ -231,22 +541,65 @@ def test_add_record(mocker, requests_mocker, config):
     )
 
     upd = Updater(config)
-    result = upd.add_record("1.2.3.4")
+    index = ZoneRecordIndex("host.name")
+    index.load([{"name": "second", "type": "A", "ttl": 300, "data": "9.8.7.6"}])
+    upd._indexes["host.name"] = index
+    result = await upd._update_zone("host.name", changes)
 
-    assert isinstance(result, ARecordInfo)
-    assert result.name == "my"
-    assert result.domain == "host.name"
-    assert result.ttl == 300
-    assert result.address == "1.2.3.4"
+    assert len(result) == 2
+    assert all(isinstance(record, ARecordInfo) for record in result)
+    assert [record.name for record in result] == ["first", "second"]
+    assert all(record.domain == "host.name" for record in result)
+    assert all(record.address == "1.2.3.4" for record in result)
+    assert upd._indexes["host.name"] is index
+    assert index.get("first").address == "1.2.3.4"
+    assert index.get("second").address == "1.2.3.4"
 
 
-def test_add_record_http_error(requests_mocker, config):
+@pytest.mark.asyncio()
+async def test_update_zone_no_index(requests_mocker, config):
     info = ARecordInfo.from_hostname(config.hostname)
+    changes = [Updater.add_change(info, "1.2.3.4")]
+
+    requests_mocker.patch(
+        urljoin(
+            SCALEWAY_API_BASE_URL,
+            "dns-zones/host.name/records",
+        ),
+        status=200,
+        match=[
+            matchers.json_params_matcher(
+                {
+                    "changes": changes,
+                    "disallow_new_zone_creation": True,
+                    "return_all_records": True,
+                },
+            ),
+        ],
+        json={
+            "records": [
+                {"name": "my", "type": "A", "ttl": 300, "data": "1.2.3.4"},
+                {"name": "www", "type": "A", "ttl": 300, "data": "4.3.2.1"},
+                {"name": "", "type": "TXT", "ttl": 300, "data": "txt"},
+            ],
+        },
+    )
+
+    upd = Updater(config)
+    result = await upd._update_zone("host.name", changes)
+
+    assert len(result) == 2
+    index = upd._indexes["host.name"]
+    assert index.get("my").address == "1.2.3.4"
+    assert index.get("www").address == "4.3.2.1"
 
+
+@pytest.mark.asyncio()
+async def test_update_zone_http_error(requests_mocker, config):
     requests_mocker.patch(
         urljoin(
             SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
+            "dns-zones/host.name/records",
         ),
         status=500,
         json={},
@@ -255,212 +608,1108 @@ def test_add_record_http_error(requests_mocker, config):
     upd = Updater(config)
 
     with pytest.raises(SudException) as raised:
-        upd.add_record("1.2.3.4")
+        await upd._update_zone("host.name", [])
 
     assert raised.value.message.startswith(
-        f"Cannot add A record for `{info.name}` "
-        f"to zone `{info.domain}`: 500 Server Error"
+        "Cannot update records of zone `host.name`: 500 Server Error"
     )
 
 
-def test_add_record_request_exception(mocker, config):
-    mocker.patch(
-        "sud.updater.requests.patch",
+@pytest.mark.asyncio()
+async def test_update_zone_request_exception(mocker, config):
+    upd = Updater(config)
+    mocker.patch.object(
+        upd._session,
+        "request",
         side_effect=RequestException("msg"),
     )
 
-    info = ARecordInfo.from_hostname(config.hostname)
+    with pytest.raises(SudException) as raised:
+        await upd._update_zone("host.name", [])
 
-    upd = Updater(config)
+    assert raised.value.message == "Cannot update records of zone `host.name`: msg"
 
-    with pytest.raises(SudException) as raised:
-        upd.add_record("1.2.3.4")
 
-    assert raised.value.message.startswith(
-        f"Cannot add A record for `{info.name}` " f"to zone `{info.domain}`: msg"
+@pytest.mark.parametrize(
+    ("changed", "failed", "status"),
+    [
+        ([], [], "unchanged"),
+        (["a.example.com"], [], "updated"),
+        (["a.example.com"], ["b.example.com"], "partial"),
+        ([], ["a.example.com", "b.example.com"], "failed"),
+    ],
+)
+def test_cycle_result_status(changed, failed, status):
+    result = CycleResult(
+        ["a.example.com", "b.example.com"],
+        changed=changed,
+        failed={hostname: SudException("boom") for hostname in failed},
     )
 
+    assert result.status == status
 
-def test_change_record(mocker, requests_mocker, config):
-    info = ARecordInfo.from_hostname(config.hostname)
 
-    requests_mocker.patch(
-        urljoin(
-            SCALEWAY_API_BASE_URL,
-            f"dns-zones/{info.domain}/records",
-        ),
-        status=200,
-        match=[
-            matchers.header_matcher({"X-Auth-Token": config.api_secret}),
-            matchers.json_params_matcher(
-                {
-                    "changes": [
-                        {
-                            "set": {
-                                "id_fields": {
-                                    "name": info.get_dns_name(),
-                                    "type": "A",
-                                },
-                                "records": [
-                                    {
-                                        "name": info.get_dns_name(),
-                                        "type": "A",
-                                        "ttl": info.ttl,
-                                        "data": "5.6.7.8",
-                                    },
-                                ],
-                            },
-                        }
-                    ],
-                    "disallow_new_zone_creation": True,
-                    "return_all_records": False,
-                },
-            ),
-        ],
-        json={
-            "records": [
-                {
-                    "name": info.name,
-                    "ttl": 300,
-                    "data": "5.6.7.8",
-                },
-            ],
-        },
+def test_cycle_result_to_dict():
+    result = CycleResult(
+        ["a.example.com", "b.example.com", "c.example.com"],
+        changed=["a.example.com"],
+        failed={"c.example.com": SudException("boom")},
     )
 
-    upd = Updater(config)
-    result = upd.change_record("5.6.7.8")
+    assert result.to_dict() == {
+        "status": "partial",
+        "changed": ["a.example.com"],
+        "unchanged": ["b.example.com"],
+        "failed": {"c.example.com": "boom"},
+    }
 
-    assert isinstance(result, ARecordInfo)
-    assert result.name == "my"
-    assert result.domain == "host.name"
-    assert result.ttl == 300
-    assert result.address == "5.6.7.8"
 
+def test_sync(mocker, config):
+    result = CycleResult(["my.host.name"])
+    m_run_once = mocker.patch.object(Updater, "run_once", return_value=result)
+    m_close = mocker.patch.object(Updater, "close")
 
-def test_run(mocker, caplog, config):
-    mocker.patch.object(
+    assert Updater(config).sync(reconcile=True) is result
+
+    m_run_once.assert_awaited_once_with(True)
+    m_close.assert_called_once()
+
+
+@pytest.mark.parametrize("method", ["run", "sync"])
+def test_run_without_hostnames(mocker, method):
+    m_close = mocker.patch.object(Updater, "close")
+    upd = Updater(Config(mocker.MagicMock(), {}))
+
+    with pytest.raises(SudException) as raised:
+        getattr(upd, method)()
+
+    assert raised.value.message == "No hostnames are configured"
+    m_close.assert_called_once()
+
+
+@pytest.mark.asyncio()
+async def test_run_once(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.org"]
+    m_start = mocker.patch("sud.updater.NotificationDispatcher.start")
+    m_close = mocker.patch("sud.updater.NotificationDispatcher.close")
+    m_update = mocker.patch.object(
         Updater,
         "update",
-        side_effect=[None, SudException("error"), KeyboardInterrupt()],
-    )
-    m_sleep = mocker.patch(
-        "sud.updater.time.sleep",
+        return_value=CycleResult(
+            ["a.example.com", "b.example.org"],
+            changed=["a.example.com"],
+        ),
     )
+
     upd = Updater(config)
-    with caplog.at_level(logging.INFO):
-        upd.run()
+    result = await upd.run_once(reconcile=True)
 
-    assert m_sleep.call_count == 2
-    assert m_sleep.mock_calls[0].args[0] == config.frequency.seconds
-    assert len(caplog.records) == 3
-    assert caplog.records[0].levelname == "INFO"
-    assert caplog.records[0].message.startswith("Wait 5 minutes before")
+    assert result.status == "updated"
+    m_update.assert_awaited_once_with(
+        ["a.example.com", "b.example.org"],
+        reconcile=True,
+    )
+    m_start.assert_awaited_once()
+    m_close.assert_awaited_once_with(config.timeouts.notify)
+    assert upd._metrics.changes.get(hostname="a.example.com") == 1
 
-    assert caplog.records[1].levelname == "ERROR"
-    assert caplog.records[1].message == "Error while updating: error"
 
-    assert caplog.records[2].levelname == "INFO"
-    assert caplog.records[2].message == "Exiting..."
+@pytest.mark.asyncio()
+async def test_run_once_error(mocker, config):
+    mocker.patch.object(Updater, "update", side_effect=SudException("no ip"))
 
+    result = await Updater(config).run_once()
 
-def test_update_no_record(mocker, config):
+    assert result.status == "failed"
+    assert result.failed[config.hostname].message == "no ip"
+
+
+def test_run(mocker, caplog, config):
+    mocker.patch.object(Updater, "run_forever", side_effect=KeyboardInterrupt())
+    m_close = mocker.patch.object(Updater, "close")
+    upd = Updater(config)
+    with caplog.at_level(logging.INFO):
+        upd.run()
+
+    m_close.assert_called_once()
+    assert caplog.records[-1].message == "Exiting..."
+
+
+@pytest.mark.asyncio()
+async def test_run_forever(mocker, caplog, config):
+    config.hostnames = ["a.example.com", "b.example.org"]
+    config._config["schedule"] = {"jitter": 0}
+    m_update = mocker.patch.object(
+        Updater,
+        "update",
+        side_effect=[
+            CycleResult(["a.example.com", "b.example.org"]),
+            SudException("error"),
+        ],
+    )
+    m_sleep = mocker.patch.object(
+        Updater,
+        "sleep",
+        side_effect=[False, True, asyncio.CancelledError()],
+    )
+    mocker.patch("sud.updater.time.monotonic", return_value=1000.0)
+
+    upd = Updater(config)
+    with caplog.at_level(logging.INFO), pytest.raises(asyncio.CancelledError):
+        await upd.run_forever()
+
+    # Hosts are not due after the first sleep, a network change makes
+    # every host due immediately.
+    assert m_update.call_count == 2
+    assert m_update.mock_calls[1].args == (["a.example.com", "b.example.org"],)
+    assert m_sleep.mock_calls[0].args == (300.0,)
+    assert m_sleep.mock_calls[1].args == (300.0,)
+    assert caplog.records[0].message.startswith("Wait 5 minutes before")
+    assert "Error while updating: error" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_run_cycle(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com", "c.example.org"]
+    config._config["schedule"] = {"jitter": 0}
+    mocker.patch("sud.updater.time.monotonic", return_value=1000.0)
+    result = CycleResult(
+        ["a.example.com", "b.example.com", "c.example.org"],
+        changed=["a.example.com"],
+        failed={"c.example.org": RetryLaterException("slow down", 900)},
+    )
+    mocker.patch.object(Updater, "update", return_value=result)
+
+    upd = Updater(config)
+    scheduler = upd.create_scheduler()
+    hostnames = scheduler.pop_due(1000.0)
+    assert await upd.run_cycle(scheduler, hostnames) is result
+
+    assert scheduler["a.example.com"].next_run == 1000.0 + 60
+    assert scheduler["b.example.com"].next_run == 1000.0 + 300
+    assert scheduler["c.example.org"].next_run == 1000.0 + 900
+    assert [scheduler[hostname].failures for hostname in hostnames] == [0, 0, 1]
+
+
+@pytest.mark.asyncio()
+async def test_run_cycle_error(mocker, config):
+    config._config["schedule"] = {"jitter": 0}
+    mocker.patch("sud.updater.time.monotonic", return_value=1000.0)
+    mocker.patch.object(Updater, "update", side_effect=SudException("no ip"))
+
+    upd = Updater(config)
+    scheduler = upd.create_scheduler()
+    result = await upd.run_cycle(scheduler, scheduler.pop_due(1000.0))
+
+    assert result.failed[config.hostname].message == "no ip"
+    assert scheduler[config.hostname].failures == 1
+
+
+def test_create_scheduler(config):
+    config._config["hostnames"] = [
+        "a.example.com",
+        {"name": "b.example.com", "frequency": 60},
+    ]
+    config._config["schedule"] = {"jitter": 0.2, "max_backoff": 600}
+
+    scheduler = Updater(config).create_scheduler()
+
+    assert scheduler["a.example.com"].interval == 300
+    assert scheduler["b.example.com"].interval == 60
+    assert scheduler.jitter == 0.2
+    assert scheduler.max_backoff == 600
+
+
+@pytest.mark.asyncio()
+async def test_fetch_records_retry_later(requests_mocker, config):
+    requests_mocker.get(
+        urljoin(SCALEWAY_API_BASE_URL, "dns-zones/host.name/records"),
+        status=429,
+        headers={"Retry-After": "120"},
+    )
+
+    upd = Updater(config)
+
+    with pytest.raises(RetryLaterException) as raised:
+        await upd.fetch_records("host.name")
+
+    assert raised.value.retry_after == 120
+    assert raised.value.message.startswith(
+        "Cannot retrieve records of zone `host.name`: 429 Client Error"
+    )
+
+
+@pytest.mark.asyncio()
+async def test_update_zone_retry_later(requests_mocker, config):
+    requests_mocker.patch(
+        urljoin(SCALEWAY_API_BASE_URL, "dns-zones/host.name/records"),
+        status=503,
+        headers={"Retry-After": "30"},
+    )
+
+    upd = Updater(config)
+
+    with pytest.raises(RetryLaterException) as raised:
+        await upd._update_zone("host.name", [])
+
+    assert raised.value.retry_after == 30
+
+
+@pytest.mark.asyncio()
+async def test_update_subset(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com", "c.example.org"]
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        side_effect=lambda info: ARecordInfo(info.name, info.domain, address="1.2.3.4"),
+    )
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+
+    upd = Updater(config)
+    result = await upd.update(["b.example.com"])
+
+    assert result.hostnames == ["b.example.com"]
+    assert result.unchanged == ["b.example.com"]
+    m_fetch.assert_awaited_once_with("example.com")
+
+
+@pytest.mark.asyncio()
+async def test_update_no_record(mocker, config):
     mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "fetch_records")
     mocker.patch.object(Updater, "discover_address", return_value="9.8.7.6")
     info = ARecordInfo.from_hostname(config.hostname)
-    info.address = "9.8.7.6"
-    m_add_record = mocker.patch.object(Updater, "add_record", return_value=info)
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
     m_notify = mocker.patch.object(Updater, "notify")
 
     upd = Updater(config)
-    upd.update()
+    await upd.update()
 
-    m_add_record.assert_called_once_with("9.8.7.6")
-    m_notify.assert_awaited_once_with("9.8.7.6")
+    m_update_zone.assert_called_once_with(
+        info.domain,
+        [Updater.add_change(info, "9.8.7.6")],
+    )
+    m_notify.assert_called_once_with(
+        config.hostname,
+        "9.8.7.6",
+        previous=None,
+        record_type="A",
+    )
 
 
-def test_update_no_change(mocker, caplog, config):
+@pytest.mark.asyncio()
+async def test_update_no_change(mocker, caplog, config):
     info = ARecordInfo.from_hostname(config.hostname)
     info.address = "9.8.7.6"
     mocker.patch.object(Updater, "get_record", return_value=info)
+    mocker.patch.object(Updater, "fetch_records")
     mocker.patch.object(Updater, "discover_address", return_value="9.8.7.6")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
 
     upd = Updater(config)
     with caplog.at_level(logging.INFO):
-        upd.update()
+        await upd.update()
 
     assert f"No IP change detected for {config.hostname}" in caplog.text
+    m_update_zone.assert_not_called()
 
 
-def test_update_change(mocker, config):
+@pytest.mark.asyncio()
+async def test_update_change(mocker, config):
     original = ARecordInfo.from_hostname(config.hostname)
     original.address = "9.8.7.6"
     mocker.patch.object(Updater, "get_record", return_value=original)
+    mocker.patch.object(Updater, "fetch_records")
     mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
-    new = ARecordInfo.from_hostname(config.hostname)
-    new.address = "1.2.3.4"
-    m_change_record = mocker.patch.object(Updater, "change_record", return_value=new)
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
     m_notify = mocker.patch.object(Updater, "notify")
 
     upd = Updater(config)
-    upd.update()
+    await upd.update()
 
-    m_change_record.assert_called_once_with("1.2.3.4")
-    m_notify.assert_awaited_once_with("1.2.3.4", previous="9.8.7.6")
+    m_update_zone.assert_called_once_with(
+        original.domain,
+        [Updater.set_change(original, "1.2.3.4")],
+    )
+    m_notify.assert_called_once_with(
+        config.hostname,
+        "1.2.3.4",
+        previous="9.8.7.6",
+        record_type="A",
+    )
 
 
 @pytest.mark.asyncio()
-async def test_notify_add(mocker, config):
-    m_bot = mocker.AsyncMock()
-    m_bot_ctxt = mocker.AsyncMock()
-    m_bot_ctxt.__aenter__.return_value = m_bot
-    m_bot_ctor = mocker.patch("sud.updater.telegram.Bot", return_value=m_bot_ctxt)
+async def test_update_multiple_zones(mocker, config):
+    config.hostnames = [
+        "a.example.com",
+        "b.example.com",
+        "c.example.com",
+        "d.example.org",
+    ]
+    a = ARecordInfo("a", "example.com", address="1.2.3.4")
+    b = ARecordInfo("b", "example.com", address="9.8.7.6")
+    d = ARecordInfo("d", "example.org", address="9.8.7.6")
+    records = {"a": a, "b": b, "c": None, "d": d}
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        side_effect=lambda info: records[info.name],
+    )
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+    m_notify = mocker.patch.object(Updater, "notify")
 
     upd = Updater(config)
+    await upd.update()
+
+    assert m_update_zone.call_count == 2
+    assert m_update_zone.mock_calls[0].args == (
+        "example.com",
+        [
+            Updater.set_change(ARecordInfo("b", "example.com"), "1.2.3.4"),
+            Updater.add_change(ARecordInfo("c", "example.com"), "1.2.3.4"),
+        ],
+    )
+    assert m_update_zone.mock_calls[1].args == (
+        "example.org",
+        [Updater.set_change(ARecordInfo("d", "example.org"), "1.2.3.4")],
+    )
+    assert m_notify.call_count == 3
 
-    msg = TG_CREATED_MSG.format(name=config.hostname, address="1.2.3.4")
 
-    await upd.notify("1.2.3.4")
+@pytest.mark.asyncio()
+async def test_update_listed_zones(mocker, config):
+    config.hostnames = ["a.example.co.uk", "b.example.co.uk", "c.example.org"]
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+    mocker.patch.object(Updater, "notify")
 
-    m_bot_ctor.assert_called_once_with(config.telegram.token)
-    m_bot.send_message.assert_awaited_once_with(
-        config.telegram.chat_id,
-        msg,
-        parse_mode=telegram.constants.ParseMode.HTML,
+    upd = Updater(config)
+    upd._zones = ZoneSuffixTrie(["example.co.uk"])
+    result = await upd.update()
+
+    # A single write for the zone, none for the host in no zone.
+    m_update_zone.assert_called_once_with(
+        "example.co.uk",
+        [
+            Updater.add_change(ARecordInfo("a", "example.co.uk"), "1.2.3.4"),
+            Updater.add_change(ARecordInfo("b", "example.co.uk"), "1.2.3.4"),
+        ],
     )
+    assert result.hostnames == ["a.example.co.uk", "b.example.co.uk", "c.example.org"]
+    assert result.changed == ["a.example.co.uk", "b.example.co.uk"]
+    assert list(result.failed) == ["c.example.org"]
 
 
 @pytest.mark.asyncio()
-async def test_notify_change(mocker, config):
-    m_bot = mocker.AsyncMock()
-    m_bot_ctxt = mocker.AsyncMock()
-    m_bot_ctxt.__aenter__.return_value = m_bot
-    m_bot_ctor = mocker.patch("sud.updater.telegram.Bot", return_value=m_bot_ctxt)
+async def test_update_zone_failure(mocker, caplog, config):
+    config.hostnames = ["a.example.com", "b.example.org"]
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(
+        Updater,
+        "_update_zone",
+        side_effect=[SudException("boom"), []],
+    )
+    mocker.patch.object(Updater, "notify")
 
     upd = Updater(config)
+    result = await upd.update()
 
-    msg = TG_UPDATED_MSG.format(
-        name=config.hostname, address="1.2.3.4", previous="5.6.7.8"
+    assert list(result.failed) == ["a.example.com"]
+    assert result.failed["a.example.com"].message == "boom"
+    assert result.changed == ["b.example.org"]
+    assert result.unchanged == []
+    assert m_update_zone.call_count == 2
+    assert "Error while updating zone example.com: boom" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_update_rejected_records(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com", "c.example.com"]
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+
+    async def update_zone(domain, changes):
+        names = [change["add"]["records"][0]["name"] for change in changes]
+        if "b.example.com." in names:
+            raise APIException("Invalid record", 400)
+
+    m_update_zone = mocker.patch.object(
+        Updater,
+        "_update_zone",
+        new=mocker.AsyncMock(side_effect=update_zone),
+    )
+    m_notify = mocker.patch.object(Updater, "notify")
+
+    upd = Updater(config)
+    result = await upd.update()
+
+    # [a, b, c] is rejected, then [a] is written, [b, c] rejected and split.
+    assert m_update_zone.await_count == 5
+    assert result.changed == ["a.example.com", "c.example.com"]
+    assert list(result.failed) == ["b.example.com"]
+    assert result.failed["b.example.com"].message == "Invalid record"
+    assert upd._state.get_address("b.example.com") is None
+    assert upd._state.get_address("c.example.com") == "1.2.3.4"
+    assert m_notify.call_count == 2
+
+
+@pytest.mark.asyncio()
+async def test_update_all_records_rejected(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com"]
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    mocker.patch.object(
+        Updater,
+        "_update_zone",
+        side_effect=APIException("Invalid record", 400),
+    )
+
+    result = await Updater(config).update()
+
+    assert result.status == "failed"
+    assert {str(error) for error in result.failed.values()} == {"Invalid record"}
+
+
+@pytest.mark.asyncio()
+async def test_update_cached_no_change(mocker, config):
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+
+    upd = Updater(config)
+    upd._state.set_address(config.hostname, "1.2.3.4")
+    upd._state.mark_reconciled(config.hostname)
+    await upd.update()
+
+    m_fetch.assert_not_called()
+    m_update_zone.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_update_cached_change(mocker, config):
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+    m_notify = mocker.patch.object(Updater, "notify")
+    info = ARecordInfo.from_hostname(config.hostname)
+
+    upd = Updater(config)
+    upd._state.set_address(config.hostname, "9.8.7.6")
+    upd._state.mark_reconciled(config.hostname)
+    await upd.update()
+
+    m_fetch.assert_not_called()
+    m_update_zone.assert_called_once_with(
+        info.domain,
+        [Updater.set_change(info, "1.2.3.4")],
+    )
+    m_notify.assert_called_once_with(
+        config.hostname,
+        "1.2.3.4",
+        previous="9.8.7.6",
+        record_type="A",
+    )
+    assert upd._state.get_address(config.hostname) == "1.2.3.4"
+
+
+@pytest.mark.asyncio()
+async def test_update_cache_miss(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com"]
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        return_value=ARecordInfo("a", "example.com", address="1.2.3.4"),
+    )
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    mocker.patch.object(Updater, "_update_zone")
+
+    upd = Updater(config)
+    upd._state.set_address("a.example.com", "1.2.3.4")
+    upd._state.mark_reconciled("a.example.com")
+    await upd.update()
+
+    m_fetch.assert_called_once_with("example.com")
+    assert upd._state.get_address("b.example.com") == "1.2.3.4"
+
+
+@pytest.mark.asyncio()
+async def test_update_reconcile_per_host(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com"]
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        side_effect=lambda info: ARecordInfo(info.name, info.domain, address="1.2.3.4"),
+    )
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+
+    upd = Updater(config)
+    for hostname in config.hostnames:
+        upd._state.set_address(hostname, "1.2.3.4")
+    upd._state.mark_reconciled("a.example.com")
+
+    # Checked in different cycles: only b is due for a reconciliation.
+    await upd.update(["a.example.com"])
+    m_fetch.assert_not_called()
+    await upd.update(["b.example.com"])
+    m_fetch.assert_called_once_with("example.com")
+    await upd.update(["b.example.com"])
+    m_fetch.assert_called_once()
+
+
+@pytest.mark.asyncio()
+async def test_update_reconcile(mocker, config):
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+    mocker.patch.object(Updater, "notify")
+    m_store = mocker.patch.object(State, "store")
+
+    upd = Updater(config)
+    upd._state.set_address(config.hostname, "1.2.3.4")
+    assert upd._state.get_reconciled_at(config.hostname) is None
+
+    await upd.update()
+
+    m_fetch.assert_called_once()
+    m_update_zone.assert_called_once()
+    m_store.assert_called_once()
+    assert upd._state.get_reconciled_at(config.hostname) is not None
+
+
+@pytest.mark.asyncio()
+async def test_update_forced_reconcile(mocker, config):
+    m_fetch = mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        return_value=ARecordInfo("my", "host.name", address="1.2.3.4"),
     )
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+
+    upd = Updater(config)
+    upd._state.set_address(config.hostname, "1.2.3.4")
+    upd._state.mark_reconciled(config.hostname)
+    await upd.update(reconcile=True)
+
+    m_fetch.assert_called_once_with("host.name")
 
-    await upd.notify("1.2.3.4", previous="5.6.7.8")
 
-    m_bot_ctor.assert_called_once_with(config.telegram.token)
-    m_bot.send_message.assert_awaited_once_with(
-        config.telegram.chat_id,
-        msg,
-        parse_mode=telegram.constants.ParseMode.HTML,
+@pytest.mark.asyncio()
+async def test_update_error_invalidates_state(mocker, config):
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    mocker.patch.object(
+        Updater,
+        "_update_zone",
+        side_effect=SudException("boom"),
     )
 
+    upd = Updater(config)
+    upd._state.set_address(config.hostname, "9.8.7.6")
+    upd._state.mark_reconciled(config.hostname)
+
+    result = await upd.update()
+
+    assert list(result.failed) == [config.hostname]
+    assert upd._state.get_address(config.hostname) is None
+    assert upd._state.get_reconciled_at(config.hostname) is None
+
 
 @pytest.mark.asyncio()
-async def test_notify_no_config(mocker, config_file_factory):
+async def test_update_overlaps_discovery_and_lookup(mocker, config):
+    fetched = asyncio.Event()
+
+    async def discover(self, record_type):
+        # Fails with a timeout if the zone lookup is not running concurrently.
+        await asyncio.wait_for(fetched.wait(), 1)
+        return "1.2.3.4"
+
+    async def fetch(self, domain):
+        fetched.set()
+
+    mocker.patch.object(Updater, "discover_address", discover)
+    mocker.patch.object(Updater, "fetch_records", fetch)
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        return_value=ARecordInfo("my", "host.name", address="1.2.3.4"),
+    )
+
+    upd = Updater(config)
+    await upd.update()
+
+    assert upd._state.get_address(config.hostname) == "1.2.3.4"
+
+
+@pytest.mark.asyncio()
+async def test_update_discovery_error(mocker, config):
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(
+        Updater,
+        "discover_address",
+        side_effect=SudException("no address"),
+    )
+    m_update_zone = mocker.patch.object(Updater, "update_zone")
+
+    upd = Updater(config)
+    with pytest.raises(SudException) as raised:
+        await upd.update()
+
+    assert raised.value.message == "no address"
+    m_update_zone.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_update_dual_stack(mocker, config):
+    config._config["record_types"] = ["A", "AAAA"]
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(
+        Updater,
+        "get_record",
+        side_effect=lambda info: ARecordInfo(
+            info.name,
+            info.domain,
+            address="9.8.7.6" if info.record_type == "A" else "2001:db8::9",
+            record_type=info.record_type,
+        ),
+    )
+    m_discover = mocker.patch.object(
+        Updater,
+        "discover_address",
+        side_effect=lambda record_type: {"A": "1.2.3.4", "AAAA": "2001:db8::1"}[
+            record_type
+        ],
+    )
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+    m_notify = mocker.patch.object(Updater, "notify")
+
+    upd = Updater(config)
+    result = await upd.update()
+
+    assert result.changed == [config.hostname]
+    assert sorted(call.args[0] for call in m_discover.mock_calls) == ["A", "AAAA"]
+    # A and AAAA changes go out in the same PATCH.
+    m_update_zone.assert_called_once_with(
+        "host.name",
+        [
+            Updater.set_change(ARecordInfo("my", "host.name"), "1.2.3.4"),
+            Updater.set_change(
+                ARecordInfo("my", "host.name", record_type="AAAA"),
+                "2001:db8::1",
+            ),
+        ],
+    )
+    assert m_notify.call_count == 2
+    assert upd._state.get_address(config.hostname, "AAAA") == "2001:db8::1"
+
+
+@pytest.mark.asyncio()
+async def test_update_ipv6_discovery_error(mocker, caplog, config):
+    config._config["hostnames"] = [
+        {"name": "a.example.com", "record_types": ["A", "AAAA"]},
+        {"name": "b.example.com", "record_types": ["AAAA"]},
+        "c.example.com",
+    ]
+    error = SudException("no IPv6")
+
+    async def discover(self, record_type):
+        if record_type == "AAAA":
+            raise error
+        return "1.2.3.4"
+
+    mocker.patch.object(Updater, "discover_address", discover)
+    mocker.patch.object(Updater, "fetch_records")
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+
+    upd = Updater(config)
+    with caplog.at_level(logging.ERROR):
+        result = await upd.update()
+
+    assert result.changed == ["a.example.com", "c.example.com"]
+    assert result.failed == {"a.example.com": error, "b.example.com": error}
+    assert result.status == "partial"
+    assert [
+        change["add"]["records"][0]["type"]
+        for change in m_update_zone.mock_calls[0].args[1]
+    ] == ["A", "A"]
+    assert "Error while discovering the AAAA address: no IPv6" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_update_dual_stack_discovery_error(mocker, config):
+    config._config["record_types"] = ["A", "AAAA"]
+    mocker.patch.object(
+        Updater,
+        "discover_address",
+        side_effect=SudException("offline"),
+    )
+    mocker.patch.object(Updater, "fetch_records")
+
+    with pytest.raises(SudException) as raised:
+        await Updater(config).update()
+
+    assert raised.value.message == "offline"
+
+
+@pytest.mark.asyncio()
+async def test_update_fetch_error(mocker, caplog, config):
+    config.hostnames = ["a.example.com", "b.example.org"]
+    mocker.patch.object(
+        Updater,
+        "fetch_records",
+        side_effect=[SudException("boom"), None],
+    )
+    mocker.patch.object(Updater, "get_record", return_value=None)
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+    m_update_zone = mocker.patch.object(Updater, "_update_zone")
+    mocker.patch.object(Updater, "notify")
+
+    upd = Updater(config)
+    result = await upd.update()
+
+    assert list(result.failed) == ["a.example.com"]
+    assert result.changed == ["b.example.org"]
+    m_update_zone.assert_awaited_once()
+    assert m_update_zone.mock_calls[0].args[0] == "example.org"
+    assert "Error while updating zone example.com: boom" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_update_unexpected_error(mocker, config):
+    mocker.patch.object(Updater, "fetch_records", side_effect=ValueError("bug"))
+    mocker.patch.object(Updater, "discover_address", return_value="1.2.3.4")
+
+    upd = Updater(config)
+    with pytest.raises(ValueError):
+        await upd.update()
+
+
+@pytest.mark.asyncio()
+async def test_request_concurrency_limit(mocker, config):
+    config._config["concurrency"] = 2
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def request(method, url, **kwargs):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return method
+
+    upd = Updater(config)
+    mocker.patch.object(upd._session, "request", side_effect=request)
+
+    results = await asyncio.gather(
+        *(upd._request("GET", "https://example.com/") for _ in range(6)),
+    )
+
+    assert results == ["GET"] * 6
+    assert max_running == 2
+
+
+@pytest.mark.asyncio()
+async def test_sleep_timeout(config):
+    upd = Updater(config)
+
+    start = time.monotonic()
+    assert await upd.sleep(0.05) is False
+
+    assert time.monotonic() - start >= 0.05
+
+
+@pytest.mark.asyncio()
+async def test_sleep_wakeup(caplog, config):
+    upd = Updater(config)
+    asyncio.get_running_loop().call_later(0.01, upd.wakeup)
+
+    start = time.monotonic()
+    with caplog.at_level(logging.INFO):
+        assert await upd.sleep(10) is True
+
+    assert time.monotonic() - start < 1
+    assert "Network change detected, checking now" in caplog.text
+    assert not upd._wakeup.is_set()
+
+
+def test_start_monitor_disabled(mocker, config):
+    m_monitor = mocker.patch("sud.updater.NetlinkMonitor")
+
+    assert Updater(config).start_monitor() is None
+    m_monitor.assert_not_called()
+
+
+def test_start_monitor(mocker, config):
+    config._config["watch"] = {"enabled": True, "debounce": 5}
+    m_monitor = mocker.patch("sud.updater.NetlinkMonitor")
+
+    upd = Updater(config)
+
+    assert upd.start_monitor() is m_monitor.return_value
+    m_monitor.assert_called_once_with(upd.wakeup, debounce=5.0)
+    m_monitor.return_value.start.assert_called_once()
+
+
+def test_start_monitor_error(mocker, caplog, config):
+    config._config["watch"] = {"enabled": True}
+    m_monitor = mocker.patch("sud.updater.NetlinkMonitor")
+    m_monitor.return_value.start.side_effect = SudException("not supported")
+
+    assert Updater(config).start_monitor() is None
+    assert "not supported, falling back to polling only" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_run_forever_stops_monitor(mocker, config):
+    monitor = mocker.MagicMock()
+    mocker.patch.object(Updater, "start_monitor", return_value=monitor)
+    mocker.patch.object(Updater, "update", side_effect=asyncio.CancelledError())
+
+    with pytest.raises(asyncio.CancelledError):
+        await Updater(config).run_forever()
+
+    monitor.stop.assert_called_once()
+
+
+def test_store_state_error(mocker, caplog, config):
+    mocker.patch.object(State, "store", side_effect=SudException("cannot store"))
+
+    upd = Updater(config)
+    with caplog.at_level(logging.WARNING):
+        upd.store_state()
+
+    assert caplog.records[0].levelname == "WARNING"
+    assert caplog.records[0].message == "cannot store"
+
+
+def test_notify(mocker, config):
+    upd = Updater(config)
+    m_put = mocker.patch.object(upd._notifications, "put")
+
+    upd.notify(config.hostname, "1.2.3.4", previous="5.6.7.8")
+
+    m_put.assert_called_once_with(
+        Notification(config.hostname, "1.2.3.4", "5.6.7.8"),
+    )
+
+
+def test_notify_no_config(mocker, config_file_factory):
     c = Config(mocker.MagicMock())
     c._config = config_file_factory()
-    m_bot_ctor = mocker.patch("sud.updater.telegram.Bot")
 
     upd = Updater(c)
+    assert upd._notifications is None
+    upd.notify(c.hostname, "1.2.3.4")
+
+
+@pytest.mark.asyncio()
+async def test_run_forever_notifications(mocker, config):
+    m_start = mocker.patch("sud.updater.NotificationDispatcher.start")
+    m_close = mocker.patch("sud.updater.NotificationDispatcher.close")
+    mocker.patch.object(Updater, "update", side_effect=RuntimeError("stop"))
+
+    upd = Updater(config)
+    with pytest.raises(RuntimeError):
+        await upd.run_forever()
+
+    m_start.assert_awaited_once()
+    m_close.assert_awaited_once_with(config.timeouts.notify)
+
+
+@pytest.mark.asyncio()
+async def test_request_timeout(mocker, config):
+    config._config["timeouts"] = {"connect": 3, "read": 10}
+    m_request = mocker.patch("requests.Session.request")
+
+    upd = Updater(config)
+    await upd._request("GET", "https://example.com/")
+    m_request.assert_called_once_with("GET", "https://example.com/", timeout=(3, 10))
+
+    m_request.reset_mock()
+    with deadline(1):
+        await upd._request("GET", "https://example.com/")
+    connect, read = m_request.mock_calls[0].kwargs["timeout"]
+    assert 0.9 < connect <= 1
+    assert 0.9 < read <= 1
+
+
+@pytest.mark.asyncio()
+async def test_run_cycle_overrun(mocker, caplog, config):
+    config._config["timeouts"] = {"cycle": 0.05}
+    config._config["schedule"] = {"jitter": 0}
+
+    async def stuck(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(Updater, "update", side_effect=stuck)
+
+    upd = Updater(config)
+    scheduler = upd.create_scheduler()
+    start = time.monotonic()
+    result = await upd.run_cycle(scheduler, scheduler.pop_due(time.monotonic()))
+
+    assert time.monotonic() - start < 1
+    assert isinstance(result.failed[config.hostname], DeadlineExceeded)
+    assert (
+        "Error while updating: The cycle phase exceeded its budget of 0.05s"
+        in caplog.text
+    )
+    assert scheduler[config.hostname].failures == 1
+
+
+@pytest.mark.asyncio()
+async def test_update_discovery_timeout(mocker, config):
+    config._config["timeouts"] = {"discovery": 0.05}
+
+    async def stuck(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(Updater, "discover_address", side_effect=stuck)
+    mocker.patch.object(Updater, "fetch_records")
+
+    upd = Updater(config)
+    with pytest.raises(DeadlineExceeded) as raised:
+        await upd.update()
+
+    assert raised.value.message == "The discovery phase exceeded its budget of 0.05s"
+
+
+@pytest.mark.asyncio()
+async def test_run_cycle_metrics(mocker, config):
+    config.hostnames = ["a.example.com", "b.example.com", "c.example.org"]
+    config._config["schedule"] = {"jitter": 0}
+    mocker.patch("sud.updater.time.monotonic", return_value=1000.0)
+    mocker.patch("sud.updater.time.time", return_value=1700000000.0)
+    error = RetryLaterException("slow down", 900, status=429)
+    result = CycleResult(
+        ["a.example.com", "b.example.com", "c.example.org"],
+        changed=["a.example.com"],
+        failed={"c.example.org": error},
+    )
+    mocker.patch.object(Updater, "update", return_value=result)
+
+    upd = Updater(config)
+    scheduler = upd.create_scheduler()
+    await upd.run_cycle(scheduler, scheduler.pop_due(1000.0))
+
+    metrics = upd._metrics
+    assert metrics.cycles.get(result="failure") == 1
+    assert metrics.changes.get(hostname="a.example.com") == 1
+    assert metrics.changes.get(hostname="b.example.com") == 0
+    assert metrics.last_success.get(hostname="b.example.com") == 1700000000.0
+    assert metrics.last_success.get(hostname="c.example.org") == 0
+    assert metrics.errors.get(type="RetryLaterException", status=429) == 1
+    assert metrics.failures.get(hostname="c.example.org") == 1
+    assert metrics.next_check.get(hostname="c.example.org") == 900
+    assert metrics.next_check.get(hostname="a.example.com") == 60
+
+
+@pytest.mark.asyncio()
+async def test_run_cycle_metrics_error(mocker, config):
+    mocker.patch.object(Updater, "update", side_effect=SudException("no ip"))
+
+    upd = Updater(config)
+    scheduler = upd.create_scheduler()
+    await upd.run_cycle(scheduler, scheduler.pop_due(time.monotonic()))
+
+    assert upd._metrics.cycles.get(result="failure") == 1
+    assert upd._metrics.errors.get(type="SudException", status="") == 1
+
+
+@pytest.mark.asyncio()
+async def test_discover_address_metrics(mocker, config):
+    upd = Updater(config)
+    mocker.patch.object(upd._discoverers["A"], "discover", return_value="1.2.3.4")
+    await upd.discover_address()
+
+    assert upd._metrics.phase_seconds.get(phase="discovery") == 1
+
+
+@pytest.mark.asyncio()
+async def test_api_exception_status(requests_mocker, config):
+    requests_mocker.get(
+        urljoin(SCALEWAY_API_BASE_URL, "dns-zones/host.name/records"),
+        status=403,
+    )
+
+    upd = Updater(config)
+    with pytest.raises(APIException) as raised:
+        await upd.fetch_records("host.name")
+
+    assert raised.value.status == 403
+    assert upd._metrics.phase_seconds.get(phase="lookup") == 1
+
 
-    await upd.notify("1.2.3.4")
+@pytest.mark.asyncio()
+async def test_start_metrics_server(mocker, caplog, config):
+    upd = Updater(config)
+    assert await upd.start_metrics_server() is None
+
+    config._config["metrics"] = {"enabled": True, "port": 0}
+    server = await upd.start_metrics_server()
+    assert server.port != 0
+    await server.stop()
 
-    m_bot_ctor.assert_not_called()
+    mocker.patch("sud.updater.MetricsServer.start", side_effect=OSError("in use"))
+    assert await upd.start_metrics_server() is None
+    assert "Cannot serve metrics: in use" in caplog.text
+
+
+@pytest.mark.asyncio()
+async def test_run_forever_tracing(mocker, tmp_path, config):
+    trace_file = tmp_path / "trace.jsonl"
+    config._config["tracing"] = {"enabled": True, "path": str(trace_file)}
+    mocker.patch.object(Updater, "update", return_value=CycleResult([]))
+    mocker.patch.object(
+        Updater,
+        "sleep",
+        side_effect=[False, asyncio.CancelledError()],
+    )
+
+    upd = Updater(config)
+    with pytest.raises(asyncio.CancelledError):
+        await upd.run_forever()
+
+    assert get_tracer() is None
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [s["name"] for s in spans] == ["cycle", "sleep", "sleep"]
+    assert spans[0]["attributes"] == {"hostnames": [config.hostname]}
+    assert spans[2]["error"] == "CancelledError: "
+
+
+@pytest.mark.asyncio()
+async def test_request_span(mocker, config):
+    exporter = ListExporter()
+    set_tracer(Tracer(exporter))
+    mocker.patch(
+        "requests.Session.request", return_value=mocker.MagicMock(status_code=200)
+    )
+    try:
+        await Updater(config)._request("GET", "https://example.com/")
+    finally:
+        set_tracer(None)
+
+    assert exporter.spans[0].name == "request"
+    assert exporter.spans[0].attributes == {
+        "method": "GET",
+        "url": "https://example.com/",
+        "status": 200,
+    }
@@ -0,0 +1,221 @@
+import asyncio
+
+import pytest
+
+from sud.exceptions import APIException, SudException
+from sud.records import ARecordInfo
+from sud.writer import ZoneWriter
+
+
+def _write(name, address="1.2.3.4", domain="example.com", previous=None):
+    return (ARecordInfo(name, domain), address, previous)
+
+
+def _names(writes):
+    return [info.name for info, *_ in writes]
+
+
+@pytest.mark.asyncio()
+async def test_write_merges_queued_writes():
+    batches = []
+    release = asyncio.Event()
+
+    async def send(domain, writes):
+        batches.append((domain, [(info.name, address) for info, address, _ in writes]))
+        await release.wait()
+
+    writer = ZoneWriter(send, max_zones=1)
+    first = asyncio.create_task(writer.write("example.com", [_write("a")]))
+    await asyncio.sleep(0)
+    # Queued while the first write is in flight: sent together, in order.
+    others = [
+        asyncio.create_task(writer.write("example.com", [write]))
+        for write in (
+            _write("b", "2.2.2.2", previous="1.1.1.1"),
+            _write("c", "3.3.3.3"),
+            _write("b", "4.4.4.4", previous="2.2.2.2"),
+        )
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(first, *others)
+
+    assert results == [[None]] * 4
+    assert batches == [
+        ("example.com", [("a", "1.2.3.4")]),
+        ("example.com", [("b", "4.4.4.4"), ("c", "3.3.3.3")]),
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_write_merged_keeps_previous():
+    sent = []
+
+    async def send(domain, writes):
+        sent.extend(writes)
+
+    writer = ZoneWriter(send, max_zones=1)
+    await asyncio.gather(
+        writer.write("example.com", [_write("a", "2.2.2.2")]),
+        writer.write("example.com", [_write("a", "3.3.3.3", previous="2.2.2.2")]),
+    )
+
+    # The record did not exist: it is added with the latest address.
+    assert sent == [_write("a", "3.3.3.3")]
+
+
+@pytest.mark.asyncio()
+async def test_write_in_flight_record():
+    batches = []
+    release = asyncio.Event()
+
+    async def send(domain, writes):
+        batches.append(writes)
+        await release.wait()
+
+    writer = ZoneWriter(send, max_zones=1)
+    first = asyncio.create_task(writer.write("example.com", [_write("a")]))
+    await asyncio.sleep(0)
+    # Read before the record was added: modified from the in-flight address.
+    second = asyncio.create_task(writer.write("example.com", [_write("a", "2.2.2.2")]))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(first, second) == [[None], [None]]
+    assert batches == [[_write("a")], [_write("a", "2.2.2.2", previous="1.2.3.4")]]
+
+
+@pytest.mark.asyncio()
+async def test_write_in_flight_record_failed():
+    batches = []
+    release = asyncio.Event()
+    error = APIException("Server error", 500)
+
+    async def send(domain, writes):
+        batches.append(writes)
+        await release.wait()
+        if len(batches) == 1:
+            raise error
+
+    writer = ZoneWriter(send, max_zones=1)
+    first = asyncio.create_task(writer.write("example.com", [_write("a")]))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(writer.write("example.com", [_write("a", "2.2.2.2")]))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(first, second) == [[error], [None]]
+    # The record was not added: it still has to be.
+    assert batches[1] == [_write("a", "2.2.2.2")]
+
+
+@pytest.mark.asyncio()
+async def test_write_zones_in_parallel():
+    running = 0
+    peak = 0
+
+    async def send(domain, writes):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    writer = ZoneWriter(send, max_zones=2)
+    await asyncio.gather(
+        *(
+            writer.write(f"zone{i}.test", [_write("a", domain=f"zone{i}.test")])
+            for i in range(5)
+        ),
+    )
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio()
+async def test_write_splits_rejected_batches():
+    batches = []
+
+    async def send(domain, writes):
+        batches.append(_names(writes))
+        if "bad" in _names(writes):
+            raise APIException("Invalid record", 400)
+
+    writer = ZoneWriter(send, max_zones=1)
+    results = await writer.write(
+        "example.com",
+        [_write(name) for name in ("a", "b", "bad", "c", "d")],
+    )
+
+    assert [str(error) if error else None for error in results] == [
+        None,
+        None,
+        "Invalid record",
+        None,
+        None,
+    ]
+    assert batches == [
+        ["a", "b", "bad", "c", "d"],
+        ["a", "b"],
+        ["bad", "c", "d"],
+        ["bad"],
+        ["c", "d"],
+    ]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [APIException("Server error", 500), SudException("Timeout")],
+)
+@pytest.mark.asyncio()
+async def test_write_error(error):
+    calls = 0
+
+    async def send(domain, writes):
+        nonlocal calls
+        calls += 1
+        raise error
+
+    writer = ZoneWriter(send, max_zones=1)
+    results = await writer.write("example.com", [_write("a"), _write("b")])
+
+    assert results == [error, error]
+    assert calls == 1
+
+
+@pytest.mark.asyncio()
+async def test_write_unexpected_error():
+    async def send(domain, writes):
+        raise ValueError("bug")
+
+    writer = ZoneWriter(send, max_zones=1)
+
+    with pytest.raises(ValueError, match="bug"):
+        await writer.write("example.com", [_write("a")])
+
+
+def test_write_cancelled_on_exit():
+    futures = []
+
+    async def send(domain, writes):
+        await asyncio.sleep(10)
+
+    async def main():
+        writer = ZoneWriter(send, max_zones=1)
+        queue = writer._queue
+
+        def capture(domain, write):
+            futures.append(queue(domain, write))
+            return futures[-1]
+
+        writer._queue = capture
+        for name in ("a", "b"):
+            # In flight, then queued.
+            asyncio.create_task(writer.write("example.com", [_write(name)]))
+            await asyncio.sleep(0)
+
+    # The pending tasks are cancelled when the loop stops.
+    asyncio.run(main())
+
+    assert len(futures) == 2
+    assert all(future.cancelled() for future in futures)